@@ -8,11 +8,16 @@ from PySide6.QtWidgets import (
     QProgressBar, QScrollArea, QSizePolicy, QGraphicsOpacityEffect
 )
 from PySide6.QtGui import QFont, QColor, QIcon, QCursor
-from PySide6.QtCore import Qt, QSize, QThread, Signal, Slot, Property, QPropertyAnimation, QEasingCurve
+from PySide6.QtCore import Qt, QSize, QThread, QTimer, Signal, Slot, Property, QPropertyAnimation, QEasingCurve
 
 # Import our backend
-from .Functionality.FetchAppleImages import FetchAppleImages
+from .Functionality.FetchAppleImages import FetchAppleImages, filter_images_for_target
+from .Functionality.FetchRecoveryImages import FetchRecoveryImages, MLB_ZERO
+from .Functionality.Scripts.smbios import SMBIOS, BOARD_IDS
 from .Functionality.DownloadManager import DownloadManager, DownloadWorker
+from .Functionality.DownloadCore import check_disk_space, format_size, get_free_space, ELSEWHERE
+from .Functionality.ImageVerifier import LibraryVerifier, library_paths
+from .Functionality.XarArchive import DEFAULT_PATTERNS
 
 class LoadingOverlay(QWidget):
     def __init__(self, parent=None):
@@ -70,7 +75,8 @@ class FetchWorker(QThread):
         try:
             # We pass self.emit_status as the callback
             fetcher = FetchAppleImages(verbose=True, use_cache=True, status_callback=self.emit_status)
-            self.data_ready.emit(fetcher.apple_images)
+            recovery = FetchRecoveryImages(verbose=True, status_callback=self.emit_status)
+            self.data_ready.emit(fetcher.apple_images + recovery.recovery_images)
         except Exception as e:
             self.status_update.emit(f"Error: {e}")
             self.data_ready.emit([]) # Return empty on error
@@ -78,6 +84,41 @@ class FetchWorker(QThread):
     def emit_status(self, text):
         self.status_update.emit(str(text))
 
+class VerifyWorker(QThread):
+    progress = Signal(int) # pct
+    done = Signal(list) # result dicts, see LibraryVerifier.verify
+    failed = Signal(str)
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.verifier = LibraryVerifier()
+
+    def run(self):
+        try:
+            results = self.verifier.verify(self.paths, progress=lambda done, total, path: self.progress.emit(done * 100 // max(total, 1)))
+            self.done.emit(results)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class ResolveWorker(QThread):
+    resolved = Signal(dict) # the image with fresh url/headers/chunklist
+    failed = Signal(str)
+
+    def __init__(self, image, parent=None):
+        super().__init__(parent)
+        self.image = dict(image)
+
+    def run(self):
+        # Round trip to osrecovery.apple.com, kept off the GUI thread
+        try:
+            FetchRecoveryImages().resolve(self.image)
+            self.resolved.emit(self.image)
+        except Exception as e:
+            self.failed.emit(str(e))
+
+FRAME_MS = 33 # Progress repaints are coalesced to at most one per frame per item
+
 # ... (DownloadItemWidget remains mostly same, including it here for completeness)
 class DownloadItemWidget(QFrame):
     selected = Signal(str, str) # name, path
@@ -92,6 +133,7 @@ class DownloadItemWidget(QFrame):
         
         self.download_name = name # Store name
         self.download_path = "" # Store path
+        self.pending_progress = None # Latest progress, painted on the next frame
         
         layout = QVBoxLayout(self)
         
@@ -149,7 +191,15 @@ class DownloadItemWidget(QFrame):
         bot_row.addWidget(self.btn_select)
         layout.addLayout(bot_row)
         
-        # Connect Signals
+        # Setup Animation
+        self.anim_effect = QGraphicsOpacityEffect(self)
+        self.anim_effect.setOpacity(1.0)
+        self.setGraphicsEffect(self.anim_effect)
+        
+        self.anim = QPropertyAnimation(self.anim_effect, b"opacity")
+        self.anim.setDuration(1000)
+        self.anim.setEasingCurve(QEasingCurve.OutQuad)
+        
         # Connect Signals
         if self.worker:
             self._connect_signals()
@@ -159,15 +209,6 @@ class DownloadItemWidget(QFrame):
             self.btn_pause.setText("▶")
             self.is_paused = True
             
-            # Setup Animation
-            self.anim_effect = QGraphicsOpacityEffect(self)
-            self.anim_effect.setOpacity(1.0)
-            self.setGraphicsEffect(self.anim_effect)
-            
-            self.anim = QPropertyAnimation(self.anim_effect, b"opacity")
-            self.anim.setDuration(1000)
-            self.anim.setEasingCurve(QEasingCurve.OutQuad)
-            
             # Try to get saved progress
             # We can't get it easily without worker, but we can display "Resumable"
             self.lbl_speed.setText("Ready to Resume")
@@ -176,12 +217,29 @@ class DownloadItemWidget(QFrame):
         
         self.is_paused = False
 
-    def on_progress(self, pct, speed, dl, total):
+    def on_progress(self, pct, speed, dl, total, eta=""):
+        # Only keep the newest values; one repaint per frame no matter how many arrive
+        first = self.pending_progress is None
+        self.pending_progress = (pct, speed, dl, total, eta)
+        if first:
+            QTimer.singleShot(FRAME_MS, self.apply_progress)
+
+    def apply_progress(self):
+        if self.pending_progress is None: return
+        pct, speed, dl, total, eta = self.pending_progress
+        self.pending_progress = None
+        
         self.pbar.setValue(pct)
-        self.lbl_speed.setText(f"{speed} • {dl//(1024*1024)}MB / {total//(1024*1024)}MB")
+        text = f"{speed} • {dl//(1024*1024)}MB / {total//(1024*1024)}MB"
+        if eta:
+            text = f"{text} • {eta}"
+        self.lbl_speed.setText(text)
     
     def on_status(self, status):
         self.lbl_status.setText(status)
+        # The GUI and the daemon never run one task together; the one not running it just watches
+        self.btn_pause.setEnabled(status != ELSEWHERE)
+        self.btn_cancel.setEnabled(status != ELSEWHERE)
         if status == "Paused":
             self.btn_pause.setText("▶")
             self.btn_pause.setToolTip("Resume Download")
@@ -191,6 +249,7 @@ class DownloadItemWidget(QFrame):
             self.btn_pause.setToolTip("Pause Download")
             self.is_paused = False
         if status == "Finished":
+            self.pending_progress = None # Don't let a late frame overwrite "Download Complete"
             self.pbar.setVisible(False) # Hide bar
             self.btn_pause.setVisible(False)
             self.btn_cancel.setVisible(True)
@@ -231,10 +290,28 @@ class DownloadItemWidget(QFrame):
             self.btn_cancel.setToolTip("Cancel and Delete")
         if status == "Pending":
             self.lbl_status.setText("Pending...")
+        elif status == "Queued":
+            self.lbl_status.setText("Queued")
+            self.lbl_speed.setText("Waiting for a free slot")
+            self.btn_pause.setText("⏸")
+            self.btn_pause.setToolTip("Pause Download")
+            self.is_paused = False
+        elif status == ELSEWHERE:
+            self.lbl_speed.setText("Downloading in another Hackintoshify process")
 
     def on_finished(self):
-        self.lbl_status.setText("Success")
         self.pbar.setValue(100)
+        job = self.worker.job if self.worker else None
+        if job and job.extract_error:
+            self.show_extract_error(job.extract_error)
+            return
+        self.lbl_status.setText("Success")
+
+    def show_extract_error(self, err):
+        # The download is good, only the files inside didn't come out
+        self.lbl_status.setText("Downloaded, extraction failed")
+        self.lbl_status.setToolTip(str(err))
+        self.lbl_status.setStyleSheet("color: #f59e0b; background: transparent;")
     
     def on_error(self, err):
         self.lbl_status.setText(f"Error: {err}")
@@ -247,23 +324,10 @@ class DownloadItemWidget(QFrame):
         self.is_paused = True 
 
     def toggle_pause(self):
-        # We need to find the task in manager to resume it property
-        # Since Widget has ref to worker, check if worker is running
+        # Find our task in the manager; the worker changes every time the scheduler restarts it
         parent_screen = self.window()
         if hasattr(parent_screen, 'manager'):
-             # Find task by worker/url path
-             task = None
-             for t in parent_screen.manager.downloads:
-                 # If worker is None (loaded from disk), match by name/path?
-                 # Or if worker matches
-                 if t['worker'] == self.worker:
-                     task = t
-                     break
-                 # Fallback for restored tasks where self.worker is None initially?
-                 # Actually we pass a worker to this widget.
-                 # If restored, we might pass a Dummy worker or None? 
-                 # We need to handle restored task -> Widget binding better.
-             
+             task = parent_screen.manager.find_task(self.download_path)
              if not task: 
                  # Maybe matched by name?
                  for t in parent_screen.manager.downloads:
@@ -273,14 +337,17 @@ class DownloadItemWidget(QFrame):
             
              if task:
                  if self.is_paused:
-                     # Resume
-                     new_worker = parent_screen.manager.resume_download(task)
-                     # We must re-bind signals to the new worker!
-                     self.worker = new_worker
-                     self._connect_signals()
-                     self.worker.start_download() # Should be auto-started by thread generally but explicit is fine
+                     # Resume: goes back in the queue, manager.worker_started re-binds us
+                     parent_screen.manager.resume_download(task)
+                     self.on_status(task['status'])
                  else:
                      parent_screen.manager.pause_download(task)
+                     self.on_status("Paused")
+
+    def bind_worker(self, worker):
+        if worker is self.worker: return
+        self.worker = worker
+        self._connect_signals()
 
     def _connect_signals(self):
         if self.worker:
@@ -293,11 +360,12 @@ class DownloadItemWidget(QFrame):
         # Find task
         parent_screen = self.window()
         if hasattr(parent_screen, 'manager'):
-             task = None
-             for t in parent_screen.manager.downloads:
-                 if t['worker'] == self.worker or t['name'] == self.lbl_name.text():
-                     task = t
-                     break
+             task = parent_screen.manager.find_task(self.download_path)
+             if not task:
+                 for t in parent_screen.manager.downloads:
+                     if (self.worker and t['worker'] == self.worker) or t['name'] == self.lbl_name.text():
+                         task = t
+                         break
                      
              if task:
                  if self.btn_cancel.text() == "Delete":
@@ -343,6 +411,8 @@ class DownloadImageScreen(QWidget):
         
         # Manager & Data
         self.manager = DownloadManager(self)
+        self.manager.worker_started.connect(self.on_worker_started)
+        self.manager.task_changed.connect(self.on_task_changed)
         self.images = []
         self.selected_image = None
         
@@ -359,8 +429,9 @@ class DownloadImageScreen(QWidget):
         # Trigger fetch
         self.start_fetch()
         
-        # Restore existing downloads
+        # Restore existing downloads, then let the scheduler pick up whatever was queued
         self.restore_downloads()
+        self.manager.schedule()
         
         self.apply_theme("Dark") 
 
@@ -371,7 +442,10 @@ class DownloadImageScreen(QWidget):
         for task in self.manager.downloads:
             # Create widget (worker is None)
             item = DownloadItemWidget(task['name'], None, self.list_container)
+            item.download_path = task['path']
             item.on_status(task['status']) # Set initial UI state
+            if task['status'] == 'Finished' and task.get('extract_error'):
+                item.show_extract_error(task['extract_error'])
             item.selected.connect(self.on_item_selected)
             self._apply_item_theme(item)
             self.list_layout.insertWidget(0, item)
@@ -380,6 +454,43 @@ class DownloadImageScreen(QWidget):
         if count > 0:
             print(f"Restored {count} downloads.") 
 
+    def find_item(self, path):
+        for item in self.list_container.findChildren(DownloadItemWidget):
+            if item.download_path == path:
+                return item
+        return None
+
+    def on_worker_started(self, task):
+        item = self.find_item(task['path'])
+        if item:
+            item.bind_worker(task['worker'])
+            item.on_status(task['status'])
+
+    def on_task_changed(self, task):
+        item = self.find_item(task['path'])
+        if item is None: return
+        if task['status'] == 'Cancelled': # Cancelled in the other process
+            item.setParent(None)
+            item.deleteLater()
+            return
+        item.on_status(task['status'])
+
+    def add_item(self, name, path):
+        # Widget for a freshly queued task; it binds to a worker once the scheduler starts one
+        item = self.find_item(path)
+        if item is None:
+            item = DownloadItemWidget(name, None, self.list_container)
+            item.download_path = path
+            item.selected.connect(self.on_item_selected)
+            self._apply_item_theme(item)
+            self.list_layout.insertWidget(0, item)
+        task = self.manager.find_task(path)
+        if task:
+            if task['worker']:
+                item.bind_worker(task['worker'])
+            item.on_status(task['status'])
+        return item
+
     def closeEvent(self, event):
         # Instead of stopping, we just hide the window to allow "background" downloading
         # The MainScreen holds our reference, so we won't be GC'd.
@@ -407,8 +518,14 @@ class DownloadImageScreen(QWidget):
         close_btn.clicked.connect(self.close)
         close_btn.setObjectName("close_btn")
         
+        # Checks every image in the download folder on a pool, unchanged files come from the cache
+        self.btn_verify = QPushButton("Verify Library")
+        self.btn_verify.setFixedHeight(30)
+        self.btn_verify.clicked.connect(self.verify_library)
+        
         h_layout.addWidget(title)
         h_layout.addStretch()
+        h_layout.addWidget(self.btn_verify)
         h_layout.addWidget(close_btn)
         self.layout.addWidget(header)
         
@@ -434,8 +551,25 @@ class DownloadImageScreen(QWidget):
         row.addWidget(self.combo, 4)
         row.addWidget(self.btn_download, 1)
         
+        # Target SMBIOS, narrows the list to versions that board supports
+        l2 = QLabel("Target Mac (SMBIOS):")
+        l2.setObjectName("label_sub")
+        self.target_combo = QComboBox()
+        self.target_combo.setFixedHeight(34)
+        self.target_combo.addItem("Any Mac", None)
+        for model in sorted(BOARD_IDS):
+            self.target_combo.addItem(f"{model} ({BOARD_IDS[model]})", model)
+        self.target_combo.currentIndexChanged.connect(self.populate_images)
+        
+        self.lbl_size = QLabel("")
+        self.lbl_size.setObjectName("label_sub")
+        self.lbl_size.setFont(QFont("Consolas", 9))
+        
+        top_layout.addWidget(l2)
+        top_layout.addWidget(self.target_combo)
         top_layout.addWidget(l1)
         top_layout.addLayout(row)
+        top_layout.addWidget(self.lbl_size)
         self.layout.addWidget(top_area)
         
         # --- Downloads List ---
@@ -464,14 +598,36 @@ class DownloadImageScreen(QWidget):
     def on_data_loaded(self, images):
         self.images = images
         self.loading_overlay.hide()
-        
+        self.populate_images()
+
+    def set_target_model(self, model):
+        # MainScreen passes SMBIOS().suggest_model(cpu_family) once the hardware scan has run
+        idx = self.target_combo.findData(model)
+        if idx >= 0:
+            self.target_combo.setCurrentIndex(idx)
+
+    def populate_images(self, *args):
         self.combo.clear()
+        self.btn_download.setEnabled(False)
         if not self.images:
             self.combo.addItem("No images found (Error)", None)
             return
 
-        for img in self.images:
-            self.combo.addItem(img['name'], img)
+        model = self.target_combo.currentData()
+        images = self.images
+        if model:
+            board_id = SMBIOS().get_board_id(model)
+            images = filter_images_for_target(self.images, board_id, model)
+            # Recovery server can always give us the newest BaseSystem for this exact board
+            images = [FetchRecoveryImages().make_image(board_id, MLB_ZERO, "latest", f"Latest for {model}")] + images
+
+        for img in images:
+            label = img['name']
+            if img.get('build'):
+                label = f"{label} [{img.get('version') or ''} {img['build']}]"
+            if img.get('size'):
+                label = f"{label} — {format_size(img['size'])}"
+            self.combo.addItem(label, img)
             
         self.btn_download.setEnabled(True)
         self.on_selection_change(0)
@@ -479,23 +635,122 @@ class DownloadImageScreen(QWidget):
     def on_selection_change(self, index):
         if index >= 0:
             self.selected_image = self.combo.itemData(index)
+            self.update_size_estimate()
+
+    def update_size_estimate(self):
+        if not self.selected_image or not self.selected_image.get('size'):
+            self.lbl_size.setText("")
+            return
+        
+        size = self.selected_image['size']
+        try:
+            free = get_free_space(self.get_download_path())
+            self.lbl_size.setText(f"Download size: {format_size(size)} • Free space: {format_size(free)}")
+        except OSError:
+            self.lbl_size.setText(f"Download size: {format_size(size)}")
 
     def add_download(self):
         if not self.selected_image: return
         
+        if self.selected_image.get('source') == 'recovery':
+            self.add_recovery_download()
+            return
+        
         url = self.selected_image['url']
         
         # Get custom download path
         base_path = self.get_download_path()
         fname = f"{self.selected_image['id']}_BaseSystem.dmg"
+        extract = None
+        if self.selected_image.get('full_installer'):
+            # InstallAssistant.pkg: SharedSupport.dmg (and BaseSystem where present) come out next to it as it downloads
+            fname = f"{self.selected_image['id']}_InstallAssistant.pkg"
+            extract = {'dir': os.path.join(base_path, f"{self.selected_image['id']}_Installer"), 'patterns': list(DEFAULT_PATTERNS)}
         dest = os.path.join(base_path, fname)
         
-        worker = self.manager.start_download(url, dest, self.selected_image['name'])
-        
-        item = DownloadItemWidget(self.selected_image['name'], worker, self.list_container)
-        item.selected.connect(self.on_item_selected)
-        self._apply_item_theme(item)
-        self.list_layout.insertWidget(0, item)
+        # Don't burn bandwidth on a download that can't fit on the disk
+        size = self.selected_image.get('size') or 0
+        if size:
+            ok, free, needed = check_disk_space(dest, size, size if extract else 0) # The extracted installer is about as big again
+            if not ok:
+                QMessageBox.warning(
+                    self, "Not Enough Disk Space",
+                    f"{self.selected_image['name']} needs {format_size(needed)} but only "
+                    f"{format_size(free)} is free in:\n{base_path}"
+                )
+                return
+        
+        # BaseSystem products come with a chunklist, full installers don't
+        chunklist = None
+        if self.selected_image.get('chunklist') and not self.selected_image.get('full_installer'):
+            chunklist = {'url': self.selected_image['chunklist'], 'headers': {}}
+        
+        # The rest of the product comes along in the same task and lands together with the image;
+        # the chunklist is fetched by the image itself since every chunk is checked against it
+        files = []
+        dist = self.selected_image.get('dist') or {}
+        dist_url = dist.get('English') or dist.get('en')
+        if dist_url:
+            files.append({'url': dist_url, 'path': os.path.join(base_path, f"{self.selected_image['id']}.dist"), 'optional': True})
+        
+        self.manager.start_download(url, dest, self.selected_image['name'], size, chunklist=chunklist, extract=extract, files=files)
+        self.add_item(self.selected_image['name'], dest)
+
+    def add_recovery_download(self):
+        # Recovery asset URLs carry short-lived tokens, resolve them right before queueing (on a worker, it's a network call)
+        if getattr(self, 'resolve_worker', None) and self.resolve_worker.isRunning(): return
+        self.btn_download.setEnabled(False)
+        self.btn_download.setText("Resolving...")
+        self.resolve_worker = ResolveWorker(self.selected_image, self)
+        self.resolve_worker.resolved.connect(self.on_recovery_resolved)
+        self.resolve_worker.failed.connect(self.on_recovery_failed)
+        self.resolve_worker.start()
+
+    def on_recovery_failed(self, err):
+        self.btn_download.setText("Add to Queue")
+        self.btn_download.setEnabled(self.selected_image is not None)
+        board = self.resolve_worker.image.get('board_id')
+        QMessageBox.critical(self, "Recovery Server Error", f"Could not get a recovery image for {board}:\n{err}")
+
+    def on_recovery_resolved(self, image):
+        self.btn_download.setText("Add to Queue")
+        self.btn_download.setEnabled(self.selected_image is not None)
+        base_path = self.get_download_path()
+        fname = f"{image['product']}_BaseSystem"
+        dest = os.path.join(base_path, fname + ".dmg")
+        
+        # The worker fetches the chunklist itself (saved as <fname>.chunklist) and checks each chunk as it lands
+        chunklist = {'url': image['chunklist'], 'headers': image['chunklist_headers']}
+        recovery = {'board_id': image['board_id'], 'mlb': image.get('mlb', MLB_ZERO), 'os_type': image.get('os_type', 'default')}
+        self.manager.start_download(image['url'], dest, image['name'], 0, image['headers'], chunklist=chunklist, recovery=recovery)
+        self.add_item(image['name'], dest)
+
+    def verify_library(self):
+        finished = [t['path'] for t in self.manager.downloads if t['status'] == 'Finished']
+        paths = library_paths(self.get_download_path(), finished)
+        if not paths:
+            QMessageBox.information(self, "Verify Library", "No images found in the download folder.")
+            return
+        self.btn_verify.setEnabled(False)
+        self.btn_verify.setText("Verifying...")
+        self.verify_worker = VerifyWorker(paths, self)
+        self.verify_worker.progress.connect(lambda pct: self.btn_verify.setText(f"Verifying {pct}%"))
+        self.verify_worker.done.connect(self.on_verify_done)
+        self.verify_worker.failed.connect(lambda err: self.on_verify_done([], err))
+        self.verify_worker.start()
+
+    def on_verify_done(self, results, error=None):
+        self.btn_verify.setEnabled(True)
+        self.btn_verify.setText("Verify Library")
+        if error:
+            QMessageBox.critical(self, "Verify Library", f"Verification failed:\n{error}")
+            return
+        lines = [f"{r['status']}: {os.path.basename(r['path'])}" + (" (cached)" if r['cached'] else "") for r in results]
+        if any(r['status'] in ('Corrupt', 'Missing') for r in results):
+            bad = [f"{os.path.basename(r['path'])}: {r['detail']}" for r in results if r['status'] in ('Corrupt', 'Missing')]
+            QMessageBox.warning(self, "Verify Library", "Some images are damaged, download them again:\n\n" + "\n".join(bad))
+        else:
+            QMessageBox.information(self, "Verify Library", "\n".join(lines))
 
     def on_item_selected(self, name, path):
          self.image_selected.emit(name, path)
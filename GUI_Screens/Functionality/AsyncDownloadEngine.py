@@ -0,0 +1,527 @@
+# GUI_Screens/Functionality/AsyncDownloadEngine.py
+
+import os
+import ssl
+import time
+import asyncio
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urljoin
+from requests.structures import CaseInsensitiveDict
+
+from .DownloadCore import (DownloadJob, ConnectionClosed, RemoteChanged, BLOCK_SIZE, MIN_READ_SIZE, MAX_READ_SIZE,
+                           HASH_CATCH_UP, force_https, is_forbidden, is_overload, is_retryable, retry_delay)
+
+# ---------------------------------------------------------
+# Alternative engine (config.ini [Downloads] engine = async): every active
+# transfer, segments included, runs as a coroutine on ONE event loop thread.
+# Only the blocking disk work (writes, hashing, journal fsyncs) goes to a
+# small pool, so the thread count stays the same for 2 or 50 downloads.
+# Jobs are DownloadJob with the network parts swapped for asyncio streams;
+# journal, hashing, chunk checks and the store work exactly the same.
+# ---------------------------------------------------------
+IO_WORKERS = 4 # Disk/hash pool shared by all jobs
+CONNECT_TIMEOUT = 15
+READ_TIMEOUT = 30
+MAX_REDIRECTS = 5
+PROGRESS_TICK = 0.1 # seconds, how often a segmented job reports and hashes its frontier
+
+_ssl_context = None
+
+def ssl_context():
+    # Same as verify=False on the requests side
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+        _ssl_context.check_hostname = False
+        _ssl_context.verify_mode = ssl.CERT_NONE
+    return _ssl_context
+
+async def within(awaitable, timeout):
+    # asyncio's timeout is its own class before 3.11, surface the builtin one that is_retryable() knows
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError as e:
+        raise TimeoutError(f"No answer for {timeout}s") from e
+
+class Reply:
+    """A minimal HTTP/1.1 response on an asyncio stream: status, headers and a body read into caller buffers."""
+    def __init__(self, url, reader, writer, method):
+        self.url = url
+        self.reader = reader
+        self.writer = writer
+        self.method = method
+        self.status_code = 0
+        self.reason = ""
+        self.headers = CaseInsensitiveDict()
+        self.remaining = None # Body bytes left, None = until the connection closes
+        self.chunked = False
+        self.chunk_left = 0
+
+    async def read_head(self):
+        line = await self.readline()
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise ConnectionClosed(f"Bad status line {line!r}")
+        self.status_code = int(parts[1])
+        self.reason = parts[2] if len(parts) > 2 else ""
+        while True:
+            line = await self.readline()
+            if not line: break
+            key, _, value = line.partition(":")
+            self.headers[key.strip()] = value.strip()
+
+        if self.method == "HEAD" or self.status_code in (204, 304):
+            self.remaining = 0
+        elif 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self.chunked = True
+        elif 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+
+    async def readline(self):
+        try:
+            line = await within(self.reader.readuntil(b"\n"), READ_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            raise ConnectionClosed("Connection closed in the middle of the headers") from e
+        return line.decode('latin-1').rstrip("\r\n")
+
+    async def readinto(self, view):
+        # -> bytes copied into view, 0 at the end of the body
+        if self.chunked:
+            if self.chunk_left == 0:
+                size = int((await self.readline()).split(";")[0], 16)
+                if size == 0:
+                    while await self.readline(): pass # Trailers
+                    self.chunked = False
+                    self.remaining = 0
+                    return 0
+                self.chunk_left = size
+            want = min(len(view), self.chunk_left)
+        elif self.remaining is not None:
+            want = min(len(view), self.remaining)
+        else:
+            want = len(view)
+        if want <= 0: return 0
+
+        data = await within(self.reader.read(want), READ_TIMEOUT)
+        n = len(data)
+        if not n:
+            if self.remaining is None and not self.chunked:
+                return 0 # Body delimited by the connection closing
+            raise ConnectionClosed("Connection closed in the middle of the body")
+        view[:n] = data
+        if self.chunked:
+            self.chunk_left -= n
+            if self.chunk_left == 0:
+                await self.readline() # CRLF after the chunk
+        elif self.remaining is not None:
+            self.remaining -= n
+        return n
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            # Same error type as requests, so is_retryable()/retry_delay() treat both engines alike
+            raise requests.HTTPError(f"{self.status_code} {self.reason} for url: {self.url}", response=self)
+
+    def close(self):
+        self.writer.close()
+
+async def open_url(url, headers, method="GET"):
+    """Sends one request (following redirects) and returns the Reply with its headers read."""
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlparse(url)
+        https = parts.scheme == "https"
+        port = parts.port or (443 if https else 80)
+        try:
+            reader, writer = await within(
+                asyncio.open_connection(parts.hostname, port, ssl=ssl_context() if https else None,
+                                        server_hostname=parts.hostname if https else None, limit=MAX_READ_SIZE),
+                CONNECT_TIMEOUT)
+        except OSError as e:
+            raise ConnectionError(f"Could not connect to {parts.hostname}: {e}") from e
+
+        host = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", "Accept-Encoding: identity", "Connection: close"]
+        lines += [f"{k}: {v}" for k, v in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+        reply = Reply(url, reader, writer, method)
+        try:
+            await writer.drain()
+            await reply.read_head()
+        except Exception:
+            reply.close()
+            raise
+        if reply.status_code in (301, 302, 303, 307, 308) and 'location' in reply.headers:
+            reply.close()
+            url = urljoin(url, reply.headers['location'])
+            if reply.status_code == 303 and method != "HEAD": method = "GET"
+            continue
+        return reply
+    raise ConnectionError(f"Too many redirects for {url}")
+
+class AsyncDownloadJob(DownloadJob):
+    """DownloadJob whose transfers are coroutines. run() still works standalone (own loop)."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None # Engine's disk pool, None = the loop's default executor
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    def offload(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    async def run_async(self):
+        # Same flow as DownloadJob.run, callbacks come from the loop thread
+        self.active = True
+        self.done.clear()
+        self.is_running = True
+        self.is_paused = False
+        self.is_cancelled = False
+        self.held = False
+        self.source = None
+        self.on_status("Downloading")
+
+        try:
+            if self.resolve_stale:
+                await self.offload(self.refresh_request)
+            self.url = force_https(self.url)
+
+            failures = 0
+            refreshed = False
+            while True:
+                before = self.downloaded_size
+                try:
+                    if await self.run_transfer_async():
+                        return # Already in the download store
+                    break
+                except Exception as e:
+                    if self.source and not (self.is_cancelled or self.is_paused):
+                        self.drop_source(e)
+                        continue
+                    if self.resolver and is_forbidden(e) and not refreshed:
+                        refreshed = True
+                        await self.offload(self.refresh_request)
+                        continue
+                    if self.downloaded_size > before:
+                        failures = 0
+                    if self.is_cancelled or self.is_paused or not is_retryable(e) or failures >= self.max_retries:
+                        raise
+                    failures += 1
+                    await self.offload(self.checkpoint, True)
+                    await self.wait_retry_async(retry_delay(failures, e), f"{e} (retry {failures}/{self.max_retries})")
+
+            if self.is_cancelled:
+                await self.offload(self.cleanup)
+                return
+            self.emit_progress(force=True)
+            if self.is_paused:
+                await self.offload(self.checkpoint, True)
+                self.on_status("Paused")
+                return
+
+            await self.offload(self.complete)
+            self.report_finished()
+
+        except Exception as e:
+            print(f"Download Worker Error: {e}")
+            if not self.is_cancelled:
+                await self.offload(self.checkpoint, True)
+            self.on_status("Error")
+            self.on_error(str(e))
+            self.is_running = False
+        finally:
+            if not self.held: self.stop_stage()
+            self.active = False
+            self.done.set()
+            self.on_stopped()
+
+    async def run_transfer_async(self):
+        try:
+            await self.probe_async()
+            if await self.offload(self.link_from_store):
+                self.emit_progress(force=True)
+                self.report_finished()
+                return True
+            await self.offload(self.load_chunklist) # Small file, the blocking fetch is fine on the pool
+            await self.offload(self.recover_part)
+            await self.offload(self.find_source) # Peer lookups block, short timeouts
+            await self.transfer_async()
+        except RemoteChanged as e:
+            print(f"{e}, starting over")
+            await self.offload(self.restart)
+            if os.path.exists(self.chunklist_path): os.remove(self.chunklist_path)
+            self.verifier = None
+            self.source = None
+            await self.probe_async()
+            await self.offload(self.load_chunklist)
+            await self.offload(self.find_source)
+            await self.transfer_async()
+        await self.offload(self.check_source)
+        return False
+
+    async def wait_retry_async(self, delay, reason):
+        print(f"Download interrupted: {reason}, reconnecting in {delay:.0f}s")
+        self.on_status(f"Retrying in {delay:.0f}s")
+        await self.nap_async(delay)
+        if not (self.is_cancelled or self.is_paused):
+            self.on_status("Downloading")
+
+    async def nap_async(self, delay):
+        end = time.time() + delay
+        while time.time() < end and not (self.is_cancelled or self.is_paused):
+            await asyncio.sleep(min(0.1, max(0, end - time.time())))
+
+    async def probe_async(self):
+        try:
+            head = await open_url(self.url, self.request_headers(), "HEAD")
+        except Exception:
+            return # HEAD failed, rely on GET (If-Range still protects the resume)
+        head.close()
+        if head.status_code >= 400: return
+        self.read_head(head.headers)
+
+    async def transfer_async(self):
+        self.preflight()
+        self.start_stage()
+        self.start_check()
+        if self.use_segments():
+            await self.download_segmented_async()
+        else:
+            await self.download_single_async()
+
+    async def download_single_async(self):
+        headers = self.request_headers()
+        mode = 'wb'
+        if self.downloaded_size > 0:
+            headers['Range'] = f"bytes={self.downloaded_size}-"
+            if self.if_range():
+                headers['If-Range'] = self.if_range()
+            mode = 'r+b'
+
+        reply = await open_url(self.fetch_url(), headers)
+        try:
+            reply.raise_for_status()
+            if self.downloaded_size > 0 and reply.status_code != 206:
+                print(f"Server sent the whole file, restarting {os.path.basename(self.dest_path)}")
+                self.downloaded_size = 0
+                self.etag = None
+                self.last_modified = None
+                self.reset_feed()
+                mode = 'wb'
+            self.etag = self.etag or reply.headers.get('etag')
+            self.last_modified = self.last_modified or reply.headers.get('last-modified')
+            if self.total_size == 0 and 'content-length' in reply.headers:
+                self.total_size = int(reply.headers['content-length']) + self.downloaded_size
+
+            self.start_time = time.time()
+            self.bytes_in_session = 0
+            with open(self.part_path, mode, buffering=0) as f:
+                if mode == 'r+b':
+                    self.trim_part(f)
+                    f.seek(self.downloaded_size)
+                    if self.hasher.offset > self.downloaded_size:
+                        self.reset_feed()
+                    await self.offload(self.feed_from_disk, self.downloaded_size)
+                if self.total_size:
+                    await self.offload(self.reserve, f)
+                    await self.offload(self.checkpoint, True)
+                await self.receive_async(reply, f)
+        finally:
+            reply.close()
+
+        if self.is_cancelled or self.is_paused:
+            return
+        if self.total_size and self.downloaded_size < self.total_size:
+            raise ConnectionClosed(f"Connection closed early ({self.downloaded_size} of {self.total_size} bytes)")
+
+    async def download_segmented_async(self):
+        await self.offload(self.plan_segments)
+        self.downloaded_size = self.total_size - sum(s['end'] - s['pos'] for s in self.segments)
+        self.start_time = time.time()
+        self.bytes_in_session = 0
+        self.segment_errors = []
+        self.tune_start = 0
+
+        pending = set()
+        def add_connection():
+            with self.lock: self.connections += 1
+            pending.add(asyncio.ensure_future(self.segment_loop_async()))
+        for _ in range(self.segment_count): add_connection()
+        while pending:
+            _, still = await asyncio.wait(pending, timeout=PROGRESS_TICK)
+            pending.intersection_update(still)
+            self.emit_progress()
+            try:
+                await self.offload(self.feed_frontier, HASH_CATCH_UP)
+            except Exception as e:
+                self.segment_errors.append(e) # Stops the segment coroutines too
+            await self.offload(self.checkpoint)
+            if pending and self.tune(): add_connection()
+
+        if self.settle_segments():
+            await self.offload(self.feed_frontier)
+
+    async def segment_loop_async(self):
+        failures = 0
+        retired = False
+        try:
+            with open(self.part_path, 'r+b', buffering=0) as f:
+                while not (self.is_cancelled or self.is_paused or self.segment_errors):
+                    if self.should_retire():
+                        retired = True
+                        break
+                    seg = self.claim_segment()
+                    if seg is None: break
+                    start = seg['pos']
+                    try:
+                        if await self.fetch_segment_async(f, seg):
+                            retired = True
+                            break
+                    except Exception as e:
+                        if is_overload(e) and self.shed_connection():
+                            retired = True
+                            break
+                        if seg['pos'] > start: failures = 0
+                        if not is_retryable(e) or failures >= self.max_retries: raise
+                        failures += 1
+                        print(f"Segment at byte {seg['pos']} interrupted: {e} (retry {failures}/{self.max_retries})")
+                        await self.nap_async(retry_delay(failures, e))
+                    finally:
+                        with self.lock: seg['busy'] = False
+        except Exception as e:
+            self.segment_errors.append(e)
+        finally:
+            if not retired:
+                with self.lock: self.connections -= 1
+
+    async def fetch_segment_async(self, f, seg):
+        headers = self.request_headers({'Range': f"bytes={seg['pos']}-{seg['end'] - 1}"})
+        if self.if_range():
+            headers['If-Range'] = self.if_range()
+        reply = await open_url(self.fetch_url(), headers)
+        try:
+            reply.raise_for_status()
+            if reply.status_code != 206:
+                if 'If-Range' in headers:
+                    raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+                raise IOError("Server ignored the byte range request")
+            if await self.receive_async(reply, f, seg):
+                return True # Retired mid-range
+        finally:
+            reply.close()
+
+        if seg['pos'] < seg['end'] and not (self.is_cancelled or self.is_paused or self.segment_errors):
+            raise ConnectionClosed(f"Connection closed early at byte {seg['pos']}")
+
+    async def receive_async(self, reply, f, seg=None):
+        # Two buffers: one fills from the socket while the other is written out on the pool
+        buffers = [memoryview(bytearray(BLOCK_SIZE)), memoryview(bytearray(BLOCK_SIZE))]
+        view = buffers[0]
+        writing = None # (future, bytes in flight)
+        read_size = MIN_READ_SIZE
+        filled = 0
+        retired = False
+
+        try:
+            while not (self.is_cancelled or self.is_paused or self.segment_errors):
+                want = min(read_size, BLOCK_SIZE - filled)
+                if seg is not None:
+                    in_flight = writing[1] if writing else 0
+                    want = min(want, seg['end'] - seg['pos'] - in_flight - filled)
+                    if want <= 0: break
+
+                n = await reply.readinto(view[filled:filled + want])
+                if not n: break
+                filled += n
+                await self.throttle_async(n)
+
+                if n == want and read_size < MAX_READ_SIZE:
+                    read_size *= 2
+                elif n < want // 4 and read_size > MIN_READ_SIZE:
+                    read_size //= 2
+
+                if filled == BLOCK_SIZE:
+                    pending, writing = writing, None
+                    await self.finish_write(pending, seg)
+                    writing = (self.offload(self.write_out, f, view, filled, seg), filled)
+                    view = buffers[1] if view is buffers[0] else buffers[0]
+                    filled = 0
+                    if seg is not None and self.should_retire():
+                        retired = True
+                        break
+
+            pending, writing = writing, None
+            await self.finish_write(pending, seg)
+            if filled:
+                await self.finish_write((self.offload(self.write_out, f, view, filled, seg), filled), seg)
+            return retired
+        finally:
+            if writing:
+                # Failed mid-stream: let the write in flight land before the file is closed
+                try: self.landed(await writing[0], seg)
+                except Exception: pass
+
+    async def finish_write(self, writing, seg):
+        if writing is None: return
+        self.landed(await writing[0], seg)
+        if seg is None: self.emit_progress()
+
+    def landed(self, n, seg):
+        # seg['pos'] only moves here, on the loop, so the receive loop never sees a write twice
+        if seg is not None:
+            with self.lock:
+                seg['pos'] += n
+        self.count_bytes(n)
+
+    def write_out(self, f, view, n, seg=None):
+        # Runs on the pool: the disk write, plus hashing/checkpoint for a single stream. Returns bytes kept
+        if seg is None:
+            f.write(view[:n])
+            self.feed(view[:n])
+            self.checkpoint()
+            return n
+
+        with self.lock:
+            n = min(n, seg['end'] - seg['pos']) # Back half may have been stolen meanwhile
+            pos = seg['pos']
+        if n <= 0: return 0
+        if hasattr(os, 'pwrite'):
+            os.pwrite(f.fileno(), view[:n], pos)
+        else:
+            f.seek(pos)
+            f.write(view[:n])
+        return n
+
+    async def throttle_async(self, n):
+        for bucket in (self.rate_limiter, self.global_limiter):
+            if bucket is None: continue
+            while not (self.is_cancelled or self.is_paused):
+                wait = bucket.take(n)
+                if not wait: break
+                await asyncio.sleep(min(wait, 0.25))
+
+class AsyncDownloadEngine:
+    """One event loop thread for every job, plus IO_WORKERS pool threads for the disk."""
+    job_class = AsyncDownloadJob
+
+    def __init__(self, io_workers=IO_WORKERS):
+        self.pool = ThreadPoolExecutor(io_workers, thread_name_prefix="download-io")
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="download-loop", daemon=True)
+        self.thread.start()
+
+    def start(self, job):
+        job.pool = self.pool
+        job.active = True # Counts as running from now on, not from when the loop gets to it
+        job.done.clear()
+        asyncio.run_coroutine_threadsafe(job.run_async(), self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.pool.shutdown(wait=False)
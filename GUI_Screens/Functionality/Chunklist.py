@@ -0,0 +1,85 @@
+# GUI_Screens/Functionality/Chunklist.py
+
+import struct
+import hashlib
+
+# ---------------------------------------------------------
+# Apple chunklists (BaseSystem.chunklist, *.integrityDataV1): a list of
+# (size, SHA-256) for consecutive chunks of the image, ~10 MB each.
+#   header: magic "CNKL", header size, version, chunk method, signature method,
+#           padding, chunk count, chunk offset, signature offset (little endian)
+#   chunk:  uint32 size + 32 byte SHA-256
+# ---------------------------------------------------------
+CHUNKLIST_MAGIC = b"CNKL"
+CHUNKLIST_HEADER = struct.Struct("<4sIBBBxQQQ")
+CHUNK_ENTRY = struct.Struct("<I32s")
+CHUNK_METHOD_SHA256 = 1
+
+def parse_chunklist(data):
+    """Returns [(offset, size, sha256 digest)] for every chunk, raises ValueError on a malformed file."""
+    if len(data) < CHUNKLIST_HEADER.size:
+        raise ValueError("Chunklist is too short")
+    magic, header_size, version, method, sig_method, count, chunk_offset, sig_offset = CHUNKLIST_HEADER.unpack_from(data)
+    if magic != CHUNKLIST_MAGIC or header_size != CHUNKLIST_HEADER.size:
+        raise ValueError("Not a chunklist")
+    if method != CHUNK_METHOD_SHA256:
+        raise ValueError(f"Unsupported chunk method {method}")
+    if chunk_offset + count * CHUNK_ENTRY.size > len(data):
+        raise ValueError("Chunklist is truncated")
+
+    chunks = []
+    offset = 0
+    for i in range(count):
+        size, digest = CHUNK_ENTRY.unpack_from(data, chunk_offset + i * CHUNK_ENTRY.size)
+        chunks.append((offset, size, digest))
+        offset += size
+    return chunks
+
+def chunklist_total(chunks):
+    if not chunks: return 0
+    offset, size, _ = chunks[-1]
+    return offset + size
+
+class ChunkVerifier:
+    """Checks a file chunk by chunk as it is fed in order. offset is always the next byte expected."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.total = chunklist_total(chunks)
+        self.seek(0)
+
+    def seek(self, offset):
+        # Only chunk boundaries can be resumed from, anything else starts over
+        starts = [c[0] for c in self.chunks] + [self.total]
+        found = offset in starts
+        self.index = starts.index(offset) if found else 0
+        self.filled = 0
+        self.hash = hashlib.sha256()
+        return found
+
+    @property
+    def offset(self):
+        if self.index >= len(self.chunks): return self.total
+        return self.chunks[self.index][0] + self.filled
+
+    @property
+    def done(self):
+        return self.index >= len(self.chunks)
+
+    def room(self):
+        # Bytes left in the current chunk
+        if self.done: return 0
+        return self.chunks[self.index][1] - self.filled
+
+    def update(self, data):
+        # data must not cross a chunk boundary (see room()). Returns (chunk, ok) when a chunk completes
+        self.hash.update(data)
+        self.filled += len(data)
+        chunk = self.chunks[self.index]
+        if self.filled < chunk[1]:
+            return None
+
+        ok = self.hash.digest() == chunk[2]
+        self.index += 1
+        self.filled = 0
+        self.hash = hashlib.sha256()
+        return chunk, ok
@@ -0,0 +1,156 @@
+# GUI_Screens/Functionality/ContentStore.py
+
+import os
+import sys
+import json
+import shutil
+import threading
+
+from .FileLock import FileLock
+
+# ---------------------------------------------------------
+# Content-addressed store for finished downloads.
+# A finished file is hardlinked in as objects/<sha256> and indexed by
+# URL + validators (ETag/Last-Modified/size). Asking for the same content
+# again, into any folder, is then a link instead of another 13 GB download.
+# The GUI and the daemon share one store, so every change re-reads the
+# index under index.lock and merges into it instead of overwriting it.
+# ---------------------------------------------------------
+STORE_INDEX_FILE = "index.json"
+STORE_LOCK_FILE = "index.lock"
+FICLONE = 0x40049409 # Linux reflink ioctl (btrfs, xfs)
+
+def store_key(url, etag=None, last_modified=None, size=0):
+    # Without a validator we can't tell two versions of a URL apart, don't dedupe those
+    if not (etag or last_modified):
+        return None
+    return "\n".join([url, etag or "", last_modified or "", str(size or 0)])
+
+def reflink(src, dst):
+    # Copy-on-write clone, shares blocks like a hardlink but the copies stay independent
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile failed")
+        return
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflinks not supported here")
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+def materialize(src, dst):
+    """Puts src's content at dst: hardlink, else reflink, else a plain copy. Returns the method used."""
+    tmp = dst + ".link"
+    if os.path.exists(tmp): os.remove(tmp)
+    for method, func in (("hardlink", os.link), ("reflink", reflink), ("copy", shutil.copyfile)):
+        try:
+            func(src, tmp)
+            os.replace(tmp, dst)
+            return method
+        except OSError:
+            if os.path.exists(tmp): os.remove(tmp)
+            if method == "copy": raise
+    return None
+
+class ContentStore:
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, STORE_INDEX_FILE)
+        self.lock_path = os.path.join(root, STORE_LOCK_FILE)
+        self.lock = threading.Lock() # Workers finish on their own threads
+        self.keys = {} # store_key -> sha256
+        self.objects = {} # sha256 -> {'path', 'size', 'digests'}
+        try:
+            os.makedirs(self.objects_dir, exist_ok=True)
+        except OSError as e:
+            print(f"Error creating download store: {e}")
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.index_path): return
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+            self.keys = data.get('keys', {})
+            self.objects = data.get('objects', {})
+        except Exception as e:
+            print(f"Error loading download store: {e}")
+
+    def save(self):
+        try:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'keys': self.keys, 'objects': self.objects}, f, indent=4)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print(f"Error saving download store: {e}")
+
+    def update(self, change):
+        # Read-modify-write of the index against whatever other processes saved meanwhile.
+        # Callers hold self.lock; change() edits self.keys/self.objects in place.
+        try:
+            with FileLock(self.lock_path):
+                self.load()
+                change()
+                self.save()
+        except Exception as e:
+            print(f"Error updating download store: {e}")
+
+    def lookup(self, key):
+        # -> (path, entry) of a present copy, or None
+        if key is None: return None
+        with self.lock:
+            self.load() # Pick up what the other process stored
+            digest = self.keys.get(key)
+            entry = self.objects.get(digest)
+            if not entry: return None
+            path = entry['path']
+            if os.path.exists(path) and os.path.getsize(path) == entry['size']:
+                return path, entry
+            # Its only copy is gone (or was modified in place)
+            def drop():
+                self.objects.pop(digest, None)
+                self.keys = {k: d for k, d in self.keys.items() if d != digest}
+            self.update(drop)
+            return None
+
+    def add(self, path, key, digests):
+        # Index a finished download, linking it into objects/ when the store is on the same disk
+        digest = digests.get('sha256')
+        if not digest: return
+        size = os.path.getsize(path)
+        stored = os.path.join(self.objects_dir, digest)
+        with self.lock:
+            if not (os.path.exists(stored) and os.path.getsize(stored) == size):
+                try:
+                    os.link(path, stored)
+                except OSError:
+                    stored = path # Other filesystem: the download itself is the canonical copy
+            def put():
+                self.objects[digest] = {'path': stored, 'size': size, 'digests': dict(digests)}
+                if key is not None:
+                    self.keys[key] = digest
+            self.update(put)
+
+    def prune(self):
+        # Drop objects nothing links to anymore (every destination was deleted)
+        def sweep():
+            for digest, entry in list(self.objects.items()):
+                path = entry['path']
+                orphan = path.startswith(self.objects_dir) and os.path.exists(path) and os.stat(path).st_nlink <= 1
+                if orphan or not os.path.exists(path):
+                    if orphan:
+                        try: os.remove(path)
+                        except OSError: continue
+                    del self.objects[digest]
+            self.keys = {k: d for k, d in self.keys.items() if d in self.objects}
+        with self.lock:
+            self.update(sweep)
@@ -0,0 +1,2241 @@
+# GUI_Screens/Functionality/DownloadCore.py
+
+# ---------------------------------------------------------
+# The download engine without Qt: DownloadJob fetches one file and reports
+# through plain callbacks, DownloadQueue schedules jobs on plain threads.
+# DownloadManager wraps both for the GUI, DownloadDaemon runs them headless.
+# ---------------------------------------------------------
+
+import os
+import json
+import time
+import random
+import socket
+import hashlib
+import functools
+import http.client
+import queue
+import shutil
+import threading
+import configparser
+import requests
+from urllib.parse import urlparse
+from .ResumableHash import StreamHasher
+from .Chunklist import ChunkVerifier, parse_chunklist, chunklist_total
+from .ContentStore import ContentStore, store_key, materialize
+from .LanCache import LanCacheServer, LanPeers, LAN_CACHE_PORT, parse_peers
+from .DownloadDatabase import DownloadDatabase
+from .FileLock import FileLock
+from .Preallocate import preallocate, allocated_size
+from .XarArchive import ExtractStage, ArchiveCheck, XarError, extract, verify_archive, toc_end, DEFAULT_PATTERNS, TOC_ENTRY, XAR_HEADER
+
+import sys
+
+def get_config_dir():
+    if sys.platform == "win32":
+        config_dir = os.path.join(os.getenv("ProgramData"), "Hackintoshify")
+    elif sys.platform == "darwin":
+        config_dir = "/Library/Application Support/Hackintoshify"
+    else:
+        config_dir = os.path.join(os.path.expanduser("~"), ".config", "hackintoshify")
+    
+    if not os.path.exists(config_dir):
+        try: os.makedirs(config_dir, exist_ok=True)
+        except: pass
+        
+    return config_dir
+
+def get_state_file_path():
+    return os.path.join(get_config_dir(), "download_state.json")
+
+DOWNLOAD_STATE_FILE = get_state_file_path() # Old JSON state, moved into the database on first start
+DOWNLOAD_DB_FILE = os.path.join(get_config_dir(), "downloads.db")
+CONFIG_FILE = os.path.join(get_config_dir(), "config.ini")
+TASK_LOCK_DIR = os.path.join(get_config_dir(), "locks") # One lock per task path, held by whichever process runs it
+
+# Scheduler defaults, overridable in config.ini [Downloads]
+MAX_ACTIVE_DOWNLOADS = 2
+MAX_HOST_CONNECTIONS = 8 # Total parallel connections to one host across all tasks
+ACTIVE_STATUSES = ('Pending', 'Downloading')
+ELSEWHERE = 'Running elsewhere' # The GUI or the daemon (the other one) holds this task's lock
+RATE_CHECK_INTERVAL = 60 * 1000 # ms, how often time-of-day rate windows are re-evaluated
+
+# Receive path: socket reads land directly in a reused block buffer which is
+# written out whole, so per-byte Python work happens once per block, not per 8 KB.
+BLOCK_SIZE = 4 * 1024 * 1024 # Write unit, segment starts are aligned to it
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 1024 * 1024
+
+# Disk writes run on a writer thread fed through a bounded queue of blocks, so a slow
+# disk (USB, SMB) doesn't stall the socket and vice versa. 0 = write inline.
+WRITE_QUEUE_DEPTH = 4 # blocks, overridable in config.ini [Downloads] write_queue
+
+# Progress is sampled, not sent per block: at most one signal per interval
+PROGRESS_INTERVAL = 0.25 # seconds
+SPEED_SMOOTHING = 0.3 # EWMA weight of the newest speed sample
+DISK_SPACE_MARGIN = 256 * 1024 * 1024 # Keep some headroom so the OS doesn't choke
+FORCE_HTTPS_HOSTS = ("swcdn.apple.com",) # Catalog URLs are http:// but the CDN serves https
+
+# Segmented downloads: big files are split into byte ranges fetched over parallel connections
+SEGMENT_COUNT = 4
+SEGMENTED_THRESHOLD = 64 * 1024 * 1024 # Smaller files aren't worth the extra connections
+MIN_STEAL_SIZE = 2 * BLOCK_SIZE # Don't split a running segment below this
+
+# The connection count adapts while a segmented download runs: every window one more
+# connection is tried and kept only if throughput grows by TUNE_MIN_GAIN, 429/503
+# drops one. What worked is remembered per host and used as the next start.
+TUNE_INTERVAL = 3 # seconds per throughput measurement
+TUNE_MIN_GAIN = 0.1 # An extra connection must add 10% to stay
+OVERLOAD_STATUS = (429, 503) # Server asks for fewer connections
+RESOLVE_AGE = 10 * 60 # seconds before recovery asset tokens are fetched again on (re)start
+
+# Resume journal (<file>.part.journal): what is safely on disk plus the server's
+# validators, so a resume can't stitch two different versions of a file together.
+# Segmented downloads keep the byte ranges still missing (an extent list), so a
+# resume fetches only those. Each checkpoint is ordered: .part data, then the new
+# journal, then the rename, each fsynced before the next step.
+JOURNAL_INTERVAL = 5 # seconds between checkpoints while downloading
+SHUTDOWN_WAIT = 3000 # ms to let jobs write their journal when the app quits
+
+# Digests computed while downloading, overridable in config.ini [Downloads] hashes = sha256, merkle, sha1, md5
+# (merkle is what lets ImageVerifier re-check a file on every core, see ResumableHash)
+HASH_ALGORITHMS = ('sha256', 'merkle')
+HASH_CATCH_UP = 4 * BLOCK_SIZE # Max bytes hashed per progress tick in segmented mode
+CHUNK_RETRIES = 3 # Refetch attempts for a chunk that fails its chunklist SHA-256
+
+class RemoteChanged(IOError):
+    # The object behind the URL is not the one the partial file came from
+    pass
+
+class ConnectionClosed(IOError):
+    # Body ended before the expected size, worth reconnecting
+    pass
+
+class DiskFull(IOError):
+    # The target volume can't take the rest of the file, retrying won't help
+    pass
+
+# Transient failures reconnect from the current offset with exponential backoff and jitter.
+# The budget counts failures in a row; an attempt that made progress resets it.
+RETRY_LIMIT = 10 # overridable in config.ini [Downloads] retries
+RETRY_BASE_DELAY = 2 # seconds, doubles per failure
+RETRY_MAX_DELAY = 300
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+
+def is_retryable(error):
+    if isinstance(error, RemoteChanged):
+        return False
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRY_STATUS
+    import urllib3
+    return isinstance(error, (ConnectionClosed, requests.ConnectionError, requests.Timeout,
+                              requests.exceptions.ChunkedEncodingError, urllib3.exceptions.HTTPError,
+                              http.client.HTTPException, ConnectionError, socket.timeout, TimeoutError))
+
+def is_forbidden(error):
+    # Expired asset token (recovery images): asking the server again may fix it, retrying won't
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in (401, 403)
+
+def is_overload(error):
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in OVERLOAD_STATUS
+
+def retry_delay(failures, error=None):
+    # Honour Retry-After on 429/503, else 2, 4, 8... seconds with half of it jittered
+    response = getattr(error, 'response', None)
+    if response is not None and response.headers.get('retry-after', '').isdigit():
+        return min(float(response.headers['retry-after']), RETRY_MAX_DELAY)
+    delay = min(RETRY_BASE_DELAY * 2 ** (failures - 1), RETRY_MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class TokenBucket:
+    """Thread-safe token bucket in bytes/sec. A rate of 0 means unlimited; the rate can change at any time."""
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.tokens = 0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = max(0, int(rate or 0))
+            self.capacity = max(self.rate, MIN_READ_SIZE) # About one second of burst
+            self.tokens = min(self.tokens, self.capacity)
+            self.stamp = time.monotonic()
+
+    def take(self, n):
+        # Takes n tokens and returns 0, or returns how long to wait before asking again
+        if not self.rate: return 0
+        with self.lock:
+            if not self.rate: return 0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens > 0:
+                self.tokens -= n # May go negative, the debt is slept off next time
+                return 0
+            return -self.tokens / self.rate
+
+    def consume(self, n, should_stop=None):
+        # Called once per socket read (64 KB - 1 MB), never per small chunk
+        while True:
+            wait = self.take(n)
+            if not wait: return
+            if should_stop and should_stop(): return
+            time.sleep(min(wait, 0.25)) # Short naps so pause and rate changes apply quickly
+
+class BlockWriter:
+    """Writer thread behind a bounded queue. Readers hand over filled buffers and get recycled ones
+    back; when the disk falls behind, submit() blocks and the reader stops pulling from the socket."""
+    def __init__(self, depth=WRITE_QUEUE_DEPTH):
+        self.pending = queue.Queue(maxsize=max(1, depth))
+        self.free = queue.Queue() # Recycled buffers, at most depth + one per reader ever exist
+        self.error = None
+        self.thread = threading.Thread(target=self.loop, name="download-writer", daemon=True)
+        self.thread.start()
+
+    def buffer(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            return bytearray(BLOCK_SIZE)
+
+    def submit(self, write, buf, n):
+        # write(view, n) runs on the writer thread; buf comes back through buffer() afterwards
+        if self.error: raise self.error
+        self.pending.put((write, buf, n))
+
+    def loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None: return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            write, buf, n = item
+            if self.error is None: # After a failure the rest is just drained, not written
+                try:
+                    write(memoryview(buf), n)
+                except Exception as e:
+                    self.error = e
+            self.free.put(buf)
+
+    def flush(self):
+        # Wait until everything submitted so far is on disk (or failed)
+        done = threading.Event()
+        self.pending.put(done)
+        done.wait()
+        if self.error: raise self.error
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+
+def parse_rate_windows(text):
+    """'22:00-06:00=0; 08:00-18:00=2048' -> [(start_min, end_min, kb_per_sec)]. Windows may wrap past midnight."""
+    windows = []
+    for part in (text or "").split(';'):
+        part = part.strip()
+        if not part: continue
+        try:
+            span, rate = part.split('=')
+            start, end = span.split('-')
+            to_min = lambda hm: int(hm.split(':')[0]) * 60 + int(hm.split(':')[1])
+            windows.append((to_min(start.strip()), to_min(end.strip()), int(rate)))
+        except ValueError:
+            print(f"Ignoring bad rate window: {part}")
+    return windows
+
+def rate_for_time(windows, default, now=None):
+    now = now or time.localtime()
+    minute = now.tm_hour * 60 + now.tm_min
+    for start, end, rate in windows:
+        if start <= end:
+            inside = start <= minute < end
+        else:
+            inside = minute >= start or minute < end
+        if inside:
+            return rate
+    return default
+
+def force_https(url):
+    # Catalog URLs are http:// but the CDN serves https
+    if url.startswith('http://') and urlparse(url).hostname in FORCE_HTTPS_HOSTS:
+        return url.replace('http://', 'https://', 1)
+    return url
+
+def _ignore(*args):
+    pass
+
+def locked(method):
+    # Queue state is touched from job threads when running headless
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def task_lock(path):
+    # Keyed on the absolute destination, so both processes pick the same file for the same .part
+    name = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return FileLock(os.path.join(TASK_LOCK_DIR, name + ".lock"))
+
+def locked_elsewhere(path):
+    # Only meaningful for paths this process doesn't hold itself
+    lock = task_lock(path)
+    try:
+        if not lock.acquire(blocking=False): return True
+    except OSError as e:
+        print(f"Error checking task lock: {e}")
+        return False
+    lock.release()
+    return False
+
+def restored_status(status):
+    # Status of a row read back from the database, for a queue that isn't running it
+    status = status or 'Paused'
+    if status in ['Queued', 'Pending', 'Downloading']:
+        return "Queued" # Was waiting or running, keep its place in line
+    if status not in ['Finished', 'Error']:
+        return "Paused"
+    return status
+
+def merge_extents(ranges):
+    # [[start, end]] sorted, with touching ranges joined (stolen halves end up next to each other)
+    merged = []
+    for start, end in sorted(ranges):
+        if start >= end: continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def journal_progress(part_path):
+    # Bytes a paused download really has, from its journal; the .part itself is preallocated to full size
+    try:
+        with open(part_path + ".journal", 'r') as f:
+            data = json.load(f)
+        if data.get('remaining') is not None:
+            return data['total'] - sum(end - pos for pos, end in data['remaining'])
+        return data.get('verified', 0)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def fsync_dir(path):
+    # Makes a rename in the folder durable; not possible (or needed) on Windows
+    if not hasattr(os, 'O_DIRECTORY'): return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try: os.fsync(fd)
+    finally: os.close(fd)
+
+def get_readinto(response):
+    # requests/urllib3 copy every read into a fresh bytes object; the underlying
+    # http.client response can fill our buffer in place. We never touch
+    # response.raw afterwards, so bypassing urllib3's bookkeeping is safe.
+    fp = getattr(response.raw, '_fp', None)
+    if fp is not None and hasattr(fp, 'readinto') and not response.headers.get('content-encoding'):
+        return fp.readinto
+    return response.raw.readinto
+
+def format_size(num_bytes):
+    if num_bytes >= 1024 ** 3:
+        return f"{num_bytes / (1024 ** 3):.1f} GB"
+    elif num_bytes >= 1024 ** 2:
+        return f"{num_bytes / (1024 ** 2):.0f} MB"
+    elif num_bytes >= 1024:
+        return f"{num_bytes / 1024:.0f} KB"
+    return f"{num_bytes} B"
+
+def format_eta(seconds):
+    if seconds is None or seconds < 0:
+        return ""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {(seconds % 3600) // 60:02d}m left"
+    elif seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s left"
+    return f"{seconds}s left"
+
+def get_free_space(path):
+    # Walk up to the closest existing folder so we stat the right volume
+    probe = os.path.abspath(path)
+    while not os.path.exists(probe):
+        parent = os.path.dirname(probe)
+        if parent == probe: break
+        probe = parent
+    return shutil.disk_usage(probe).free
+
+def check_disk_space(dest_path, expected_size, extract_size=0):
+    """Returns (ok, free_bytes, needed_bytes) for downloading expected_size bytes to dest_path.
+    extract_size: room for files pulled out of it next to it (a pkg's payload is about its own size)."""
+    needed = expected_size
+    part_path = dest_path + ".part"
+    if os.path.exists(part_path):
+        needed -= allocated_size(part_path) # Resuming (or preallocated), only the rest is needed
+    needed = max(needed, 0) + extract_size + DISK_SPACE_MARGIN
+
+    try:
+        free = get_free_space(os.path.dirname(dest_path) or ".")
+    except OSError:
+        return True, 0, needed # Can't tell, don't block the download
+    return free >= needed, free, needed
+
+class DownloadJob:
+    def __init__(self, url, dest_path, total_size=0, headers=None, hashes=HASH_ALGORITHMS, chunklist=None):
+        # Callbacks, all called from the thread running run() (never from segment threads)
+        self.on_progress = _ignore # pct, speed, dl_size, total_size, eta
+        self.on_status = _ignore # "Downloading", "Paused", "Finished", "Error", "Retrying in ..."
+        self.on_error = _ignore # message
+        self.on_finished = _ignore
+        self.on_stopped = _ignore # run() returned, for whatever reason
+        
+        self.url = url
+        self.dest_path = dest_path
+        self.extra_headers = dict(headers or {}) # e.g. AssetToken cookie for recovery images
+        self.resolver = None # -> (url, headers, chunklist) with fresh tokens, set for recovery tasks
+        self.resolve_stale = False # Tokens are old, resolve before the first request
+        self.part_path = dest_path + ".part"
+        self.journal_path = self.part_path + ".journal"
+        self.etag = None
+        self.last_modified = None
+        self.last_checkpoint = 0
+        self.hasher = StreamHasher(hashes) # Fed in file order while bytes are written
+        self.digests = {}
+        
+        # Chunklist checks: {'url', 'headers'} of the image's chunklist, cached next to the image
+        self.chunklist = chunklist
+        self.chunklist_path = os.path.splitext(dest_path)[0] + ".chunklist"
+        self.verifier = None
+        self.verified_hasher = None # hasher as of the last verified chunk boundary
+        self.repaired_chunks = 0
+        # Installer pkgs: {'dir', 'patterns'} of files to pull out, while downloading when the stream allows
+        self.extract = None
+        self.stage = None # ExtractStage fed from feed()
+        self.archive_check = None # ArchiveCheck fed from feed(), a pkg's TOC checksums without reading it back
+        self.extracted = []
+        self.extract_error = None # Download is fine but pulling files out of it failed
+        self.hold = False # complete() stops short of the rename, see BundleJob
+        self.held = False # Complete and waiting for commit(); its extraction stays open until then
+        self.journal_lost = False # .part without a usable journal, see recover_part
+        self.from_store = False
+        self.store = None # ContentStore shared by the manager, None = no dedupe
+        self.peers = None # LanPeers shared by the manager, None = CDN only
+        self.source = None # Peer object URL the bytes come from this attempt, None = self.url
+        self.source_digests = {} # What the peer's bytes must hash to, never taken from the peer itself
+        self.trusted_head = None # A pkg's header and TOC as the CDN serves them, for a peer copy with no digests
+        self.expected_digests = {} # Digests of this file known beforehand (the task's, from an earlier finish)
+        self.max_retries = RETRY_LIMIT
+        
+        self.is_paused = False
+        self.is_cancelled = False
+        self.is_running = False
+        self.active = False # Inside run(), the .part may still be written to
+        self.done = threading.Event()
+        
+        self.total_size = total_size or 0 # Known up front if the catalog probed it
+        self.downloaded_size = 0
+        self.start_time = 0
+        self.bytes_in_session = 0
+        self.speed = "0 KB/s"
+        self.eta = ""
+        self.speed_avg = 0.0 # EWMA, bytes/sec
+        self.last_sample_time = 0
+        self.last_sample_size = 0
+        
+        # Segmented mode: list of {'pos', 'end', 'busy'} byte ranges still to fetch
+        self.segment_count = SEGMENT_COUNT # Connections wanted, changed by tune() and shed_connection()
+        self.max_connections = SEGMENT_COUNT # Host budget the scheduler gave us
+        self.connections = 0 # Segment workers running
+        self.tune_start = 0
+        self.tune_bytes = 0
+        self.tune_rate = 0 # Bytes/sec in the last window
+        self.tune_probing = False # The last window ran with a connection on trial
+        self.tune_done = False # Found the plateau (or the server pushed back), stop probing
+        self.tune_gained = False # Some extra connection paid off
+        self.shed_time = 0
+        self.write_queue = WRITE_QUEUE_DEPTH
+        self.writer = None # BlockWriter while a transfer runs
+        self.rate_limiter = TokenBucket() # This task's own limit
+        self.global_limiter = None # Shared bucket from the manager
+        self.accept_ranges = False
+        self.segments = None
+        self.segments_total = 0
+        self.segment_errors = []
+        self.lock = threading.Lock()
+        
+        # Init state
+        if os.path.exists(self.journal_path):
+            self.load_journal(self.journal_path)
+        elif os.path.exists(self.part_path + ".segments"):
+            self.load_journal(self.part_path + ".segments") # Older sidecar, same ranges format
+        elif os.path.exists(self.part_path):
+            self.downloaded_size = os.path.getsize(self.part_path) # No journal, trust the file as before
+            self.journal_lost = True
+            
+    def run(self):
+        self.active = True
+        self.done.clear()
+        self.is_running = True
+        self.is_paused = False
+        self.is_cancelled = False
+        self.held = False
+        self.source = None
+        self.on_status("Downloading")
+        
+        try:
+            # Suppress SSL warnings globally for this job
+            import urllib3
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+            if self.resolve_stale:
+                self.refresh_request()
+            # Force HTTPS
+            self.url = force_https(self.url)
+
+            failures = 0
+            refreshed = False
+            while True:
+                before = self.downloaded_size
+                try:
+                    if self.run_transfer():
+                        return # Already in the download store
+                    break
+                except Exception as e:
+                    if self.source and not (self.is_cancelled or self.is_paused):
+                        self.drop_source(e) # LAN cache went away, the CDN takes over from here
+                        continue
+                    if self.resolver and is_forbidden(e) and not refreshed:
+                        refreshed = True
+                        self.refresh_request()
+                        continue
+                    if self.downloaded_size > before:
+                        failures = 0 # It was moving, only failures in a row count
+                    if self.is_cancelled or self.is_paused or not is_retryable(e) or failures >= self.max_retries:
+                        raise
+                    failures += 1
+                    self.checkpoint(force=True)
+                    self.wait_retry(retry_delay(failures, e), f"{e} (retry {failures}/{self.max_retries})")
+
+            if self.is_cancelled:
+                self.cleanup()
+                return
+            self.emit_progress(force=True)
+            if self.is_paused:
+                self.checkpoint(force=True)
+                self.on_status("Paused")
+                return # Exit run loop, state is saved on disk
+
+            # Success
+            self.complete()
+            self.report_finished()
+
+        except Exception as e:
+            print(f"Download Worker Error: {e}")
+            if not self.is_cancelled:
+                self.checkpoint(force=True) # Keep what we have for a retry
+            self.on_status("Error")
+            self.on_error(str(e))
+            self.is_running = False
+        finally:
+            if not self.held: self.stop_stage()
+            self.active = False
+            self.done.set()
+            self.on_stopped()
+
+    def run_transfer(self):
+        # One attempt from wherever the .part is. Returns True when the store already had the file
+        try:
+            self.probe()
+            if self.finish_from_store():
+                return True
+            self.load_chunklist()
+            self.recover_part()
+            self.find_source()
+            self.transfer()
+        except RemoteChanged as e:
+            # HEAD or a segment's If-Range says the file is not the one we started with
+            print(f"{e}, starting over")
+            self.restart()
+            if os.path.exists(self.chunklist_path): os.remove(self.chunklist_path) # Belongs to the old file
+            self.verifier = None
+            self.source = None
+            self.probe()
+            self.load_chunklist()
+            self.find_source()
+            self.transfer()
+        self.check_source()
+        return False
+
+    def fetch_url(self):
+        return self.source or self.url
+
+    def refresh_request(self):
+        # Recovery downloads: new asset tokens from the server the image came from
+        print(f"Asking for fresh download tokens for {os.path.basename(self.dest_path)}")
+        url, headers, chunklist = self.resolver()
+        self.url = force_https(url)
+        self.extra_headers = dict(headers or {})
+        self.chunklist = chunklist
+        self.resolve_stale = False
+
+    def trusted_digests(self):
+        # Digests a peer can't have made up: the task's own, or our store's for this exact URL and validators;
+        # only the ones this job computes too, or they couldn't be compared
+        digests = dict(self.expected_digests or {})
+        if self.store:
+            digest = self.store.keys.get(self.store_key())
+            if digest: digests.setdefault('sha256', digest)
+        return {name: digest for name, digest in digests.items() if name in self.hasher.algorithms}
+
+    def find_source(self):
+        # Another instance on the LAN has this exact file (same URL and validators): take the bytes from there,
+        # but only if they can be checked against something the peer doesn't control, else the CDN it is.
+        # A full installer pkg has no chunklist: its TOC, fetched from the CDN, checksums every file in it.
+        self.source = None
+        self.trusted_head = None
+        if not self.peers: return
+        key = self.store_key()
+        if key is None: return
+        trusted = self.trusted_digests()
+        toc_only = self.verifier is None and not trusted
+        if toc_only and not self.dest_path.lower().endswith('.pkg'): return
+        try:
+            found = self.peers.find(key)
+        except Exception as e:
+            print(f"Error asking LAN caches: {e}")
+            return
+        if not found or found[1].get('size') != self.total_size: return
+        offered = found[1].get('digests') or {}
+        if any(offered.get(name, digest) != digest for name, digest in trusted.items()):
+            self.peers.failed(found[0]) # Says it has another file than the one we know
+            return
+        if toc_only:
+            try:
+                self.trusted_head = self.fetch_trusted_head()
+            except Exception as e:
+                print(f"Error fetching the table of contents of {os.path.basename(self.dest_path)}: {e}")
+                return
+        self.source = found[0]
+        self.source_digests = trusted
+        print(f"{os.path.basename(self.dest_path)} is on the LAN cache at {urlparse(self.source).netloc}")
+
+    def fetch_range(self, offset, length):
+        # Bytes of the file as the CDN has them, same validators as the rest of the download
+        headers = self.request_headers({'Range': f"bytes={offset}-{offset + length - 1}"})
+        if self.if_range():
+            headers['If-Range'] = self.if_range()
+        response = requests.get(self.url, headers=headers, timeout=30, verify=False)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                if 'If-Range' in headers:
+                    raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+                raise IOError("Server ignored the byte range request")
+            if len(response.content) != length:
+                raise ConnectionClosed(f"Got {len(response.content)} of {length} bytes")
+            return response.content
+        finally:
+            response.close()
+
+    def fetch_trusted_head(self):
+        head = self.fetch_range(0, XAR_HEADER.size)
+        return head + self.fetch_range(len(head), toc_end(head) - len(head))
+
+    def drop_source(self, error):
+        print(f"LAN cache {urlparse(self.source).netloc} failed ({error}), continuing from the CDN")
+        self.peers.failed(self.source)
+        self.source = None
+
+    def check_source(self):
+        # A peer's bytes must hash to the digests we trust (a chunklisted image was checked chunk by chunk already);
+        # the journal still trusts them, so start over from the CDN
+        if not self.source or self.is_cancelled or self.is_paused: return
+        if self.hasher.offset < self.total_size: return
+        mine = self.hasher.hexdigests()
+        if any(mine[name] != digest for name, digest in self.source_digests.items() if name in mine):
+            self.restart() # run() drops the source on this error and starts over from the CDN
+            raise IOError(f"{os.path.basename(self.dest_path)} from the LAN cache doesn't match its digests")
+        if self.trusted_head is not None:
+            with open(self.part_path, 'rb') as f:
+                head = f.read(len(self.trusted_head))
+            if head != self.trusted_head:
+                self.restart()
+                raise IOError(f"{os.path.basename(self.dest_path)} from the LAN cache has another table of contents")
+
+    def complete(self):
+        # All bytes are in: final checks, then the .part becomes the real file
+        if self.verifier and not self.verifier.done:
+            raise IOError(f"Only {self.verifier.offset} of {self.verifier.total} bytes passed the chunklist check")
+        if self.dest_path.lower().endswith('.pkg'):
+            self.verify_pkg()
+        self.digests = self.hasher.hexdigests()
+        if self.hold:
+            self.checkpoint(force=True) # Part of a bundle: wait as a complete .part, see finish_held
+            self.held = True
+            return
+        self.commit()
+
+    def commit(self):
+        # The checked .part becomes the real file
+        if os.path.exists(self.dest_path):
+            os.remove(self.dest_path) # Prevent WinError 183
+        os.rename(self.part_path, self.dest_path)
+        self.remove_journal()
+        if self.store:
+            self.store.add(self.dest_path, self.store_key(), self.digests)
+        self.extract_payload()
+
+    def is_held(self):
+        # A bundle part that finished in an earlier run and waits as a complete .part
+        with self.lock:
+            if not self.total_size or not os.path.exists(self.part_path): return False
+            if self.segments is not None:
+                return not any(s['pos'] < s['end'] for s in self.segments)
+            return self.downloaded_size >= self.total_size
+
+    def finish_held(self):
+        # Same checks as a fresh completion, from disk and without the network
+        self.held = False
+        self.load_chunklist()
+        self.start_check()
+        self.feed_from_disk(self.total_size)
+        self.complete()
+
+    def pkg_results(self):
+        # From the bytes fed this run when they covered the whole file, else one more pass over the .part (a resume)
+        check, self.archive_check = self.archive_check, None
+        if check and check.offset == self.total_size:
+            return check.results()
+        return verify_archive(self.part_path)
+
+    def verify_pkg(self):
+        # Installer pkgs (xar) checksum every file in their TOC: check them before the download counts as done,
+        # and fetch a file's bytes again if they are bad
+        try:
+            results = self.pkg_results()
+        except XarError as e:
+            raise IOError(f"{os.path.basename(self.dest_path)} is damaged: {e}")
+        bad = [r for r in results if r['status'] == 'Bad']
+        unchecked = self.unchecked_ranges(results) if self.trusted_head is not None else []
+        self.source = None # Whatever came from a peer, repairs come from the CDN
+        for r in bad:
+            print(f"{r['path']} in {os.path.basename(self.dest_path)} fails its checksum, refetching it")
+            if r['path'] == TOC_ENTRY:
+                self.refetch_range(0, r['offset'] + r['length']) # Header, TOC and the digest stored after it
+            else:
+                self.refetch_range(r['offset'], r['length'])
+        if unchecked:
+            # The TOC vouched for the peer's copy, but not for files without a checksum or bytes between files
+            print(f"Fetching {len(unchecked)} unchecked range(s) of {os.path.basename(self.dest_path)} from the CDN")
+            for start, end in unchecked:
+                self.refetch_range(start, end - start)
+        if bad or unchecked:
+            self.reset_feed() # Digests (and a running extraction) saw the bad bytes
+            self.feed_from_disk(self.total_size)
+            try:
+                still = [r['path'] for r in self.pkg_results() if r['status'] == 'Bad']
+            except XarError as e:
+                raise IOError(f"{os.path.basename(self.dest_path)} is damaged: {e}")
+            if still:
+                raise IOError(f"{', '.join(still)} in {os.path.basename(self.dest_path)} still fail their checksum")
+
+    def unchecked_ranges(self, results):
+        # [[start, end]] of the pkg no checksum covers: the header and TOC were compared with the CDN's
+        checked = merge_extents([(0, len(self.trusted_head))] +
+                                [(r['offset'], r['offset'] + r['length']) for r in results if r['status'] in ('OK', 'Bad')])
+        gaps = []
+        pos = 0
+        for start, end in checked + [[self.total_size, self.total_size]]:
+            if start > pos:
+                gaps.append([pos, min(start, self.total_size)])
+            pos = max(pos, end)
+        return [g for g in gaps if g[0] < g[1]]
+
+    def refetch_range(self, offset, length):
+        headers = self.request_headers({'Range': f"bytes={offset}-{offset + length - 1}"})
+        if self.if_range():
+            headers['If-Range'] = self.if_range()
+        response = requests.get(self.fetch_url(), headers=headers, stream=True, timeout=30, verify=False)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                if 'If-Range' in headers:
+                    raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+                raise IOError("Server ignored the byte range request")
+            with open(self.part_path, 'r+b') as f:
+                f.seek(offset)
+                for data in response.iter_content(MAX_READ_SIZE):
+                    if self.is_cancelled: raise IOError("Cancelled")
+                    f.write(data[:offset + length - f.tell()])
+                if f.tell() < offset + length:
+                    raise ConnectionClosed(f"Connection closed early at byte {f.tell()}")
+        finally:
+            response.close()
+
+    def completed_ranges(self):
+        # [(start, end)] of the .part that are on disk according to the journal
+        with self.lock:
+            if self.segments is None:
+                return [(0, self.downloaded_size)] if self.downloaded_size else []
+            ranges, pos = [], 0
+            for s in sorted((s for s in self.segments if s['pos'] < s['end']), key=lambda s: s['pos']):
+                if s['pos'] > pos: ranges.append((pos, s['pos']))
+                pos = max(pos, s['end'])
+            if pos < self.segments_total: ranges.append((pos, self.segments_total))
+            return ranges
+
+    def start_stage(self):
+        # Extraction can only ride along when the stream starts at byte 0 and isn't rewritten by chunk repairs;
+        # otherwise it runs on the finished file
+        if self.extract and self.stage is None and self.verifier is None and self.hasher.offset == 0:
+            self.stage = ExtractStage(self.extract['dir'], self.extract.get('patterns') or DEFAULT_PATTERNS)
+
+    def start_check(self):
+        # A pkg's TOC checksums ride along the same way, when this run feeds it from byte 0
+        if not self.dest_path.lower().endswith('.pkg') or self.verifier is not None: return
+        if self.archive_check and self.archive_check.offset == self.hasher.offset: return # A retry, still in step
+        self.archive_check = ArchiveCheck() if self.hasher.offset == 0 else None
+
+    def stop_stage(self):
+        if self.stage:
+            self.stage.abort()
+            self.stage = None
+
+    def extract_payload(self):
+        if not self.extract: return
+        self.extract_error = None
+        stage, self.stage = self.stage, None
+        if stage:
+            try:
+                self.extracted = stage.finish()
+                return
+            except Exception as e:
+                print(f"Extracting while downloading failed ({e}), extracting from the file")
+        try:
+            self.extracted = extract(self.dest_path, self.extract['dir'], self.extract.get('patterns') or DEFAULT_PATTERNS)
+        except Exception as e:
+            print(f"Error extracting {os.path.basename(self.dest_path)}: {e}") # The download itself is fine
+            self.extract_error = str(e) or type(e).__name__
+
+    def report_finished(self):
+        self.on_status("Finished")
+        self.on_finished()
+        self.is_running = False
+
+    def wait_retry(self, delay, reason):
+        print(f"Download interrupted: {reason}, reconnecting in {delay:.0f}s")
+        self.on_status(f"Retrying in {delay:.0f}s")
+        self.nap(delay)
+        if not (self.is_cancelled or self.is_paused):
+            self.on_status("Downloading")
+
+    def nap(self, delay):
+        # Sleep that pause/cancel can cut short
+        end = time.time() + delay
+        while time.time() < end and not (self.is_cancelled or self.is_paused):
+            time.sleep(0.1)
+
+    def request_headers(self, extra=None):
+        headers = {
+            'User-Agent': 'InternetRecovery/1.0'
+        }
+        if not self.source:
+            headers.update(self.extra_headers) # Asset tokens are for Apple, not for LAN peers
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def probe(self):
+        # Check total size, range support and validators (HEAD request) - MUST use verify=False
+        try:
+            head = requests.head(self.url, headers=self.request_headers(), allow_redirects=True, verify=False, timeout=10)
+        except:
+            return # HEAD failed, ignore and rely on GET (If-Range still protects the resume)
+        self.read_head(head.headers)
+
+    def read_head(self, headers):
+        if 'content-length' in headers:
+            self.total_size = int(headers.get('content-length'))
+        self.accept_ranges = headers.get('accept-ranges', '').lower() == 'bytes'
+        self.check_validators(headers)
+
+    def store_key(self):
+        return store_key(self.url, self.etag, self.last_modified, self.total_size)
+
+    def finish_from_store(self):
+        # Same URL and validators already downloaded somewhere: link it here and we're done
+        if not self.link_from_store(): return False
+        self.emit_progress(force=True)
+        self.report_finished()
+        return True
+
+    def link_from_store(self):
+        # Shared by both engines; they report the finish themselves, from their own thread
+        found = self.store.lookup(self.store_key()) if self.store else None
+        if not found: return False
+        path, entry = found
+        self.from_store = True # Already in place, a bundle has nothing to commit for it
+        if os.path.abspath(path) != os.path.abspath(self.dest_path):
+            method = materialize(path, self.dest_path)
+            print(f"{os.path.basename(self.dest_path)} is already in the download store ({method})")
+        if os.path.exists(self.part_path): os.remove(self.part_path)
+        self.remove_journal()
+        
+        self.digests = dict(entry.get('digests', {}))
+        self.downloaded_size = self.total_size = entry['size']
+        self.extract_payload()
+        return True
+
+    def load_chunklist(self):
+        # Fetch (or reuse) the image's chunklist so every chunk can be checked as soon as it lands
+        if not self.chunklist or self.verifier: return
+        try:
+            cached = os.path.exists(self.chunklist_path)
+            if cached:
+                with open(self.chunklist_path, 'rb') as f:
+                    data = f.read()
+            else:
+                response = requests.get(force_https(self.chunklist['url']), headers=self.request_headers(self.chunklist.get('headers')), timeout=30, verify=False)
+                response.raise_for_status()
+                data = response.content
+            chunks = parse_chunklist(data)
+        except Exception as e:
+            print(f"Chunklist unavailable, downloading without chunk checks: {e}")
+            return
+        
+        total = chunklist_total(chunks)
+        if self.total_size and total != self.total_size:
+            print(f"Chunklist covers {total} bytes but the image is {self.total_size}, ignoring it")
+            return
+        if not cached:
+            try:
+                with open(self.chunklist_path, 'wb') as f:
+                    f.write(data) # Its asset token expires, keep it for resumes
+            except Exception as e:
+                print(f"Error saving chunklist: {e}")
+        
+        self.total_size = self.total_size or total
+        self.verifier = ChunkVerifier(chunks)
+        if not self.verifier.seek(self.hasher.offset):
+            self.hasher.reset() # Saved hash state isn't on a chunk boundary, check from the start
+        self.verified_hasher = self.hasher.copy()
+
+    def preflight(self):
+        # Size is known now: fail before downloading anything if it can't fit
+        if not self.total_size: return
+        ok, free, needed = check_disk_space(self.dest_path, self.total_size, self.total_size if self.extract else 0)
+        if not ok:
+            raise DiskFull(f"Not enough space for {os.path.basename(self.dest_path)}: "
+                           f"needs {format_size(needed)}, {format_size(free)} free")
+
+    def reserve(self, f):
+        # Preallocate the whole file; on file systems that can't, it stays sparse
+        try:
+            preallocate(f, self.total_size)
+        except OSError as e:
+            raise DiskFull(f"Not enough space for {os.path.basename(self.dest_path)}: {e}") from e
+
+    def transfer(self):
+        self.preflight()
+        self.start_stage()
+        self.start_check()
+        if self.use_segments():
+            self.download_segmented()
+        else:
+            self.download_single()
+
+    def check_validators(self, headers):
+        # Compare the server's ETag/Last-Modified with the ones the partial file was started with
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        resuming = self.downloaded_size > 0 or self.segments is not None
+        if resuming and ((self.etag and etag and etag != self.etag) or
+                         (not (self.etag and etag) and self.last_modified and last_modified and last_modified != self.last_modified)):
+            raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+        self.etag = etag or self.etag
+        self.last_modified = last_modified or self.last_modified
+
+    def if_range(self):
+        # Weak ETags aren't allowed in If-Range, fall back to the date
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def restart(self):
+        # Throw away the partial file and its journal
+        self.segments = None
+        self.segments_total = 0
+        self.downloaded_size = 0
+        self.etag = None
+        self.last_modified = None
+        self.reset_feed()
+        self.remove_journal()
+        if os.path.exists(self.part_path): os.remove(self.part_path)
+
+    def use_segments(self):
+        if self.segments is not None:
+            return self.segments_match()
+        if self.downloaded_size > 0:
+            return False # Old-style .part, keep appending to it
+        return self.accept_ranges and self.segment_count > 1 and self.total_size >= SEGMENTED_THRESHOLD
+
+    def segments_match(self):
+        # A segment file from a different object size is useless, start over
+        if self.total_size and self.segments_total != self.total_size:
+            self.restart()
+            return self.use_segments()
+        return True
+
+    def download_single(self):
+        headers = self.request_headers()
+        mode = 'wb'
+        if self.downloaded_size > 0:
+            headers['Range'] = f"bytes={self.downloaded_size}-"
+            if self.if_range():
+                headers['If-Range'] = self.if_range() # Changed file -> server sends it whole (200)
+            mode = 'r+b' # Continue at the journaled offset
+            
+        response = requests.get(self.fetch_url(), headers=headers, stream=True, timeout=30, verify=False)
+        response.raise_for_status()
+        
+        # If server doesn't support range (or the file changed), it sends 200 instead of 206
+        # We must detect this to verify resume support
+        is_resumed = (response.status_code == 206)
+        if self.downloaded_size > 0 and not is_resumed:
+            # Server ignored range, must restart
+            print(f"Server sent the whole file, restarting {os.path.basename(self.dest_path)}")
+            self.downloaded_size = 0
+            self.etag = None
+            self.last_modified = None
+            self.reset_feed()
+            mode = 'wb'
+        self.etag = self.etag or response.headers.get('etag')
+        self.last_modified = self.last_modified or response.headers.get('last-modified')
+        
+        # If total size was missing from HEAD, get from GET
+        if self.total_size == 0 and 'content-length' in response.headers:
+            self.total_size = int(response.headers['content-length']) + self.downloaded_size
+        
+        self.start_time = time.time()
+        self.bytes_in_session = 0
+        
+        try:
+            with open(self.part_path, mode, buffering=0) as f:
+                if mode == 'r+b':
+                    self.trim_part(f)
+                    f.seek(self.downloaded_size)
+                    if self.hasher.offset > self.downloaded_size:
+                        self.reset_feed()
+                    self.feed_from_disk(self.downloaded_size) # No saved hash state, rehash the prefix
+                if self.total_size:
+                    self.reserve(f)
+                    self.checkpoint(force=True) # The .part's length no longer says how much arrived
+                self.start_writer()
+                try:
+                    self.receive(response, f)
+                finally:
+                    self.stop_writer()
+        finally:
+            response.close()
+
+        if self.is_cancelled or self.is_paused:
+            return
+        if self.total_size and self.downloaded_size < self.total_size:
+            raise ConnectionClosed(f"Connection closed early ({self.downloaded_size} of {self.total_size} bytes)")
+
+    def trim_part(self, f):
+        # Resuming a single stream: bytes after the last checkpoint get overwritten anyway, and the journal says
+        # where valid data ends, so the preallocation stays. Only a file of unknown size loses its tail,
+        # since there the length is what marks the end
+        size = os.fstat(f.fileno()).st_size
+        if not self.total_size:
+            if size > self.downloaded_size: f.truncate(self.downloaded_size)
+        elif size > self.total_size:
+            f.truncate(self.total_size)
+
+    def download_segmented(self):
+        self.plan_segments()
+        self.downloaded_size = self.total_size - sum(s['end'] - s['pos'] for s in self.segments)
+        self.start_time = time.time()
+        self.bytes_in_session = 0
+        self.segment_errors = []
+        self.tune_start = 0 # Fresh measurement after a reconnect
+
+        self.start_writer() # One writer for all segment threads
+        try:
+            threads = []
+            def add_connection():
+                with self.lock: self.connections += 1
+                t = threading.Thread(target=self.segment_loop, daemon=True)
+                threads.append(t)
+                t.start()
+            for _ in range(self.segment_count): add_connection()
+            # Segment threads only count bytes, callbacks are made from this (the job's) thread
+            while any(t.is_alive() for t in threads):
+                next(t for t in threads if t.is_alive()).join(0.1)
+                self.emit_progress()
+                try:
+                    self.feed_frontier(HASH_CATCH_UP)
+                except Exception as e:
+                    self.segment_errors.append(e) # Stops the segment threads too
+                self.checkpoint()
+                if self.tune(): add_connection()
+        finally:
+            self.stop_writer()
+
+        if self.settle_segments():
+            self.feed_frontier() # Whatever the last segments left unhashed
+
+    def plan_segments(self):
+        if self.segments is not None: return
+        # Fresh start: split evenly and preallocate the whole .part
+        size = self.total_size
+        step = -(-size // self.segment_count)
+        step += -step % BLOCK_SIZE # Keep every write block aligned
+        self.segments = [{'pos': p, 'end': min(p + step, size), 'busy': False} for p in range(0, size, step)]
+        self.segments_total = size
+        with open(self.part_path, 'wb') as f:
+            self.reserve(f)
+        self.checkpoint(force=True)
+
+    def settle_segments(self):
+        # After the segment workers stopped: True when every range is in and the tail still needs hashing
+        with self.lock:
+            self.segments = [s for s in self.segments if s['pos'] < s['end']]
+            for s in self.segments: s['busy'] = False
+
+        if self.is_cancelled:
+            return False
+        if self.segment_errors and not self.is_paused:
+            raise self.segment_errors[0] # Remaining ranges are journaled by the caller
+        return not self.is_paused
+
+    def feed_frontier(self, limit=None):
+        # Segments land out of order: hash the contiguous done prefix, re-read from the page cache
+        with self.lock:
+            frontier = min((s['pos'] for s in self.segments if s['pos'] < s['end']), default=self.segments_total)
+        if self.hasher.offset > frontier:
+            self.reset_feed() # Journal and hash state disagree, rehash from the start
+        self.feed_from_disk(frontier, limit)
+
+    def feed_from_disk(self, end, limit=None):
+        # Hash what is already on disk between the hash offset and end (resume, or out of order segments)
+        start = self.hasher.offset
+        if limit: end = min(end, start + limit)
+        if start >= end: return
+        buf = bytearray(min(BLOCK_SIZE, end - start))
+        view = memoryview(buf)
+        with open(self.part_path, 'rb', buffering=0) as f:
+            f.seek(start)
+            while self.hasher.offset < end:
+                n = f.readinto(view[:min(len(buf), end - self.hasher.offset)])
+                if not n:
+                    raise IOError(f"{os.path.basename(self.part_path)} is shorter than expected")
+                self.feed(view[:n])
+
+    def feed(self, data):
+        # In-order consumer of the file: running digests, plus chunk checks when there is a chunklist
+        view = memoryview(data)
+        if self.stage:
+            self.stage.update(view) # Blocks while the extractor is a pipe's length behind
+        if self.archive_check:
+            self.archive_check.update(view)
+        while len(view):
+            if self.verifier is None or self.verifier.done:
+                self.hasher.update(view)
+                return
+            part = view[:self.verifier.room()]
+            self.hasher.update(part)
+            result = self.verifier.update(part)
+            if result is not None:
+                chunk, ok = result
+                if not ok:
+                    # Roll the digests back to the chunk start and continue with the good bytes
+                    self.hasher = self.verified_hasher.copy()
+                    self.hasher.update(self.repair_chunk(chunk))
+                self.verified_hasher = self.hasher.copy()
+            view = view[len(part):]
+
+    def reset_feed(self):
+        self.hasher.reset()
+        if self.verifier:
+            self.verifier.seek(0)
+            self.verified_hasher = self.hasher.copy()
+        if self.stage:
+            self.stop_stage() # Its output came from bytes that are being replaced
+            self.start_stage()
+        self.start_check()
+
+    def repair_chunk(self, chunk):
+        # A chunk failed its SHA-256: fetch just that range again instead of the whole image
+        offset, size, digest = chunk
+        print(f"Chunk at byte {offset} of {os.path.basename(self.dest_path)} is corrupt, refetching it")
+        if self.source:
+            self.drop_source("a chunk failed the chunklist") # Don't ask it again, the rest comes from the CDN
+        headers = self.request_headers({'Range': f"bytes={offset}-{offset + size - 1}"})
+        if self.if_range():
+            headers['If-Range'] = self.if_range()
+        
+        for attempt in range(CHUNK_RETRIES):
+            if self.is_cancelled: break
+            try:
+                response = requests.get(self.fetch_url(), headers=headers, timeout=30, verify=False)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                print(f"Chunk refetch failed: {e}")
+                continue
+            if response.status_code != 206:
+                if 'If-Range' in headers:
+                    raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+                raise IOError("Server ignored the byte range request")
+            
+            data = response.content
+            if len(data) == size and hashlib.sha256(data).digest() == digest:
+                with open(self.part_path, 'r+b', buffering=0) as f:
+                    f.seek(offset)
+                    f.write(data)
+                self.repaired_chunks += 1
+                return data
+        raise IOError(f"Chunk at byte {offset} is still corrupt after {CHUNK_RETRIES} attempts")
+
+    def segment_loop(self):
+        session = requests.Session()
+        failures = 0
+        retired = False
+        try:
+            with open(self.part_path, 'r+b', buffering=0) as f:
+                while not (self.is_cancelled or self.is_paused or self.segment_errors):
+                    if self.should_retire():
+                        retired = True
+                        break
+                    seg = self.claim_segment()
+                    if seg is None: break
+                    start = seg['pos']
+                    try:
+                        if self.fetch_segment(session, f, seg):
+                            retired = True # Unfinished range goes back to the others
+                            break
+                    except Exception as e:
+                        if is_overload(e) and self.shed_connection():
+                            retired = True
+                            break
+                        # Reconnect just this segment, the others keep going
+                        if seg['pos'] > start: failures = 0
+                        if not is_retryable(e) or failures >= self.max_retries: raise
+                        failures += 1
+                        print(f"Segment at byte {seg['pos']} interrupted: {e} (retry {failures}/{self.max_retries})")
+                        session.close()
+                        session = requests.Session()
+                        self.nap(retry_delay(failures, e)) # No callbacks from here, this isn't the job's thread
+                    finally:
+                        with self.lock: seg['busy'] = False
+        except Exception as e:
+            self.segment_errors.append(e)
+        finally:
+            session.close()
+            if not retired:
+                with self.lock: self.connections -= 1
+
+    def tune(self):
+        # Called every progress tick in segmented mode. Hill climb on measured throughput:
+        # put one more connection on trial per window, keep it while it pays off.
+        # Returns True when the caller should start another segment worker.
+        now = time.time()
+        if not self.tune_start:
+            self.tune_start, self.tune_bytes = now, self.bytes_in_session
+            return False
+        if now - self.tune_start < TUNE_INTERVAL: return False
+        rate = (self.bytes_in_session - self.tune_bytes) / (now - self.tune_start)
+        last = self.tune_rate
+        self.tune_start, self.tune_bytes, self.tune_rate = now, self.bytes_in_session, rate
+        if self.tune_done: return False
+        if self.rate_limiter.rate or (self.global_limiter and self.global_limiter.rate):
+            return False # Throughput is capped by us, more connections can't show a gain
+
+        with self.lock:
+            if self.tune_probing:
+                self.tune_probing = False
+                if rate < last * (1 + TUNE_MIN_GAIN):
+                    # Past the knee: drop the trial connection and stay here
+                    self.segment_count = max(1, self.segment_count - 1)
+                    self.tune_done = True
+                    return False
+                self.tune_gained = True
+                if self.segment_count >= self.max_connections:
+                    self.tune_done = True # Still gaining at the host budget, that's the best we can measure
+                    return False
+            if self.segment_count >= self.max_connections:
+                return False
+            remaining = sum(s['end'] - s['pos'] for s in self.segments)
+            if remaining < 2 * MIN_STEAL_SIZE * (self.segment_count + 1):
+                return False # Too little left to tell
+            self.segment_count += 1
+            self.tune_probing = True
+            return True
+
+    def should_retire(self):
+        # More workers than wanted: the caller stops and leaves its range to the others
+        with self.lock:
+            if self.connections > self.segment_count:
+                self.connections -= 1
+                return True
+            return False
+
+    def shed_connection(self):
+        # 429/503 on a segment: one connection fewer, unless this is the last one or we just dropped
+        # one (a burst of 429s is one complaint). Otherwise the caller backs off and retries.
+        with self.lock:
+            self.tune_done = True
+            self.tune_probing = False
+            if self.connections <= 1 or time.time() - self.shed_time < TUNE_INTERVAL: return False
+            self.shed_time = time.time()
+            self.segment_count = min(self.segment_count, self.connections - 1)
+            self.connections -= 1
+            print(f"Server is overloaded, down to {self.segment_count} connection(s)")
+            return True
+
+    def learned_connections(self):
+        # Connection count worth remembering for this host, None if this run measured nothing
+        return self.segment_count if self.tune_done or self.tune_gained else None
+
+    def claim_segment(self):
+        with self.lock:
+            for seg in self.segments:
+                if not seg['busy'] and seg['pos'] < seg['end']:
+                    seg['busy'] = True
+                    return seg
+
+            # Nothing left unclaimed: steal the back half of the biggest running segment
+            busy = [s for s in self.segments if s['busy']]
+            if not busy: return None
+            victim = max(busy, key=lambda s: s['end'] - s['pos'])
+            remaining = victim['end'] - victim['pos']
+            if remaining < 2 * MIN_STEAL_SIZE: return None
+            
+            mid = victim['pos'] + remaining // 2
+            mid -= mid % BLOCK_SIZE
+            if mid < victim['pos'] + BLOCK_SIZE: return None # Owner may already hold this block in its buffer
+            seg = {'pos': mid, 'end': victim['end'], 'busy': True}
+            victim['end'] = mid # Owner notices the new end and stops early
+            self.segments.append(seg)
+            return seg
+
+    def fetch_segment(self, session, f, seg):
+        headers = self.request_headers({'Range': f"bytes={seg['pos']}-{seg['end'] - 1}"})
+        if self.if_range():
+            headers['If-Range'] = self.if_range()
+        response = session.get(self.fetch_url(), headers=headers, stream=True, timeout=30, verify=False)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                if 'If-Range' in headers:
+                    raise RemoteChanged(f"{os.path.basename(self.dest_path)} changed on the server")
+                raise IOError("Server ignored the byte range request")
+            if self.receive(response, f, seg):
+                return True # Retired mid-range
+        finally:
+            response.close()
+
+        if seg['pos'] < seg['end'] and not (self.is_cancelled or self.is_paused or self.segment_errors):
+            raise ConnectionClosed(f"Connection closed early at byte {seg['pos']}")
+
+    def receive(self, response, f, seg=None):
+        # Fills a block buffer straight from the socket and hands it to the writer a block at a time.
+        # seg: segmented mode, write at seg['pos'] and stop at seg['end'] (which may shrink when stolen).
+        # Returns True when a segment worker stopped early because there are more connections than wanted
+        readinto = get_readinto(response)
+        buf = self.writer.buffer() if self.writer else bytearray(BLOCK_SIZE)
+        view = memoryview(buf)
+        read_size = MIN_READ_SIZE
+        filled = 0
+        sent = seg['pos'] if seg is not None else 0 # Start of the next block; seg['pos'] lags while blocks are queued
+
+        try:
+            while not (self.is_cancelled or self.is_paused or self.segment_errors):
+                want = min(read_size, BLOCK_SIZE - filled)
+                if seg is not None:
+                    want = min(want, seg['end'] - sent - filled)
+                    if want <= 0: break
+
+                n = readinto(view[filled:filled + want])
+                if not n: break
+                filled += n
+                self.throttle(n)
+
+                # Adapt to the link: grow while reads come back full, shrink when they trickle
+                if n == want and read_size < MAX_READ_SIZE:
+                    read_size *= 2
+                elif n < want // 4 and read_size > MIN_READ_SIZE:
+                    read_size //= 2
+
+                if filled == BLOCK_SIZE:
+                    buf = self.put_block(f, buf, filled, seg)
+                    view = memoryview(buf)
+                    sent += filled
+                    filled = 0
+                    if seg is not None and self.should_retire():
+                        return True
+
+            if filled:
+                self.put_block(f, buf, filled, seg)
+        finally:
+            if self.writer:
+                self.writer.flush() # Nothing of ours may land after we return (a retry restarts at seg['pos'])
+
+    def put_block(self, f, buf, n, seg=None):
+        # Queue a full buffer for writing and return an empty one. Inline when there is no writer
+        if self.writer is None:
+            self.write_block(f, memoryview(buf), n, seg)
+        else:
+            self.writer.submit(lambda view, n: self.write_block(f, view, n, seg), buf, n) # Blocks while the queue is full
+            buf = self.writer.buffer()
+        if seg is None:
+            self.emit_progress() # Single stream: this is the job's thread
+        return buf
+
+    def start_writer(self):
+        self.writer = BlockWriter(self.write_queue) if self.write_queue > 0 else None
+
+    def stop_writer(self):
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+    def throttle(self, n):
+        stop = lambda: self.is_cancelled or self.is_paused
+        self.rate_limiter.consume(n, stop)
+        if self.global_limiter:
+            self.global_limiter.consume(n, stop)
+
+    def write_block(self, f, view, n, seg=None):
+        # On the writer thread when there is one: no callbacks from here
+        if seg is None:
+            f.write(view[:n])
+            self.feed(view[:n]) # After the write, so a repaired chunk isn't overwritten
+            self.count_bytes(n)
+            self.checkpoint()
+            return
+
+        with self.lock:
+            n = min(n, seg['end'] - seg['pos']) # Back half may have been stolen meanwhile
+            pos = seg['pos']
+        if n <= 0: return
+        if hasattr(os, 'pwrite'):
+            os.pwrite(f.fileno(), view[:n], pos)
+        else:
+            f.seek(pos)
+            f.write(view[:n])
+        with self.lock:
+            seg['pos'] += n
+        self.count_bytes(n)
+
+    def load_journal(self, path):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.etag = data.get('etag')
+            self.last_modified = data.get('last_modified')
+            self.hasher.restore(data.get('hash'))
+            if data.get('remaining') is not None:
+                self.segments_total = data['total']
+                self.segments = [{'pos': pos, 'end': end, 'busy': False} for pos, end in data['remaining']]
+                self.downloaded_size = self.segments_total - sum(s['end'] - s['pos'] for s in self.segments)
+            else:
+                # Only the checkpointed prefix is trusted, a crash may have left a torn tail
+                on_disk = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+                self.downloaded_size = min(data.get('verified', 0), on_disk)
+            self.total_size = self.total_size or data.get('total', 0)
+        except Exception as e:
+            print(f"Error loading journal: {e}")
+            self.segments = None
+            self.downloaded_size = 0
+            self.hasher.reset()
+            self.journal_lost = os.path.exists(self.part_path)
+
+    def checkpoint(self, force=False):
+        # Flush the .part to disk first, so the journal never claims bytes that aren't there
+        now = time.time()
+        if not force and now - self.last_checkpoint < JOURNAL_INTERVAL:
+            return
+        self.last_checkpoint = now
+        if not os.path.exists(self.part_path):
+            return
+
+        # With a chunklist only verified chunks count, a resume continues at the last good boundary
+        hasher = self.verified_hasher if self.verifier else self.hasher
+        with self.lock:
+            data = {
+                'url': self.url,
+                'total': self.segments_total if self.segments is not None else self.total_size,
+                'etag': self.etag,
+                'last_modified': self.last_modified,
+                'verified': hasher.offset if self.verifier and self.segments is None else self.downloaded_size,
+                'remaining': None if self.segments is None else merge_extents([s['pos'], s['end']] for s in self.segments),
+                'hash': hasher.state(), # Covers hash.offset bytes, always <= what is on disk
+            }
+        try:
+            fd = os.open(self.part_path, os.O_RDWR)
+            try: os.fsync(fd)
+            finally: os.close(fd)
+
+            tmp_path = self.journal_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno()) # Or a crash right after the rename can leave an empty journal
+            os.replace(tmp_path, self.journal_path) # Atomic, a crash leaves the old or the new journal
+            fsync_dir(self.journal_path)
+        except Exception as e:
+            print(f"Error saving journal: {e}")
+
+    def recover_part(self):
+        # The .part is there but its journal isn't (crash before the first checkpoint, deleted,
+        # unreadable). A preallocated .part is full length, so its size says nothing about what arrived.
+        if not self.journal_lost: return
+        self.journal_lost = False
+        size = os.path.getsize(self.part_path) if os.path.exists(self.part_path) else 0
+        if not self.total_size or size < self.total_size:
+            return # Written front to back without preallocation, the length is the progress
+        if self.verifier and self.accept_ranges:
+            self.salvage_chunks()
+        else:
+            print(f"{os.path.basename(self.part_path)} has no journal, starting over")
+            self.restart()
+
+    def salvage_chunks(self):
+        # Every chunk that still matches the chunklist is kept, the rest becomes the missing extents
+        missing = []
+        buf = bytearray(BLOCK_SIZE)
+        view = memoryview(buf)
+        with open(self.part_path, 'rb', buffering=0) as f:
+            for offset, length, digest in self.verifier.chunks:
+                if self.is_cancelled or self.is_paused:
+                    missing.append([offset, self.total_size]) # Rest is checked next time
+                    break
+                h = hashlib.sha256()
+                f.seek(offset)
+                left = length
+                while left:
+                    n = f.readinto(view[:min(len(buf), left)])
+                    if not n: break
+                    h.update(view[:n])
+                    left -= n
+                if left or h.digest() != digest:
+                    missing.append([offset, offset + length])
+
+        with self.lock:
+            self.segments = [{'pos': start, 'end': end, 'busy': False} for start, end in merge_extents(missing)]
+            self.segments_total = self.total_size
+            self.downloaded_size = self.total_size - sum(s['end'] - s['pos'] for s in self.segments)
+        self.reset_feed()
+        print(f"{os.path.basename(self.part_path)} had no journal, kept {format_size(self.downloaded_size)} that match the chunklist")
+        self.checkpoint(force=True)
+
+    def remove_journal(self):
+        for path in (self.journal_path, self.part_path + ".segments"):
+            if os.path.exists(path): os.remove(path)
+
+    def count_bytes(self, n):
+        with self.lock:
+            self.downloaded_size += n
+            self.bytes_in_session += n
+
+    def emit_progress(self, force=False):
+        now = time.time()
+        if not self.last_sample_time:
+            self.last_sample_time = self.start_time or now
+            self.last_sample_size = self.downloaded_size
+        interval = now - self.last_sample_time
+        if interval < PROGRESS_INTERVAL and not force:
+            return
+        downloaded = self.downloaded_size
+        
+        # Calculate Speed (EWMA over samples, steadier than the session average)
+        if interval > 0:
+            sample = (downloaded - self.last_sample_size) / interval
+            if self.speed_avg:
+                self.speed_avg = SPEED_SMOOTHING * sample + (1 - SPEED_SMOOTHING) * self.speed_avg
+            else:
+                self.speed_avg = sample
+            self.speed = self.format_speed(self.speed_avg)
+            if self.total_size > 0 and self.speed_avg > 0:
+                self.eta = format_eta((self.total_size - downloaded) / self.speed_avg)
+        self.last_sample_time = now
+        self.last_sample_size = downloaded
+             
+        try:
+            if self.total_size > 0:
+                pct = int((float(downloaded) / float(self.total_size)) * 100)
+                if pct < 0: pct = 0
+                if pct > 100: pct = 100
+            else:
+                pct = 0
+                
+            self.on_progress(int(pct), self.speed, int(downloaded), int(self.total_size), self.eta)
+        except Exception:
+            pass # Avoid overflow errors disrupting logic
+
+    def pause(self):
+        self.is_paused = True
+    
+    def cancel(self):
+        self.is_cancelled = True
+        
+    def cleanup(self):
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        self.remove_journal()
+        if self.chunklist and os.path.exists(self.chunklist_path):
+            os.remove(self.chunklist_path)
+        if os.path.exists(self.dest_path):
+            os.remove(self.dest_path)
+
+    def format_speed(self, bytes_per_sec):
+        if bytes_per_sec > 1024 * 1024:
+            return f"{bytes_per_sec / (1024*1024):.1f} MB/s"
+        elif bytes_per_sec > 1024:
+            return f"{bytes_per_sec / 1024:.1f} KB/s"
+        else:
+            return f"{bytes_per_sec:.0f} B/s"
+
+    def set_status(self, status):
+        self.on_status(status)
+
+def bundle_files(task):
+    # The task's own file first, then its companions ({'url', 'path', 'headers', 'optional'})
+    main = {'url': task['url'], 'path': task['path'], 'size': task.get('size', 0),
+            'headers': task.get('headers'), 'chunklist': task.get('chunklist')}
+    return [main] + list(task['files'])
+
+class BundleJob(DownloadJob):
+    """All files of one product as one job: the image plus small companions (dist, plists...).
+    files: [{'url', 'path', 'size', 'headers', 'chunklist', 'optional'}], the first is the image
+    and gives the bundle its path. Parts download in parallel, progress is their sum, and
+    nothing is moved into place until every required part is complete and checked."""
+    part_class = DownloadJob
+
+    def __init__(self, files, hashes=HASH_ALGORITHMS):
+        main = files[0]
+        super().__init__(main['url'], main['path'], main.get('size', 0), main.get('headers'), hashes, main.get('chunklist'))
+        self.files = files
+        self.parts = []
+        for spec in files:
+            part = self.part_class(spec['url'], spec['path'], spec.get('size', 0), spec.get('headers'),
+                                   hashes if spec is main else (), spec.get('chunklist'))
+            part.hold = True
+            part.optional = spec.get('optional', False)
+            self.parts.append(part)
+        self.segments = None
+        self.add_sizes()
+
+    def add_sizes(self):
+        self.downloaded_size = sum(p.downloaded_size for p in self.parts)
+        self.total_size = sum(p.total_size for p in self.parts)
+
+    def run(self):
+        self.active = True
+        self.done.clear()
+        self.is_running = True
+        self.is_paused = False
+        self.is_cancelled = False
+        self.on_status("Downloading")
+
+        try:
+            main = self.parts[0]
+            for part in self.parts:
+                part.is_paused = part.is_cancelled = False
+                part.rate_limiter = self.rate_limiter # One task limit for the whole bundle
+                part.global_limiter = self.global_limiter
+                part.store = self.store
+                part.peers = self.peers
+                part.max_retries = self.max_retries
+                part.write_queue = self.write_queue
+                part.failure = None
+                part.from_store = False
+                part.on_error = lambda message, part=part: setattr(part, 'failure', message)
+            main.segment_count = self.segment_count
+            main.max_connections = self.max_connections
+            main.extract = self.extract
+            main.expected_digests = self.expected_digests
+
+            threads = []
+            for part in self.parts:
+                target = part.finish_held if part.is_held() else part.run
+                threads.append(threading.Thread(target=self.run_part, args=(part, target), daemon=True))
+            self.start_time = time.time()
+            for t in threads: t.start()
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.1)
+                    self.add_sizes()
+                    self.emit_progress()
+
+            self.add_sizes()
+            if self.is_cancelled:
+                self.cleanup()
+                return
+            self.emit_progress(force=True)
+            if self.is_paused:
+                self.on_status("Paused")
+                return
+
+            failed = [p for p in self.parts if p.failure and not p.optional]
+            if failed:
+                raise IOError(f"{os.path.basename(failed[0].dest_path)}: {failed[0].failure}")
+            for part in self.parts:
+                if part.failure:
+                    print(f"Skipping optional {os.path.basename(part.dest_path)}: {part.failure}")
+                    part.cleanup()
+
+            # Everything is in and checked: move the files into place together
+            for part in self.parts:
+                if not (part.failure or part.from_store):
+                    part.commit()
+            self.digests = dict(main.digests)
+            self.extracted = main.extracted
+            self.extract_error = main.extract_error
+            self.learned = main.learned_connections()
+            self.report_finished()
+
+        except Exception as e:
+            print(f"Download Worker Error: {e}")
+            self.on_status("Error")
+            self.on_error(str(e))
+            self.is_running = False
+        finally:
+            for part in self.parts:
+                part.stop_stage() # Held extraction of a bundle that didn't get committed
+            self.active = False
+            self.done.set()
+            self.on_stopped()
+
+    def run_part(self, part, target):
+        try:
+            target()
+        except Exception as e:
+            part.failure = str(e)
+        if part.failure and not part.optional and not (self.is_paused or self.is_cancelled):
+            # A required file failed: stop the others where they are, the task resumes as a whole
+            for other in self.parts:
+                other.pause()
+
+    async def run_async(self):
+        # Async engine: the parts are plain threaded jobs, run the bundle off the loop
+        import asyncio
+        await asyncio.get_running_loop().run_in_executor(None, self.run)
+
+    def learned_connections(self):
+        return getattr(self, 'learned', None)
+
+    def pause(self):
+        self.is_paused = True
+        for part in self.parts: part.pause()
+
+    def cancel(self):
+        self.is_cancelled = True
+        for part in self.parts: part.cancel()
+
+    def cleanup(self):
+        for part in self.parts: part.cleanup()
+
+class DownloadQueue:
+    def __init__(self, spawn=None):
+        # spawn(task, job) runs job.run() somewhere; default is a plain thread, the GUI uses QThreads
+        self.spawn = spawn or self.spawn_thread
+        self.on_task_added = _ignore # task, when loaded from disk
+        self.on_job_started = _ignore # task, when the scheduler gives it a (new) job
+        self.on_task_changed = _ignore # task, status changed outside of a job (running elsewhere, taken over)
+        
+        self.lock = threading.RLock()
+        self.downloads = [] 
+        self.claims = {} # path -> (FileLock, task) for tasks this process is running
+        self.next_order = 0 # FIFO position within a priority
+        self.global_limiter = TokenBucket() # Shared by every job
+        self.engine = None # AsyncDownloadEngine when config.ini says engine = async
+        self.lan_server = None # LanCacheServer when config.ini says lan_cache = on
+        self.lan_peers = None
+        try:
+            self.db = DownloadDatabase(DOWNLOAD_DB_FILE)
+        except Exception as e:
+            print(f"Error opening download database, the queue won't be kept: {e}")
+            self.db = DownloadDatabase(":memory:")
+        self.load_settings()
+        self.load_state()
+        # Structure: { 'url':str, 'path':str, 'name':str, 'priority':int, 'order':int, 'job':DownloadJob, 'worker':front-end handle, 'thread':Obj, 'status':str }
+
+    def load_settings(self):
+        config = configparser.ConfigParser()
+        try: config.read(CONFIG_FILE)
+        except Exception: pass
+        section = config['Downloads'] if config.has_section('Downloads') else {}
+        try:
+            self.max_active = max(1, int(section.get('max_active', MAX_ACTIVE_DOWNLOADS)))
+            self.max_host_connections = max(1, int(section.get('max_host_connections', MAX_HOST_CONNECTIONS)))
+        except ValueError:
+            self.max_active = MAX_ACTIVE_DOWNLOADS
+            self.max_host_connections = MAX_HOST_CONNECTIONS
+        
+        try: self.max_retries = max(0, int(section.get('retries', RETRY_LIMIT)))
+        except ValueError: self.max_retries = RETRY_LIMIT
+        try: self.write_queue = max(0, int(section.get('write_queue', WRITE_QUEUE_DEPTH)))
+        except ValueError: self.write_queue = WRITE_QUEUE_DEPTH
+        
+        # Rates are KB/s, 0 = unlimited
+        try: self.rate_limit = max(0, int(section.get('rate_limit', 0)))
+        except ValueError: self.rate_limit = 0
+        try: self.task_rate_limit = max(0, int(section.get('task_rate_limit', 0)))
+        except ValueError: self.task_rate_limit = 0
+        self.rate_windows = parse_rate_windows(section.get('rate_windows', ''))
+        # Content-addressed store, dedupes the same file requested into different folders
+        store_dir = section.get('store_dir', '') or os.path.join(get_config_dir(), "store")
+        if section.get('store', 'on').lower() in ('0', 'off', 'false', 'no'):
+            self.store = None
+        elif not getattr(self, 'store', None) or self.store.root != store_dir:
+            self.store = ContentStore(store_dir)
+            self.store.prune()
+        
+        self.configure_lan(section)
+        
+        # engine = async runs every job on one event loop thread instead of a thread per job
+        if section.get('engine', 'threads').lower() == 'async':
+            if self.engine is None:
+                from .AsyncDownloadEngine import AsyncDownloadEngine
+                self.engine = AsyncDownloadEngine()
+        else:
+            if self.engine is not None:
+                self.retire_engine(self.engine)
+            self.engine = None
+        
+        hashes = section.get('hashes', ','.join(HASH_ALGORITHMS))
+        self.hash_algorithms = tuple(h.strip().lower() for h in hashes.split(',') if h.strip())
+        self.apply_rate_limit()
+
+    def configure_lan(self, section):
+        # lan_cache = on serves the store to other instances (lan_cache_port, lan_cache_bind);
+        # lan_peers = host:port, ... and lan_discovery = on (multicast, off by default) decide who is asked before the CDN
+        serve = section.get('lan_cache', 'off').lower() in ('1', 'on', 'true', 'yes') and self.store is not None
+        try: port = int(section.get('lan_cache_port', LAN_CACHE_PORT))
+        except ValueError: port = LAN_CACHE_PORT
+        bind = section.get('lan_cache_bind', '0.0.0.0')
+        discover = section.get('lan_discovery', 'off').lower() in ('1', 'on', 'true', 'yes')
+        static = parse_peers(section.get('lan_peers', ''))
+        
+        server = self.lan_server
+        if server and (not serve or server.store is not self.store or (server.port, server.bind) != (port, bind)):
+            server.stop()
+            server = None
+        if serve and server is None:
+            try:
+                server = LanCacheServer(self.store, port, bind)
+                server.start()
+            except OSError as e:
+                print(f"Error starting LAN cache on port {port}: {e}")
+                server = None
+        self.lan_server = server
+        
+        if self.lan_peers:
+            self.lan_peers.stop()
+        self.lan_peers = LanPeers(static, discover, server) if (static or discover) else None
+
+    def retire_engine(self, engine):
+        # Jobs already on the loop finish there, then its loop thread and pool go away
+        jobs = [t['job'] for t in self.downloads if t.get('job') and t['job'].active and getattr(t['job'], 'pool', None) is engine.pool]
+        def stop_when_done():
+            for job in jobs: job.done.wait()
+            engine.stop()
+        threading.Thread(target=stop_when_done, name="download-loop-stop", daemon=True).start()
+
+    def apply_rate_limit(self):
+        self.global_limiter.set_rate(rate_for_time(self.rate_windows, self.rate_limit) * 1024)
+
+    def tick(self):
+        # Periodic upkeep, every RATE_CHECK_INTERVAL: time-of-day rate windows, a progress checkpoint
+        # and whether tasks running in the other process have been let go
+        self.apply_rate_limit()
+        self.save_progress()
+        self.poll_elsewhere()
+
+    def set_rate_limit(self, kb_per_sec):
+        # Global limit, takes effect on running downloads immediately
+        self.rate_limit = max(0, int(kb_per_sec))
+        self.apply_rate_limit()
+
+    @locked
+    def set_task_rate_limit(self, task, kb_per_sec):
+        task['rate_limit'] = max(0, int(kb_per_sec))
+        if task['job']:
+            task['job'].rate_limiter.set_rate(self.task_rate(task))
+        self.save_task(task)
+
+    def task_rate(self, task):
+        return (task.get('rate_limit') or self.task_rate_limit) * 1024
+
+    def set_max_active(self, count):
+        self.max_active = max(1, int(count))
+        self.schedule()
+
+    @locked
+    def start_download(self, url, dest_path, name="Unknown", size=0, headers=None, priority=0, chunklist=None, extract=None, files=None, recovery=None):
+        # Check if already exists in list (resume case handled separately)
+        for task in self.downloads:
+            if task['path'] == dest_path and task['status'] not in ['Cancelled', 'Finished']:
+                if task['status'] in ['Paused', 'Error']:
+                    self.resume_download(task)
+                return task
+
+        task = {
+            'url': url,
+            'path': dest_path,
+            'name': name,
+            'size': size,
+            'headers': headers or {},
+            'chunklist': chunklist, # {'url', 'headers'}, lets the job check each chunk as it lands
+            'extract': extract, # {'dir', 'patterns'}, files to pull out of an installer pkg
+            'files': files, # Companion files downloaded with it as one BundleJob, see bundle_files
+            'recovery': recovery, # {'board_id', 'mlb', 'os_type'}, resolved again when its tokens are old
+            'resolved': time.time(), # When url/headers were resolved, not saved: a loaded task is always stale
+            'priority': priority,
+            'order': self.take_order(),
+            'job': None,
+            'worker': None,
+            'thread': None,
+            'status': 'Queued'
+        }
+        self.downloads.append(task)
+        
+        self.schedule()
+        self.save_task(task)
+        return task # No job while it waits in the queue, see on_job_started
+
+    def find_task(self, path):
+        for task in self.downloads:
+            if task['path'] == path:
+                return task
+        return None
+
+    def take_order(self):
+        self.next_order += 1
+        return self.next_order
+
+    # --- Scheduler ---
+    @locked
+    def schedule(self):
+        # Start queued tasks (highest priority, then FIFO) while slots and per-host connections allow
+        active = [t for t in self.downloads if t['status'] in ACTIVE_STATUSES]
+        queued = sorted((t for t in self.downloads if t['status'] == 'Queued'), key=self.queue_key)
+        self.release_claims()
+        
+        for task in queued:
+            if self.is_job_running(task):
+                continue # Previous job still winding down, it reschedules us when it stops
+            if self.store and any(t['url'] == task['url'] for t in active):
+                continue # Same file is already coming down, it will be linked from the store once done
+            if not self.claim(task):
+                task['status'] = ELSEWHERE # The GUI/daemon already writes this .part, tick() checks back
+                self.on_task_changed(task)
+                continue
+            
+            if len(active) >= self.max_active:
+                victim = self.preemption_victim(task, active)
+                if victim is None:
+                    self.unclaim(task)
+                    break # Everyone behind us has lower or equal priority too
+                self.preempt(victim)
+                active.remove(victim)
+            
+            free = self.max_host_connections - self.host_connections(task, active)
+            if free <= 0:
+                self.unclaim(task)
+                continue # Host is saturated, a task for another host may still fit
+            
+            self._launch(task, free)
+            active.append(task)
+
+    # --- Ownership: the GUI and the daemon share downloads.db, only one of them runs a task ---
+    def claim(self, task):
+        if task['path'] in self.claims: return True
+        lock = task_lock(task['path'])
+        try:
+            if not lock.acquire(blocking=False): return False
+        except OSError as e:
+            print(f"Error taking task lock, running it anyway: {e}")
+            return True
+        self.claims[task['path']] = (lock, task)
+        return True
+
+    def unclaim(self, task):
+        lock, _ = self.claims.pop(task['path'], (None, None))
+        if lock: lock.release()
+
+    def release_claims(self):
+        # Once a task's job has stopped (paused, finished, cancelled...) the other process may have it
+        for path, (lock, task) in list(self.claims.items()):
+            if not self.is_job_running(task) and task['status'] not in ACTIVE_STATUSES:
+                self.claims.pop(path)
+                lock.release()
+
+    def poll_elsewhere(self):
+        # Tasks the other process was running: once it lets go, pick up the row it left behind
+        with self.lock:
+            waiting = [t for t in self.downloads if t['status'] == ELSEWHERE]
+        if not waiting: return
+        for task in waiting:
+            if locked_elsewhere(task['path']): continue
+            try:
+                row = self.db.load_task(task['path'])
+            except Exception as e:
+                print(f"Error reloading task: {e}")
+                continue
+            with self.lock:
+                if task['status'] != ELSEWHERE: continue
+                if row is None: # It was cancelled over there
+                    task['status'] = 'Cancelled'
+                    if task in self.downloads: self.downloads.remove(task)
+                else:
+                    task.update(row, status=restored_status(row.get('status')))
+            self.on_task_changed(task)
+        self.schedule()
+
+    def queue_key(self, task):
+        return (-task.get('priority', 0), task.get('order', 0))
+
+    def preemption_victim(self, task, active):
+        # Lowest priority, most recently queued active task that is strictly less important
+        candidates = [t for t in active if t.get('priority', 0) < task.get('priority', 0)]
+        if not candidates: return None
+        return max(candidates, key=self.queue_key)
+
+    def preempt(self, task):
+        if task['job']:
+            task['job'].pause()
+        task['status'] = 'Queued' # Goes back in line, keeps its original order
+
+    def host_connections(self, task, active):
+        host = urlparse(task['url']).hostname
+        count = 0
+        for t in active:
+            if urlparse(t['url']).hostname == host:
+                count += t['job'].segment_count if t['job'] else 1
+        return count
+
+    def is_job_running(self, task):
+        job = task.get('job')
+        return bool(job) and job.active
+
+    def _launch(self, task, free):
+        if task.get('files'):
+            job = BundleJob(bundle_files(task), self.hash_algorithms)
+        else:
+            job_class = self.engine.job_class if self.engine else DownloadJob
+            job = job_class(task['url'], task['path'], task.get('size', 0), task.get('headers'),
+                            self.hash_algorithms, task.get('chunklist'))
+        # Start where this host did best last time, the job tunes from there within the free connections
+        job.segment_count = min(self.remembered_connections(task) or SEGMENT_COUNT, free)
+        job.max_connections = free
+        job.rate_limiter.set_rate(self.task_rate(task))
+        job.global_limiter = self.global_limiter
+        job.store = self.store
+        job.peers = self.lan_peers
+        job.expected_digests = dict(task.get('hashes') or {})
+        job.max_retries = self.max_retries
+        job.write_queue = self.write_queue
+        job.extract = task.get('extract')
+        if task.get('recovery'):
+            job.resolver = lambda: self.resolve_task(task)
+            job.resolve_stale = time.time() - task.get('resolved', 0) > RESOLVE_AGE
+        task['job'] = job
+        task['status'] = 'Pending'
+        
+        self.spawn(task, job)
+        self.on_job_started(task)
+
+    def spawn_thread(self, task, job):
+        # Headless: callbacks arrive on the job's thread, the queue methods lock
+        job.on_status = lambda status: self.job_status(task, job, status)
+        job.on_stopped = self.schedule # A slot may have opened up
+        if self.engine:
+            self.engine.start(job) # Shared event loop, no thread of its own
+            return
+        task['thread'] = threading.Thread(target=job.run, name=f"download-{task['name']}", daemon=True)
+        task['thread'].start()
+
+    @locked
+    def job_status(self, task, job, status):
+        if task.get('job') is not job: return # An older job of a re-queued task
+        
+        if status == 'Downloading':
+            if task['status'] == 'Pending': task['status'] = 'Downloading'
+            return
+        
+        if status == 'Finished':
+            task['hashes'] = dict(job.digests) # Computed in flight, no second pass over the file
+            task['extract_error'] = job.extract_error
+        
+        if status in ('Paused', 'Finished', 'Error'):
+            if status != 'Paused' or task['status'] != 'Queued': # Preempted tasks stay queued
+                task['status'] = status
+            self.schedule()
+            self.save_task(task)
+            self.remember_connections(task, job)
+            if status != 'Paused':
+                self.record(task, status)
+
+    @locked
+    def resume_download(self, task):
+        # Put the task back in the queue, the scheduler creates its new job/thread
+        if task['status'] in ACTIVE_STATUSES or task['status'] == 'Queued': return task
+        
+        task['status'] = 'Queued'
+        self.schedule()
+        self.save_task(task)
+        return task
+
+    @locked
+    def set_priority(self, task, priority):
+        task['priority'] = priority
+        self.schedule()
+        self.save_task(task)
+
+    @locked
+    def move_to_front(self, task):
+        # FIFO order within its priority, persisted with the queue
+        task['order'] = min((t.get('order', 0) for t in self.downloads), default=0) - 1
+        self.schedule()
+        self.save_task(task)
+
+    @locked
+    def pause_download(self, task):
+        if task['status'] == ELSEWHERE: return # Not ours to pause, the row belongs to the other process
+        if task['job'] and task['status'] in ACTIVE_STATUSES:
+            task['job'].pause()
+        task['status'] = 'Paused'
+        self.save_task(task)
+
+    @locked
+    def cancel_download(self, task):
+        if task['status'] == ELSEWHERE: return
+        if task['job']:
+            task['job'].cancel()
+        
+        # Mark cancelled logic handled in job cleanup, but we update list
+        task['status'] = 'Cancelled'
+        if task in self.downloads:
+            self.downloads.remove(task)
+        self.schedule()
+        self.save_task(task) # Drops its row
+        self.record(task, 'Cancelled')
+        
+    @locked
+    def pause_all(self):
+        for task in self.downloads:
+            if task['status'] in ACTIVE_STATUSES and task['job']:
+                task['job'].pause()
+            if task['status'] in ACTIVE_STATUSES or task['status'] == 'Queued':
+                task['status'] = 'Paused'
+        self.save_state()
+
+    def shutdown(self):
+        # App is quitting: remember the queue as it is, then let running jobs stop and journal their progress
+        with self.lock:
+            self.save_state()
+            running = [t for t in self.downloads if t['status'] in ACTIVE_STATUSES and t['job']]
+            for task in running:
+                task['job'].pause()
+        for task in running: # Unlocked, a stopping job may still report its status
+            task['job'].done.wait(SHUTDOWN_WAIT / 1000)
+        if self.lan_server:
+            self.lan_server.stop()
+        if self.lan_peers:
+            self.lan_peers.stop()
+
+    def load_state(self):
+        # Rows come back as they were saved, nothing is stat()ed here; a task's files are looked at when it runs
+        try:
+            if os.path.exists(DOWNLOAD_STATE_FILE) and self.db.is_empty():
+                print(f"Moved {self.db.import_json(DOWNLOAD_STATE_FILE)} downloads from {DOWNLOAD_STATE_FILE}")
+            rows = self.db.load_tasks()
+        except Exception as e:
+            print(f"Error loading state: {e}")
+            return
+        
+        for row in rows:
+            status = restored_status(row.get('status'))
+            if status != 'Finished' and locked_elsewhere(row['path']):
+                status = ELSEWHERE
+            task = dict(row, job=None, worker=None, thread=None, status=status)
+            task['order'] = task.get('order') or self.next_order + 1
+            self.next_order = max(self.next_order, task['order'])
+            self.downloads.append(task)
+            self.on_task_added(task)
+
+    def save_task(self, task):
+        # Row-level: only this task's row is written
+        job = task.get('job')
+        if job:
+            task['downloaded'] = job.downloaded_size
+            task['total'] = job.total_size
+        if task['status'] == ELSEWHERE: return # The process running it keeps the row up to date
+        try:
+            if task['status'] == 'Cancelled':
+                self.db.delete_task(task['path'])
+            else:
+                self.db.save_task(task)
+        except Exception as e:
+            print(f"Error saving state: {e}")
+
+    @locked
+    def save_state(self):
+        # Every task in one transaction (app closing, or several changed at once)
+        for task in self.downloads:
+            if task['job']:
+                task['downloaded'] = task['job'].downloaded_size
+                task['total'] = task['job'].total_size
+        try:
+            self.db.save_tasks([t for t in self.downloads if t['status'] not in ('Cancelled', ELSEWHERE)])
+        except Exception as e:
+            print(f"Error saving state: {e}")
+
+    def save_progress(self):
+        # Progress checkpoint of running tasks, so a crash still shows roughly where each one was
+        with self.lock:
+            progress = [(t['path'], t['job'].downloaded_size, t['job'].total_size)
+                        for t in self.downloads if t['status'] in ACTIVE_STATUSES and t['job']]
+        if not progress: return
+        try:
+            self.db.set_progress(progress)
+        except Exception as e:
+            print(f"Error saving progress: {e}")
+
+    def record(self, task, event):
+        try:
+            self.db.add_history(task, event)
+        except Exception as e:
+            print(f"Error saving download history: {e}")
+
+    def history(self, limit=100):
+        return self.db.history(limit)
+
+    def resolve_task(self, task):
+        # On the job's thread: fresh recovery URL and tokens, kept with the task
+        from .FetchRecoveryImages import resolve_download
+        url, headers, chunklist = resolve_download(task['recovery'])
+        with self.lock:
+            task.update(url=url, headers=headers, chunklist=chunklist, resolved=time.time())
+            self.save_task(task)
+        return url, headers, chunklist
+
+    def remembered_connections(self, task):
+        try:
+            return self.db.host_connections(urlparse(task['url']).hostname)
+        except Exception as e:
+            print(f"Error reading host settings: {e}")
+            return None
+
+    def remember_connections(self, task, job):
+        count = job.learned_connections()
+        if count is None: return
+        try:
+            self.db.set_host_connections(urlparse(task['url']).hostname, count)
+        except Exception as e:
+            print(f"Error saving host settings: {e}")
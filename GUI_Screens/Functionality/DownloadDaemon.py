@@ -0,0 +1,247 @@
+# GUI_Screens/Functionality/DownloadDaemon.py
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+
+from .DownloadCore import DownloadQueue, RATE_CHECK_INTERVAL, ACTIVE_STATUSES, get_config_dir, format_size, journal_progress
+
+# ---------------------------------------------------------
+# Headless download daemon, e.g. to pre-stage installers on a build server.
+# Runs the same DownloadQueue as the GUI (same downloads.db, same journals),
+# controlled over a local socket with one JSON line per request:
+#   {"cmd": "enqueue", "url": ..., "path": ..., "name": ..., "priority": 0, "extract": {"dir": ...},
+#    "files": [{"url": ..., "path": ..., "optional": true}]}
+#   {"cmd": "pause" | "resume" | "cancel", "path": ...}
+#   {"cmd": "status"} / {"cmd": "shutdown"}
+# Both can run at once: a task is only downloaded by the process holding its
+# lock (locks/ in the config dir), the other one lists it as "Running elsewhere"
+# until it's let go, then reloads its row.
+# Usage: python -m GUI_Screens.Functionality.DownloadDaemon serve|add|pause|resume|cancel|status|stop
+# ---------------------------------------------------------
+SOCKET_PATH = os.path.join(get_config_dir(), "daemon.sock")
+PORT_FILE = os.path.join(get_config_dir(), "daemon.port") # Windows: no unix sockets, localhost TCP instead
+USE_UNIX_SOCKET = hasattr(socket, "AF_UNIX") and sys.platform != "win32"
+ACCEPT_TIMEOUT = 1.0
+MAX_REQUEST = 64 * 1024
+
+def task_info(task):
+    info = {
+        'name': task.get('name', 'Unknown'),
+        'path': task['path'],
+        'url': task['url'],
+        'status': task['status'],
+        'priority': task.get('priority', 0),
+        'downloaded': 0,
+        'total': task.get('size', 0),
+        'speed': "",
+        'eta': "",
+        'extract_error': task.get('extract_error'), # Finished, but the files to extract didn't come out
+    }
+    job = task.get('job')
+    if job and task['status'] in ACTIVE_STATUSES:
+        info.update(downloaded=job.downloaded_size, total=job.total_size, speed=job.speed, eta=job.eta)
+    elif task['status'] == 'Finished' and os.path.exists(task['path']):
+        info['downloaded'] = info['total'] = os.path.getsize(task['path'])
+    else:
+        # Not running: the journal knows what's on disk, else the last progress saved in the database
+        done = journal_progress(task['path'] + ".part")
+        info['downloaded'] = done if done is not None else task.get('downloaded') or 0
+        info['total'] = task.get('total') or info['total']
+    return info
+
+class DownloadDaemon:
+    def __init__(self):
+        self.queue = DownloadQueue()
+        self.running = False
+        self.server = None
+
+    def handle(self, request):
+        cmd = request.get('cmd')
+        if cmd == 'enqueue':
+            if not request.get('url') or not request.get('path'):
+                return {'ok': False, 'error': "enqueue needs url and path"}
+            path = os.path.abspath(request['path'])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            task = self.queue.start_download(request['url'], path, request.get('name') or os.path.basename(path),
+                                             int(request.get('size', 0)), request.get('headers'),
+                                             int(request.get('priority', 0)), request.get('chunklist'), request.get('extract'),
+                                             request.get('files'), request.get('recovery'))
+            return {'ok': True, 'task': task_info(task)}
+
+        if cmd in ('pause', 'resume', 'cancel'):
+            task = self.queue.find_task(os.path.abspath(request.get('path', '')))
+            if task is None:
+                return {'ok': False, 'error': f"No download for {request.get('path')}"}
+            {'pause': self.queue.pause_download,
+             'resume': self.queue.resume_download,
+             'cancel': self.queue.cancel_download}[cmd](task)
+            return {'ok': True, 'task': task_info(task)}
+
+        if cmd == 'status':
+            return {'ok': True, 'tasks': [task_info(t) for t in sorted(self.queue.downloads, key=self.queue.queue_key)]}
+
+        if cmd == 'shutdown':
+            self.running = False
+            return {'ok': True}
+
+        return {'ok': False, 'error': f"Unknown command {cmd!r}"}
+
+    def listen(self):
+        if USE_UNIX_SOCKET:
+            if os.path.exists(SOCKET_PATH):
+                try:
+                    connect().close()
+                    raise RuntimeError(f"A daemon is already running on {SOCKET_PATH}")
+                except OSError:
+                    os.remove(SOCKET_PATH) # Left over from a crash
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(SOCKET_PATH)
+            os.chmod(SOCKET_PATH, 0o600)
+        else:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.bind(("127.0.0.1", 0))
+            with open(PORT_FILE, 'w') as f:
+                f.write(str(server.getsockname()[1]))
+        server.listen(8)
+        server.settimeout(ACCEPT_TIMEOUT)
+        return server
+
+    def serve(self):
+        self.server = self.listen()
+        self.running = True
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.stop)
+        self.queue.schedule() # Pick up whatever was queued when we last stopped
+        print(f"Download daemon listening on {SOCKET_PATH if USE_UNIX_SOCKET else PORT_FILE}")
+
+        next_tick = time.monotonic() + RATE_CHECK_INTERVAL / 1000
+        try:
+            while self.running:
+                if time.monotonic() >= next_tick:
+                    self.queue.tick()
+                    next_tick = time.monotonic() + RATE_CHECK_INTERVAL / 1000
+                try:
+                    conn, _ = self.server.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    if self.running: raise
+                    break
+                self.serve_client(conn)
+        finally:
+            self.close()
+
+    def serve_client(self, conn):
+        with conn:
+            try:
+                conn.settimeout(5)
+                reply = self.handle(json.loads(read_line(conn)))
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            try:
+                conn.sendall((json.dumps(reply) + "\n").encode('utf-8'))
+            except OSError as e:
+                print(f"Error answering daemon client: {e}")
+
+    def stop(self, *args):
+        self.running = False
+
+    def close(self):
+        print("Download daemon stopping...")
+        self.queue.shutdown()
+        if self.server:
+            self.server.close()
+        for path in (SOCKET_PATH if USE_UNIX_SOCKET else PORT_FILE,):
+            try: os.remove(path)
+            except OSError: pass
+
+def read_line(conn):
+    data = b""
+    while not data.endswith(b"\n"):
+        block = conn.recv(4096)
+        if not block: break
+        data += block
+        if len(data) > MAX_REQUEST:
+            raise ValueError("Request too large")
+    return data.decode('utf-8')
+
+def connect():
+    if USE_UNIX_SOCKET:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(SOCKET_PATH)
+    else:
+        with open(PORT_FILE, 'r') as f:
+            port = int(f.read().strip())
+        conn = socket.create_connection(("127.0.0.1", port))
+    return conn
+
+def send_command(request, timeout=10):
+    """Sends one request to a running daemon and returns its reply dict."""
+    with connect() as conn:
+        conn.settimeout(timeout)
+        conn.sendall((json.dumps(request) + "\n").encode('utf-8'))
+        return json.loads(read_line(conn))
+
+def print_tasks(tasks):
+    if not tasks:
+        print("No downloads.")
+        return
+    for t in tasks:
+        if t['total']:
+            progress = f"{format_size(t['downloaded'])} / {format_size(t['total'])} ({t['downloaded'] * 100 // t['total']}%)"
+        else:
+            progress = format_size(t['downloaded'])
+        extra = f"  {t['speed']}  ETA {t['eta']}" if t['status'] in ACTIVE_STATUSES else ""
+        print(f"[{t['status']:<11}] {t['name']}  {progress}{extra}")
+        print(f"              {t['path']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Hackintoshify download daemon")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="run the daemon in the foreground")
+    add = sub.add_parser("add", help="queue a download")
+    add.add_argument("url")
+    add.add_argument("dest", help="destination file")
+    add.add_argument("-n", "--name")
+    add.add_argument("-p", "--priority", type=int, default=0)
+    for name in ("pause", "resume", "cancel"):
+        sub.add_parser(name, help=f"{name} a download").add_argument("dest")
+    sub.add_parser("status", help="list downloads")
+    sub.add_parser("stop", help="stop the daemon, running downloads are paused and resume next start")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        DownloadDaemon().serve()
+        return 0
+
+    if args.command == "add":
+        request = {'cmd': 'enqueue', 'url': args.url, 'path': os.path.abspath(args.dest),
+                   'name': args.name, 'priority': args.priority}
+    elif args.command in ("pause", "resume", "cancel"):
+        request = {'cmd': args.command, 'path': os.path.abspath(args.dest)}
+    elif args.command == "stop":
+        request = {'cmd': 'shutdown'}
+    else:
+        request = {'cmd': 'status'}
+
+    try:
+        reply = send_command(request)
+    except OSError as e:
+        print(f"Could not reach the download daemon ({e}), start it with: serve")
+        return 1
+    if not reply.get('ok'):
+        print(f"Error: {reply.get('error')}")
+        return 1
+    if 'tasks' in reply:
+        print_tasks(reply['tasks'])
+    elif 'task' in reply:
+        print_tasks([reply['task']])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
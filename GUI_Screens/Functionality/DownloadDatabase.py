@@ -0,0 +1,229 @@
+# GUI_Screens/Functionality/DownloadDatabase.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# ---------------------------------------------------------
+# Download queue state in SQLite instead of rewriting download_state.json.
+# One row per task, written on its own when that task changes, plus a
+# history of finished and cancelled downloads and the connection count
+# each host did best with. WAL mode and a busy timeout
+# let the GUI and the headless daemon write the same file at the same time.
+# ---------------------------------------------------------
+BUSY_TIMEOUT = 5000 # ms to wait for the other process's write
+JSON_COLUMNS = ('headers', 'chunklist', 'hashes', 'extract', 'files', 'recovery')
+
+# task dict key -> (column, declared type); "order" is an SQL keyword
+TASK_COLUMNS = {
+    'url': ('url', 'TEXT NOT NULL'),
+    'name': ('name', 'TEXT'),
+    'size': ('size', 'INTEGER DEFAULT 0'),
+    'headers': ('headers', 'TEXT'),
+    'chunklist': ('chunklist', 'TEXT'),
+    'priority': ('priority', 'INTEGER DEFAULT 0'),
+    'order': ('sort_order', 'INTEGER DEFAULT 0'),
+    'rate_limit': ('rate_limit', 'INTEGER DEFAULT 0'),
+    'hashes': ('hashes', 'TEXT'),
+    'extract': ('extract', 'TEXT'),
+    'files': ('files', 'TEXT'),
+    'recovery': ('recovery', 'TEXT'),
+    'status': ('status', 'TEXT'),
+    'extract_error': ('extract_error', 'TEXT'),
+    'downloaded': ('downloaded', 'INTEGER DEFAULT 0'),
+    'total': ('total', 'INTEGER DEFAULT 0'),
+}
+COLUMN_TYPES = dict(TASK_COLUMNS.values()) # column -> declared type
+COLUMN_NAMES = list(COLUMN_TYPES)
+
+TASKS_TABLE = "CREATE TABLE IF NOT EXISTS {table} (path TEXT PRIMARY KEY, %s, updated REAL)" % (
+    ", ".join(f"{column} {declared}" for column, declared in TASK_COLUMNS.values()))
+
+SCHEMA = TASKS_TABLE.format(table="tasks") + """;
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT,
+    url TEXT,
+    name TEXT,
+    event TEXT,
+    size INTEGER,
+    hashes TEXT,
+    time REAL
+);
+CREATE INDEX IF NOT EXISTS history_time ON history(time);
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    connections INTEGER,
+    updated REAL
+);
+"""
+
+class DownloadDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock() # One connection, used from job threads too
+        self.written = {} # path -> row as this process last loaded/wrote it, so saves only touch what we changed
+        # Autocommit; writes open their own BEGIN IMMEDIATE so they queue up instead of deadlocking
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") # WAL stays consistent, a power cut may lose the last commit
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+        with self.transaction() as db:
+            for statement in SCHEMA.split(";"): # executescript() would commit on its own
+                if statement.strip(): db.execute(statement)
+            self.migrate(db)
+
+    def migrate(self, db):
+        # Databases from before a column existed. Older builds added every new column as TEXT, which
+        # stores numbers as strings; those tables are copied into one with the declared types.
+        have = {row['name']: row['type'].upper() for row in db.execute("PRAGMA table_info(tasks)")}
+        mistyped = [c for c in COLUMN_NAMES if c in have and have[c] != COLUMN_TYPES[c].split()[0]]
+        if not mistyped:
+            for column in COLUMN_NAMES:
+                if column not in have:
+                    db.execute(f"ALTER TABLE tasks ADD COLUMN {column} {COLUMN_TYPES[column]}")
+            return
+        
+        kept = [c for c in COLUMN_NAMES if c in have]
+        values = [f"CAST({c} AS INTEGER)" if c in mistyped and COLUMN_TYPES[c].startswith("INTEGER") else c for c in kept]
+        db.execute("DROP TABLE IF EXISTS tasks_migrate")
+        db.execute(TASKS_TABLE.format(table="tasks_migrate"))
+        db.execute(f"INSERT INTO tasks_migrate (path, {', '.join(kept)}, updated) "
+                   f"SELECT path, {', '.join(values)}, updated FROM tasks")
+        db.execute("DROP TABLE tasks")
+        db.execute("ALTER TABLE tasks_migrate RENAME TO tasks")
+        print(f"Converted download database columns: {', '.join(mistyped)}")
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def load_tasks(self):
+        # Queue order, no file system access; paths are only checked when a task runs
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM tasks ORDER BY priority DESC, sort_order").fetchall()
+        return [self._task(row) for row in rows]
+
+    def load_task(self, path):
+        # One row as it is now, e.g. after the other process let go of it; None when it was deleted
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM tasks WHERE path=?", (path,)).fetchone()
+        if row is None:
+            self.written.pop(path, None)
+            return None
+        return self._task(row)
+
+    def _task(self, row):
+        task = {'path': row['path']}
+        for key, (column, _) in TASK_COLUMNS.items():
+            value = row[column]
+            if column in JSON_COLUMNS:
+                value = json.loads(value) if value else ({} if column in ('headers', 'hashes') else None)
+            task[key] = value
+        self.written[task['path']] = self._row(task)[:-1]
+        return task
+
+    def _row(self, task):
+        values = [task['path']]
+        for key, (column, _) in TASK_COLUMNS.items():
+            value = task.get(key)
+            if column in JSON_COLUMNS:
+                value = json.dumps(value) if value else None
+            elif value is None and column not in ('name', 'status', 'extract_error'):
+                value = 0
+            values.append(value)
+        return values + [time.time()]
+
+    def save_tasks(self, tasks):
+        # Only rows this process changed since it last read/wrote them. The GUI and the daemon share this file,
+        # so writing back an unchanged copy would undo the other one's edits.
+        # Rows we already knew about are UPDATEd, never re-inserted: if the other process deleted one, it stays deleted.
+        columns = ", ".join(COLUMN_NAMES)
+        updates = ", ".join(f"{c}=excluded.{c}" for c in COLUMN_NAMES)
+        insert = (f"INSERT INTO tasks (path, {columns}, updated) VALUES ({', '.join('?' * (len(TASK_COLUMNS) + 2))}) "
+                  f"ON CONFLICT(path) DO UPDATE SET {updates}, updated=excluded.updated")
+        update = f"UPDATE tasks SET {', '.join(f'{c}=?' for c in COLUMN_NAMES)}, updated=? WHERE path=?"
+        changed = []
+        for task in tasks:
+            row = self._row(task)
+            if self.written.get(task['path']) != row[:-1]:
+                changed.append(row)
+        if not changed: return
+        with self.transaction() as db:
+            for row in changed:
+                path = row[0]
+                if path in self.written:
+                    db.execute(update, row[1:] + [path])
+                else:
+                    db.execute(insert, row)
+                self.written[path] = row[:-1]
+
+    def save_task(self, task):
+        self.save_tasks([task])
+
+    def set_progress(self, progress):
+        # [(path, downloaded, total)], cheap periodic checkpoint of running tasks
+        now = time.time()
+        with self.transaction() as db:
+            db.executemany("UPDATE tasks SET downloaded=?, total=?, updated=? WHERE path=?",
+                           [(done, total, now, path) for path, done, total in progress])
+
+    def delete_task(self, path):
+        with self.transaction() as db:
+            db.execute("DELETE FROM tasks WHERE path=?", (path,))
+        self.written.pop(path, None)
+
+    def add_history(self, task, event):
+        with self.transaction() as db:
+            db.execute("INSERT INTO history (path, url, name, event, size, hashes, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (task['path'], task['url'], task.get('name'), event, task.get('total') or task.get('size') or 0,
+                        json.dumps(task.get('hashes') or {}), time.time()))
+
+    def history(self, limit=100):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM history ORDER BY time DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row, hashes=json.loads(row['hashes'] or "{}")) for row in rows]
+
+    def host_connections(self, host):
+        # Parallel connections that worked best for this host last time, None if unknown
+        with self.lock:
+            row = self.conn.execute("SELECT connections FROM hosts WHERE host=?", (host,)).fetchone()
+        return row['connections'] if row else None
+
+    def set_host_connections(self, host, connections):
+        with self.transaction() as db:
+            db.execute("INSERT INTO hosts (host, connections, updated) VALUES (?, ?, ?) "
+                       "ON CONFLICT(host) DO UPDATE SET connections=excluded.connections, updated=excluded.updated",
+                       (host, connections, time.time()))
+
+    def is_empty(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 0
+
+    def import_json(self, path):
+        # One-time move from download_state.json; the old file is kept as .bak
+        with open(path, 'r') as f:
+            data = json.load(f)
+        tasks = []
+        for order, item in enumerate(data, 1):
+            task = dict(item)
+            task.setdefault('order', order)
+            tasks.append(task)
+        self.save_tasks(tasks)
+        os.replace(path, path + ".bak")
+        return len(tasks)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
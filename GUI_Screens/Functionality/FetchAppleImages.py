@@ -60,8 +60,38 @@ PRODUCT_NAMES = {
 }
 
 CACHE_FILE = "recovery_cache.json"
+SIZE_CACHE_FILE = "size_cache.json"
+DIST_INDEX_FILE = "dist_index.json"
 
-def get_url_content(url, headers=None):
+# Marketing names that show up in dist scripts, used when the title is just "SU_TITLE"
+DIST_CODENAMES = [
+    ("macOSSequoia", "macOS 15: Sequoia"),
+    ("macOS Sequoia", "macOS 15: Sequoia"),
+    ("macOSSonoma", "macOS 14: Sonoma"),
+    ("macOS Sonoma", "macOS 14: Sonoma"),
+    ("macOSVentura", "macOS 13: Ventura"),
+    ("macOS Ventura", "macOS 13: Ventura"),
+    ("macOSMonterey", "macOS 12: Monterey"),
+    ("macOS Monterey", "macOS 12: Monterey"),
+    ("macOSBigSur", "macOS 11: Big Sur"),
+    ("macOS Big Sur", "macOS 11: Big Sur"),
+]
+
+# JavaScript arrays in the dist installCheck script -> index key
+DIST_LISTS = {
+    "boardIds": "board_ids",
+    "supportedBoardIDs": "board_ids",
+    "supportedDeviceIDs": "device_ids",
+    "nonSupportedModels": "unsupported_models",
+}
+
+DIST_LIST_RE = re.compile(r'\b(' + '|'.join(DIST_LISTS) + r')\s*=\s*\[')
+DIST_KEY_RE = re.compile(r'<key>(BUILD|VERSION)</key>', re.IGNORECASE)
+DIST_STRING_RE = re.compile(r'<string>(.*?)</string>', re.IGNORECASE)
+DIST_TITLE_RE = re.compile(r'<title>(.*?)</title>', re.IGNORECASE)
+DIST_QUOTED_RE = re.compile(r"['\"]([^'\"]+)['\"]")
+
+def open_url(url, headers=None):
     if headers is None:
         headers = {
             "User-Agent": "SoftwareUpdate/6 (Macintosh; Mac OS X 15.0)"
@@ -73,10 +103,112 @@ def get_url_content(url, headers=None):
     
     req = Request(url, headers=headers)
     try:
-        response = urlopen(req, context=context)
+        return urlopen(req, context=context)
+    except Exception as e:
+        return None
+
+def get_url_content(url, headers=None):
+    response = open_url(url, headers)
+    if response is None:
+        return None
+    try:
         return response.read()
     except Exception as e:
         return None
+    finally:
+        response.close()
+
+def parse_dist(lines):
+    """Single pass over a .dist file (any iterable of lines) collecting title, version, build and compatibility lists."""
+    info = {
+        'title': None,
+        'codename': None,
+        'version': None,
+        'build': None,
+        'board_ids': [],
+        'device_ids': [],
+        'unsupported_models': [],
+    }
+    pending_key = None   # BUILD/VERSION key waiting for its <string>
+    open_list = None     # index key of a JS array spanning several lines
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='ignore')
+
+        if open_list is None:
+            m = DIST_LIST_RE.search(line)
+            if m:
+                open_list = DIST_LISTS[m.group(1)]
+                line = line[m.end():]
+
+        if open_list is not None:
+            body, sep, _ = line.partition(']')
+            for value in DIST_QUOTED_RE.findall(body):
+                if value not in info[open_list]:
+                    info[open_list].append(value)
+            if sep:
+                open_list = None
+            continue
+
+        if pending_key:
+            m = DIST_STRING_RE.search(line)
+            if m:
+                info[pending_key] = m.group(1).strip()
+                pending_key = None
+        m = DIST_KEY_RE.search(line)
+        if m:
+            pending_key = m.group(1).lower()
+            m = DIST_STRING_RE.search(line, m.end())
+            if m:
+                info[pending_key] = m.group(1).strip()
+                pending_key = None
+
+        if info['title'] is None:
+            m = DIST_TITLE_RE.search(line)
+            if m:
+                info['title'] = m.group(1).strip()
+
+        if info['codename'] is None:
+            for marker, codename in DIST_CODENAMES:
+                if marker in line:
+                    info['codename'] = codename
+                    break
+
+    return info
+
+def is_image_supported(image, board_id=None, model=None):
+    # Images without dist data are kept, we can't rule them out
+    board_ids = image.get('board_ids') or []
+    if board_id and board_ids:
+        return board_id in board_ids
+    if model and model in (image.get('unsupported_models') or []):
+        return False
+    return True
+
+def filter_images_for_target(images, board_id=None, model=None):
+    return [img for img in images if is_image_supported(img, board_id, model)]
+
+def get_content_length(url, headers=None):
+    # HEAD the package and return its size in bytes (None if the server won't tell us)
+    if headers is None:
+        headers = {
+            "User-Agent": "InternetRecovery/1.0"
+        }
+
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    req = Request(url, headers=headers, method="HEAD")
+    try:
+        response = urlopen(req, context=context, timeout=10)
+        length = response.headers.get("Content-Length")
+        if length:
+            return int(length)
+    except Exception:
+        pass
+    return None
 
 def generate_catalog_urls():
     urls = []
@@ -108,10 +240,13 @@ class FetchAppleImages:
         self.status_callback = status_callback
         self.apple_images = []
         self.seen_products = set()
+        self.size_cache = {} # url -> Content-Length
+        self.dist_index = {} # product id -> parse_dist() result
 
         if self.use_cache:
             if self.status_callback: self.status_callback("Checking cache...")
             self.load_cache()
+        self.load_dist_index()
 
         if not self.apple_images or not self.use_cache:
             try:
@@ -119,6 +254,16 @@ class FetchAppleImages:
                 self.fetch_images_from_catalog()
             except Exception as e:
                 pass
+
+        try:
+            self.index_dists()
+        except Exception:
+            pass
+
+        try:
+            self.probe_sizes()
+        except Exception:
+            pass
         
         # Always sort at the end
         self.sort_images()
@@ -140,6 +285,116 @@ class FetchAppleImages:
         except:
             pass
 
+    def load_size_cache(self):
+        if os.path.exists(SIZE_CACHE_FILE):
+            try:
+                with open(SIZE_CACHE_FILE, 'r') as f:
+                    data = json.load(f)
+                    if isinstance(data, dict):
+                        self.size_cache = data
+            except:
+                pass
+
+    def save_size_cache(self):
+        try:
+            with open(SIZE_CACHE_FILE, 'w') as f:
+                json.dump(self.size_cache, f, indent=4)
+        except:
+            pass
+
+    def load_dist_index(self):
+        if os.path.exists(DIST_INDEX_FILE):
+            try:
+                with open(DIST_INDEX_FILE, 'r') as f:
+                    data = json.load(f)
+                    if isinstance(data, dict):
+                        self.dist_index.update(data)
+            except:
+                pass
+
+    def save_dist_index(self):
+        try:
+            with open(DIST_INDEX_FILE, 'w') as f:
+                json.dump(self.dist_index, f, indent=4)
+        except:
+            pass
+
+    def get_dist_info(self, pid, distributions):
+        if pid in self.dist_index:
+            return self.dist_index[pid]
+
+        dist_url = distributions.get('English') or distributions.get('en')
+        if not dist_url:
+            return {}
+
+        response = open_url(dist_url)
+        if response is None:
+            return {}
+        try:
+            info = parse_dist(response) # Streams line by line off the socket
+        except Exception:
+            return {}
+        finally:
+            response.close()
+
+        self.dist_index[pid] = info
+        return info
+
+    def apply_dist_info(self, img):
+        info = self.dist_index.get(img.get('id'))
+        if not info: return
+        for key in ('version', 'build', 'board_ids', 'device_ids', 'unsupported_models'):
+            img[key] = info.get(key)
+
+    def index_dists(self):
+        # Make sure every image carries version/build and its compatibility lists
+        missing = [img for img in self.apple_images if img.get('id') not in self.dist_index and img.get('dist')]
+        if missing:
+            if self.status_callback: self.status_callback(f"Reading {len(missing)} distribution files...")
+            with ThreadPoolExecutor(max_workers=20) as executor:
+                futures = [executor.submit(self.get_dist_info, img['id'], img['dist']) for img in missing]
+                for future in as_completed(futures):
+                    try: future.result()
+                    except Exception: pass
+            self.save_dist_index()
+
+        for img in self.apple_images:
+            self.apply_dist_info(img)
+
+    def probe_sizes(self):
+        # Fill in 'size' for every image by HEADing its main package.
+        # Sizes are cached per URL, so only new packages hit the network.
+        self.load_size_cache()
+
+        missing = set()
+        for img in self.apple_images:
+            url = img.get('url')
+            if not url: continue
+            if url in self.size_cache:
+                img['size'] = self.size_cache[url]
+            elif not img.get('size'):
+                missing.add(url)
+
+        if missing:
+            if self.status_callback: self.status_callback(f"Probing sizes for {len(missing)} packages...")
+
+            with ThreadPoolExecutor(max_workers=20) as executor:
+                future_to_url = {executor.submit(get_content_length, u): u for u in missing}
+                for future in as_completed(future_to_url):
+                    try:
+                        size = future.result()
+                    except Exception:
+                        size = None
+                    if size:
+                        self.size_cache[future_to_url[future]] = size
+
+            for img in self.apple_images:
+                if img.get('url') in self.size_cache:
+                    img['size'] = self.size_cache[img['url']]
+
+            self.save_size_cache()
+            self.save_cache()
+
     def sort_images(self):
         def parse_date(x):
             d = x.get('date')
@@ -169,35 +424,19 @@ class FetchAppleImages:
 
     def get_product_name(self, pid, distributions, server_metadata_url):
         if pid in PRODUCT_NAMES:
+            self.get_dist_info(pid, distributions) # Still index build/board IDs
             return PRODUCT_NAMES[pid]
 
         name = None
-        dist_url = distributions.get('English') or distributions.get('en')
-        
-        if dist_url:
-            try:
-                content = get_url_content(dist_url)
-                if content:
-                    text = content.decode('utf-8', errors='ignore')
-                    m = re.search(r'<title>(.*?)</title>', text, re.IGNORECASE)
-                    if m:
-                        candidate = m.group(1).strip()
-                        if candidate and candidate != "SU_TITLE":
-                            name = candidate
-                    
-                    if not name or name == "SU_TITLE":
-                        if "macOSSequoia" in text or "macOS Sequoia" in text:
-                            name = "macOS 15: Sequoia"
-                        elif "macOSSonoma" in text or "macOS Sonoma" in text:
-                            name = "macOS 14: Sonoma"
-                        elif "macOSVentura" in text or "macOS Ventura" in text:
-                            name = "macOS 13: Ventura"
-                        elif "macOSMonterey" in text or "macOS Monterey" in text:
-                            name = "macOS 12: Monterey"
-                        elif "macOSBigSur" in text or "macOS Big Sur" in text:
-                            name = "macOS 11: Big Sur"
-            except:
-                pass
+        try:
+            info = self.get_dist_info(pid, distributions)
+            candidate = info.get('title')
+            if candidate and candidate != "SU_TITLE":
+                name = candidate
+            elif info.get('codename'):
+                name = info['codename']
+        except:
+            pass
         
         if name: return name
 
@@ -322,9 +561,11 @@ class FetchAppleImages:
                 name = f"{name} ({item['id']})"
             
             item['name'] = name
+            self.apply_dist_info(item)
             formatted.append(item)
             
         self.apple_images = formatted
+        self.save_dist_index()
         self.save_cache()
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+import ssl
+import random
+import argparse
+
+try:
+    from urllib.request import urlopen, Request
+except ImportError:
+    from urllib2 import urlopen, Request
+
+# ---------------------------------------------------------
+# Apple recovery server (osrecovery), the same endpoint Internet Recovery uses.
+# Gives out ~700 MB BaseSystem.dmg images instead of 12+ GB full installers.
+# Point HACKINTOSHIFY_RECOVERY_SERVER at a local stand-in to test without Apple.
+# ---------------------------------------------------------
+RECOVERY_SERVER = os.environ.get("HACKINTOSHIFY_RECOVERY_SERVER", "http://osrecovery.apple.com")
+RECOVERY_USER_AGENT = "InternetRecovery/1.0"
+MLB_ZERO = "00000000000000000"
+
+# Reply keys: product, image link/hash/token, chunklist link/hash/token
+INFO_PRODUCT = "AP"
+INFO_IMAGE_LINK = "AU"
+INFO_IMAGE_HASH = "AH"
+INFO_IMAGE_SESS = "AT"
+INFO_SIGN_LINK = "CU"
+INFO_SIGN_HASH = "CH"
+INFO_SIGN_SESS = "CT"
+INFO_REQUIRED = [INFO_PRODUCT, INFO_IMAGE_LINK, INFO_IMAGE_HASH, INFO_IMAGE_SESS, INFO_SIGN_LINK, INFO_SIGN_SESS]
+
+# Board/MLB pairs whose "default" recovery is the labelled release (the pairs macrecovery
+# documents). "latest" would be each board's newest supported OS, not the label, so only
+# the newest-release entry uses it.
+RECOVERY_BOARDS = [
+    ("Mac-CFF7D910A743CAAF", MLB_ZERO, "latest", "Latest macOS"),
+    ("Mac-937A206F2EE63C01", MLB_ZERO, "default", "macOS 15: Sequoia"),
+    ("Mac-827FAC58A8FDFA22", MLB_ZERO, "default", "macOS 14: Sonoma"),
+    ("Mac-4B682C642B45593E", MLB_ZERO, "default", "macOS 13: Ventura"),
+    ("Mac-FFE5EF870D7BA81A", MLB_ZERO, "default", "macOS 12: Monterey"),
+    ("Mac-42FD25EABCABB274", MLB_ZERO, "default", "macOS 11: Big Sur"),
+    ("Mac-00BE6ED71E35EB86", MLB_ZERO, "default", "macOS 10.15: Catalina"),
+    ("Mac-7BA5B2DFE22DDD8C", "00000000000KXPG00", "default", "macOS 10.14: Mojave"),
+    ("Mac-7BA5B2D9E42DDD94", "00000000000J80300", "default", "macOS 10.13: High Sierra"),
+]
+
+def generate_id(length):
+    return "".join(random.choice("0123456789ABCDEF") for _ in range(length))
+
+def _open(req):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return urlopen(req, context=context, timeout=15)
+
+def get_session(server=RECOVERY_SERVER):
+    # The server hands out a session cookie on a plain GET of its root
+    req = Request(server.rstrip("/") + "/", headers={"User-Agent": RECOVERY_USER_AGENT, "Connection": "close"})
+    with _open(req) as response:
+        for cookie in response.headers.get_all("Set-Cookie") or []:
+            if cookie.startswith("session="):
+                return cookie.split(";")[0]
+    raise RuntimeError("Recovery server did not return a session cookie")
+
+def get_image_info(board_id, mlb=MLB_ZERO, os_type="default", server=RECOVERY_SERVER):
+    """Asks the recovery server for the BaseSystem of board_id. Returns the raw AP/AU/AT/CU/CT reply fields."""
+    session = get_session(server)
+
+    post = {
+        "cid": generate_id(16),
+        "sn": mlb,
+        "bid": board_id,
+        "k": generate_id(64),
+        "fg": generate_id(64),
+        "os": os_type,
+    }
+    body = "\n".join(f"{k}={v}" for k, v in post.items()).encode("utf-8")
+    headers = {
+        "User-Agent": RECOVERY_USER_AGENT,
+        "Connection": "close",
+        "Cookie": session,
+        "Content-Type": "text/plain",
+    }
+
+    req = Request(server.rstrip("/") + "/InstallationPayload/RecoveryImage", data=body, headers=headers)
+    with _open(req) as response:
+        reply = response.read().decode("utf-8", errors="ignore")
+
+    info = {}
+    for line in reply.splitlines():
+        key, sep, value = line.partition(": ")
+        if sep:
+            info[key.strip()] = value.strip()
+
+    missing = [k for k in INFO_REQUIRED if k not in info]
+    if missing:
+        raise RuntimeError(f"Recovery server reply is missing {', '.join(missing)} for {board_id}")
+    return info
+
+class FetchRecoveryImages:
+    def __init__(self, verbose=False, status_callback=None, server=RECOVERY_SERVER):
+        self.verbose = verbose
+        self.status_callback = status_callback
+        self.server = server
+        self.recovery_images = []
+
+        # Entries are listed without touching the network; asset tokens
+        # are short lived, so URLs are only resolved when a download starts.
+        for board_id, mlb, os_type, name in RECOVERY_BOARDS:
+            self.recovery_images.append(self.make_image(board_id, mlb, os_type, name))
+
+    def make_image(self, board_id, mlb=MLB_ZERO, os_type="latest", name=None):
+        return {
+            'id': f"recovery-{board_id}-{os_type}",
+            'url': None,
+            'chunklist': None,
+            'dist': {},
+            'meta_url': None,
+            'date': None,
+            'full_installer': False,
+            'source': 'recovery',
+            'board_id': board_id,
+            'mlb': mlb,
+            'os_type': os_type,
+            'name': f"{name or board_id} (Recovery BaseSystem)",
+        }
+
+    def resolve(self, image):
+        # Fills url/chunklist plus the AssetToken cookies needed to download them
+        if self.status_callback: self.status_callback(f"Requesting recovery image for {image['board_id']}...")
+        info = get_image_info(image['board_id'], image.get('mlb', MLB_ZERO), image.get('os_type', 'default'), self.server)
+
+        image['product'] = info[INFO_PRODUCT]
+        image['url'] = info[INFO_IMAGE_LINK]
+        image['headers'] = {"Cookie": "AssetToken=" + info[INFO_IMAGE_SESS], "User-Agent": RECOVERY_USER_AGENT}
+        image['image_hash'] = info[INFO_IMAGE_HASH]
+        image['chunklist'] = info[INFO_SIGN_LINK]
+        image['chunklist_headers'] = {"Cookie": "AssetToken=" + info[INFO_SIGN_SESS], "User-Agent": RECOVERY_USER_AGENT}
+        image['chunklist_hash'] = info.get(INFO_SIGN_HASH)
+        return image
+
+def resolve_download(recovery, server=RECOVERY_SERVER):
+    """Fresh (url, headers, chunklist) for a queued recovery download; recovery is the task's
+    {'board_id', 'mlb', 'os_type'}. Asset tokens expire, so a resumed task asks again."""
+    fetcher = FetchRecoveryImages(server=server)
+    image = fetcher.resolve(fetcher.make_image(recovery['board_id'], recovery.get('mlb', MLB_ZERO), recovery.get('os_type', 'default')))
+    return image['url'], image['headers'], {'url': image['chunklist'], 'headers': image['chunklist_headers']}
+
+def download_asset(url, headers, dest_path):
+    req = Request(url, headers=headers)
+    with _open(req) as response, open(dest_path, "wb") as f:
+        while True:
+            block = response.read(1024 * 1024)
+            if not block: break
+            f.write(block)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch a BaseSystem from Apple's recovery server")
+    parser.add_argument("-b", "--board-id", default=RECOVERY_BOARDS[0][0])
+    parser.add_argument("-m", "--mlb", default=MLB_ZERO)
+    parser.add_argument("-o", "--os", dest="os_type", default="latest", choices=["default", "latest"])
+    parser.add_argument("-s", "--server", default=RECOVERY_SERVER)
+    parser.add_argument("-d", "--download", metavar="DIR", help="also download BaseSystem.dmg and its chunklist")
+    args = parser.parse_args()
+
+    fetcher = FetchRecoveryImages(verbose=True, server=args.server)
+    image = fetcher.resolve(fetcher.make_image(args.board_id, args.mlb, args.os_type))
+    print(f"Product:   {image['product']}")
+    print(f"Image:     {image['url']}")
+    print(f"Chunklist: {image['chunklist']}")
+
+    if args.download:
+        os.makedirs(args.download, exist_ok=True)
+        download_asset(image['url'], image['headers'], os.path.join(args.download, "BaseSystem.dmg"))
+        download_asset(image['chunklist'], image['chunklist_headers'], os.path.join(args.download, "BaseSystem.chunklist"))
+        print(f"Saved to {args.download}")
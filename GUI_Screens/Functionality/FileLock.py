@@ -0,0 +1,66 @@
+# GUI_Screens/Functionality/FileLock.py
+
+import os
+import sys
+import time
+
+# ---------------------------------------------------------
+# Exclusive lock on a small side file, shared between processes
+# (the GUI and the download daemon). flock on POSIX, msvcrt on Windows.
+# The OS drops the lock if the holder dies, so there is nothing stale to clean up.
+# ---------------------------------------------------------
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_POLL = 0.05 # seconds between tries while waiting for a blocking lock
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def acquire(self, blocking=True):
+        # -> True once held, False if another process has it (only when not blocking)
+        if self.fd is not None: return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        while True:
+            try:
+                if sys.platform == "win32":
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.fd = fd
+                return True
+            except OSError:
+                if not blocking:
+                    os.close(fd)
+                    return False
+                time.sleep(LOCK_POLL)
+
+    def release(self):
+        if self.fd is None: return
+        try:
+            if sys.platform == "win32":
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        except OSError as e:
+            print(f"Error releasing lock {self.path}: {e}")
+        os.close(self.fd)
+        self.fd = None
+
+    @property
+    def held(self):
+        return self.fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,344 @@
+# GUI_Screens/Functionality/ImageVerifier.py
+
+import os
+import sys
+import json
+import mmap
+import time
+import hashlib
+import argparse
+import threading
+import configparser
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .Chunklist import parse_chunklist, chunklist_total
+from .ResumableHash import LEAF_SIZE, MERKLE, merkle_root
+from .DownloadCore import get_config_dir, format_size, CONFIG_FILE, DOWNLOAD_DB_FILE
+from .DownloadDatabase import DownloadDatabase
+from .ContentStore import ContentStore
+from .XarArchive import verify_archive, XarError
+
+# ---------------------------------------------------------
+# Verifies the local image library without hashing one file after another.
+# Every file is cut into LEAF_SIZE blocks that are hashed on a pool straight
+# from an mmap (hashlib lets go of the GIL on big buffers, so plain threads
+# use every core), and the block digests are folded into a Merkle root.
+# An image with a .chunklist next to it is checked chunk by chunk against
+# Apple's hashes. Without one, a file is checked against the Merkle root taken
+# while it downloaded (download database or content store), leaf blocks in
+# parallel; downloads from before roots were recorded only have a SHA-256,
+# which takes one core for the whole file. A pkg with neither is checked
+# against the checksums in its own xar TOC. Anything else can only be
+# compared with the root recorded the first time it was seen, so it stays
+# Unverified. Results are cached by (device, inode, size, mtime), so a file
+# that hasn't changed isn't read again unless full=True.
+# Usage: python -m GUI_Screens.Functionality.ImageVerifier [--full] [--processes] [paths...]
+# ---------------------------------------------------------
+READ_SIZE = 1024 * 1024
+HISTORY_LIMIT = 1000 # Finished downloads looked at for their digests
+IMAGE_EXTENSIONS = ('.dmg', '.pkg', '.iso', '.img')
+VERIFY_CACHE_FILE = os.path.join(get_config_dir(), "verify_cache.json")
+
+def hash_range(path, offset, length):
+    # SHA-256 of one block, module level so a process pool can pickle it
+    if length == 0:
+        return hashlib.sha256().digest()
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY # mmap offsets must be aligned, chunklist chunks aren't
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), length + offset - start, offset=start, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                return hashlib.sha256(view[offset - start:]).digest()
+            finally:
+                view.release() # The map can't close while a view is exported
+
+def hash_file(path):
+    # Plain SHA-256 of the whole file, to compare with the digest taken while it downloaded
+    h = hashlib.sha256()
+    buf = bytearray(READ_SIZE)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n: break
+            h.update(view[:n])
+    return h.hexdigest()
+
+def check_pkg(path):
+    # -> (files checked, [paths that fail]) from the pkg's own TOC checksums
+    results = verify_archive(path)
+    return sum(r['status'] == 'OK' for r in results), [r['path'] for r in results if r['status'] == 'Bad']
+
+def file_key(path):
+    st = os.stat(path)
+    return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+def chunklist_path(path):
+    return os.path.splitext(path)[0] + ".chunklist"
+
+def get_library_dir():
+    # Same download folder DownloadImageScreen saves to
+    default_dl = os.path.join(os.path.expanduser("~"), "Downloads")
+    try:
+        with open(os.path.join(get_config_dir(), "setup_details.json"), 'r') as f:
+            return json.load(f).get("download_path", default_dl)
+    except (OSError, ValueError):
+        return default_dl
+
+def known_digests():
+    """Digests taken while files downloaded: ({path: digests}, {(device, inode): digests}), where digests
+    is like {'sha256': ..., 'merkle': ...}. The second covers files hardlinked into the content store,
+    wherever they were moved."""
+    by_path, by_inode = {}, {}
+    if os.path.exists(DOWNLOAD_DB_FILE):
+        try:
+            db = DownloadDatabase(DOWNLOAD_DB_FILE)
+            try:
+                for row in reversed(db.history(HISTORY_LIMIT)): # Oldest first, a newer download of a path wins
+                    if row['event'] == 'Finished' and row['hashes'].get('sha256'):
+                        by_path[os.path.abspath(row['path'])] = dict(row['hashes'])
+                for task in db.load_tasks():
+                    if task['status'] == 'Finished' and (task.get('hashes') or {}).get('sha256'):
+                        by_path[os.path.abspath(task['path'])] = dict(task['hashes'])
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"Error reading download hashes: {e}")
+
+    config = configparser.ConfigParser()
+    try: config.read(CONFIG_FILE)
+    except Exception: pass
+    section = config['Downloads'] if config.has_section('Downloads') else {}
+    store_dir = section.get('store_dir', '') or os.path.join(get_config_dir(), "store")
+    if os.path.isdir(store_dir):
+        for digest, entry in ContentStore(store_dir).objects.items():
+            try:
+                st = os.stat(entry['path'])
+            except OSError:
+                continue
+            if st.st_size == entry['size']:
+                digests = dict(entry.get('digests') or {}, sha256=digest)
+                by_inode[(st.st_dev, st.st_ino)] = digests
+                by_path.setdefault(os.path.abspath(entry['path']), digests)
+    return by_path, by_inode
+
+def library_paths(directory=None, extra=()):
+    """Images in the download folder plus any extra paths (e.g. finished downloads elsewhere)."""
+    directory = directory or get_library_dir()
+    paths = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(directory, name)):
+                paths.append(os.path.join(directory, name))
+    for path in extra:
+        path = os.path.abspath(path)
+        if path not in paths and os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+class LibraryVerifier:
+    """Verifies many files at once on one pool. Thread-safe enough to cancel() from another thread."""
+    def __init__(self, workers=None, processes=False, cache_path=VERIFY_CACHE_FILE, references=None):
+        self.workers = workers or os.cpu_count() or 4
+        self.processes = processes
+        self.cache_path = cache_path
+        self.references = references # (by_path, by_inode) like known_digests(), read on each verify if None
+        self.cache = self.load_cache()
+        self.is_cancelled = False
+        self.lock = threading.Lock()
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self):
+        tmp = self.cache_path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.cache, f, indent=1)
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            print(f"Error saving verify cache: {e}")
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def plan(self, path, key, references):
+        # -> (kind, blocks, reference). kind is what the file can be checked against, best first:
+        # chunklist (blocks carry Apple's digests), merkle or sha256 (from its download), pkg (its xar TOC)
+        # or tree (nothing). reference is the digest the file has to come out as.
+        size = key[2]
+        cl_path = chunklist_path(path)
+        if os.path.exists(cl_path):
+            try:
+                with open(cl_path, 'rb') as f:
+                    chunks = parse_chunklist(f.read())
+                if chunklist_total(chunks) == size:
+                    return 'chunklist', [(offset, length, digest) for offset, length, digest in chunks], None
+                print(f"{os.path.basename(cl_path)} doesn't match the image size, ignoring it")
+            except (OSError, ValueError) as e:
+                print(f"Error reading {cl_path}: {e}")
+        by_path, by_inode = references
+        leaves = [(offset, min(LEAF_SIZE, size - offset), None) for offset in range(0, size, LEAF_SIZE)] or [(0, 0, None)]
+        digests = by_path.get(os.path.abspath(path)) or by_inode.get((key[0], key[1])) or {}
+        if digests.get(MERKLE):
+            return 'merkle', leaves, digests[MERKLE]
+        if digests.get('sha256'):
+            return 'sha256', [(0, size, None)], digests['sha256']
+        if path.lower().endswith('.pkg'):
+            return 'pkg', [(0, size, None)], None
+        return 'tree', leaves, None
+
+    def verify(self, paths, full=False, progress=None):
+        """Returns one result dict per path: {'path', 'status', 'detail', 'root', 'cached'}.
+        status is OK (matches a chunklist, its download digests or its pkg TOC), Corrupt, Unverified
+        (nothing trusted to compare with, only its own earlier tree hash) or Missing.
+        progress(done_bytes, total_bytes, path) is called from this thread as blocks complete."""
+        self.is_cancelled = False
+        references = self.references or known_digests()
+        results = {}
+        work = [] # (path, key, kind, blocks, reference)
+        for path in paths:
+            try:
+                key = file_key(path)
+            except OSError as e:
+                results[path] = {'path': path, 'status': 'Missing', 'detail': str(e), 'root': None, 'cached': False}
+                continue
+            kind, blocks, reference = self.plan(path, key, references)
+            entry = self.cache.get(path)
+            # Unchanged since it was last read, and checked against the same kind of reference back then
+            if entry and entry['key'] == key and entry.get('kind') == kind and entry.get('reference') == reference and not full:
+                results[path] = self.cached_result(entry)
+                continue
+            work.append((path, key, kind, blocks, reference))
+
+        total = sum(key[2] for _, key, _, _, _ in work)
+        done = 0
+        pool_class = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        with pool_class(max_workers=self.workers) as pool:
+            # Everything is queued up front so the pool moves straight on to the next file
+            futures = []
+            for path, _, kind, blocks, _ in work:
+                if kind == 'sha256':
+                    futures.append([pool.submit(hash_file, path)])
+                elif kind == 'pkg':
+                    futures.append([pool.submit(check_pkg, path)])
+                else:
+                    futures.append([pool.submit(hash_range, path, offset, length) for offset, length, _ in blocks])
+            try:
+                for (path, key, kind, blocks, reference), pending in zip(work, futures):
+                    outcomes = []
+                    bad = []
+                    for (offset, length, expected), future in zip(blocks, pending):
+                        if self.is_cancelled: raise InterruptedError("Verification cancelled")
+                        try:
+                            outcome = future.result()
+                        except XarError as e:
+                            outcome = (0, [f"archive: {e}"])
+                        outcomes.append(outcome)
+                        if expected is not None and outcome != expected:
+                            bad.append(offset)
+                        done += length
+                        if progress: progress(done, total, path)
+                    results[path] = self.judge(path, key, kind, reference, outcomes, bad)
+            except BaseException:
+                for pending in futures:
+                    for future in pending: future.cancel()
+                raise
+            finally:
+                self.save_cache()
+
+        return [results[path] for path in paths]
+
+    def cached_result(self, entry):
+        result = dict(entry['result'], cached=True)
+        if result['status'] == 'Unverified':
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['time']))
+            result['detail'] = f"Unchanged since {when}, but there's no chunklist or download hash to check it against"
+        return result
+
+    def judge(self, path, key, kind, reference, outcomes, bad):
+        entry = self.cache.get(path)
+        root = None
+        if kind == 'chunklist':
+            root = merkle_root(outcomes)
+            if bad:
+                status, detail = 'Corrupt', f"{len(bad)} of {len(outcomes)} chunks fail the chunklist, first at byte {bad[0]}"
+            else:
+                status, detail = 'OK', f"{len(outcomes)} chunks match the chunklist"
+        elif kind == 'merkle':
+            root = merkle_root(outcomes)
+            if root != reference:
+                status, detail = 'Corrupt', "Doesn't match the Merkle root taken when it was downloaded"
+            else:
+                status, detail = 'OK', f"All {len(outcomes)} blocks match the Merkle root taken when it was downloaded"
+        elif kind == 'sha256':
+            root = outcomes[0]
+            if root != reference:
+                status, detail = 'Corrupt', "Doesn't match the SHA-256 taken when it was downloaded"
+            else:
+                status, detail = 'OK', "Matches the SHA-256 taken when it was downloaded"
+        elif kind == 'pkg':
+            checked, failed = outcomes[0]
+            if failed:
+                status, detail = 'Corrupt', f"{len(failed)} file(s) fail the pkg's checksums, first {failed[0]}"
+            elif checked:
+                status, detail = 'OK', f"All {checked} checksums in its table of contents match"
+            else:
+                status, detail = 'Unverified', "The pkg carries no checksums and there's no download hash for it"
+        else:
+            root = merkle_root(outcomes)
+            old = entry['result'].get('root') if entry and entry.get('kind') == 'tree' else None
+            if old and entry['key'] == key and old != root:
+                status, detail = 'Corrupt', "Contents changed but size and modification time didn't"
+                root = old # Keep the earlier root, not the damaged one
+            else:
+                status, detail = 'Unverified', "No chunklist or download hash to check against, tree hash recorded"
+
+        result = {'path': path, 'status': status, 'detail': detail, 'root': root, 'cached': False}
+        with self.lock:
+            self.cache[path] = {'key': key, 'kind': kind, 'reference': reference, 'result': result, 'time': time.time()}
+        return result
+
+def print_results(results):
+    for r in results:
+        note = " (cached)" if r['cached'] else ""
+        print(f"[{r['status']:<10}] {os.path.basename(r['path'])}{note}")
+        print(f"             {r['detail']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify downloaded macOS images in parallel")
+    parser.add_argument("paths", nargs="*", help="files or folders (default: the download folder)")
+    parser.add_argument("--full", action="store_true", help="re-read files even if unchanged since the last verify")
+    parser.add_argument("--processes", action="store_true", help="hash on a process pool instead of threads")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    paths = []
+    for p in args.paths or [get_library_dir()]:
+        paths += library_paths(p) if os.path.isdir(p) else [os.path.abspath(p)]
+    if not paths:
+        print("No images to verify.")
+        return 0
+
+    verifier = LibraryVerifier(args.workers, args.processes)
+    start = time.time()
+    last = [0]
+    def progress(done, total, path):
+        if time.time() - last[0] >= 1 or done == total:
+            last[0] = time.time()
+            print(f"\r{format_size(done)} / {format_size(total)}  {os.path.basename(path)[:40]:<40}", end="", flush=True)
+    try:
+        results = verifier.verify(paths, args.full, progress)
+    except KeyboardInterrupt:
+        print("\nCancelled.")
+        return 1
+    print(f"\nVerified {len(results)} file(s) in {time.time() - start:.1f}s")
+    print_results(results)
+    return 1 if any(r['status'] in ('Corrupt', 'Missing') for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
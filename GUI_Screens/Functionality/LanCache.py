@@ -0,0 +1,403 @@
+# GUI_Screens/Functionality/LanCache.py
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import threading
+import http.server
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, quote
+
+import requests
+
+from .ContentStore import ContentStore
+
+# ---------------------------------------------------------
+# LAN cache: instances in the same shop share their download stores.
+# An instance with lan_cache = on serves its ContentStore over HTTP:
+#   GET /lookup?key=<store key>  -> {"object": "/objects/<sha256>", "size", "digests"} or 404
+#   GET/HEAD /objects/<sha256>   -> the file, with Range/If-Range and the CDN's validators
+# and announces itself with a multicast beacon (also in answer to the query
+# a starting instance sends to the group). Other instances ask the
+# peers they know (beacons plus lan_peers from config.ini) before going to
+# the CDN. A peer is only used when its bytes can be checked against
+# something it doesn't control (Apple's chunklist, or a SHA-256 this instance
+# already has for the file), so a bad peer only costs a refetch from the CDN.
+# Discovery is off unless lan_discovery = on; lan_peers works without it.
+# Usage: python -m GUI_Screens.Functionality.LanCache serve|peers|lookup
+# ---------------------------------------------------------
+LAN_CACHE_PORT = 8741
+DISCOVERY_GROUP = "239.255.87.41"
+DISCOVERY_PORT = 8742
+BEACON_INTERVAL = 5 # seconds between announcements
+PEER_TIMEOUT = 20 # A peer that hasn't announced for this long is forgotten
+PEER_BACKOFF = 300 # seconds a peer that failed a transfer is skipped
+DISCOVERY_WAIT = 1.0 # A fresh LanPeers gives the answers to its query this long before the first lookup
+LOOKUP_TIMEOUT = 1.5
+BEACON_APP = "hackintoshify-cache"
+OBJECT_PATH = re.compile(r"^/objects/[0-9a-f]{64}$")
+
+def parse_peers(text):
+    # "host:port, host" -> ["host:port", ...]
+    peers = []
+    for item in (text or "").replace(";", ",").split(","):
+        item = item.strip()
+        if not item: continue
+        if ":" not in item.rsplit("]", 1)[-1]:
+            item = f"{item}:{LAN_CACHE_PORT}"
+        peers.append(item)
+    return peers
+
+def discovery_socket():
+    # Bound to the group port, several instances on one machine can share it
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("", DISCOVERY_PORT))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(DISCOVERY_GROUP) + socket.inet_aton("0.0.0.0"))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1) # Stays on this subnet
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1) # Other instances on this machine
+    sock.settimeout(0.25)
+    return sock
+
+def read_message(sock):
+    # -> (message dict, sender host) of one of ours, None on timeout or noise
+    try:
+        data, (host, _) = sock.recvfrom(2048)
+        message = json.loads(data.decode('utf-8'))
+    except (socket.timeout, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get('app') != BEACON_APP:
+        return None
+    return message, host
+
+def parse_range(header, size):
+    # Single "bytes=a-b" / "bytes=a-" / "bytes=-n" range -> (start, end) exclusive, None if unusable
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if not first:
+            n = int(last)
+            if n <= 0: return None
+            return max(0, size - n), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        return None
+    return start, min(end, size)
+
+class CacheHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "HackintoshifyCache/1.0"
+
+    def log_message(self, format, *args):
+        pass # One line per request would drown the download log
+
+    def do_HEAD(self):
+        self.route(body=False)
+
+    def do_GET(self):
+        self.route(body=True)
+
+    def route(self, body):
+        url = urlparse(self.path)
+        try:
+            if url.path == "/lookup":
+                self.lookup(parse_qs(url.query).get('key', [''])[0])
+            elif url.path.startswith("/objects/"):
+                self.send_object(url.path[len("/objects/"):], body)
+            else:
+                self.reply(404, b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Peer paused or switched to another source
+
+    def reply(self, code, data, content_type="application/json"):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def lookup(self, key):
+        found = self.server.cache.find(key)
+        if not found:
+            self.reply(404, b"")
+            return
+        digest, entry = found
+        self.reply(200, json.dumps({'object': f"/objects/{digest}", 'size': entry['size'],
+                                    'digests': entry.get('digests', {})}).encode('utf-8'))
+
+    def send_object(self, digest, body):
+        found = self.server.cache.object(digest)
+        if not found:
+            self.reply(404, b"")
+            return
+        path, size, validators = found
+        etag = next((v for v in validators if v.startswith('"')), f'"{digest}"')
+        last_modified = next((v for v in validators if not v.startswith(('"', 'W/'))), None)
+
+        # If-Range may carry any validator this content was downloaded under
+        if_range = self.headers.get('If-Range')
+        span = parse_range(self.headers.get('Range'), size)
+        if if_range and if_range not in validators and if_range != f'"{digest}"':
+            span = None
+        if self.headers.get('Range') and span is None and not if_range:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end = span or (0, size)
+        self.send_response(206 if span else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if last_modified:
+            self.send_header('Last-Modified', last_modified)
+        if span:
+            self.send_header('Content-Range', f"bytes {start}-{end - 1}/{size}")
+        self.end_headers()
+        if not body: return
+
+        with open(path, 'rb') as f:
+            self.connection.sendfile(f, start, end - start) # Zero copy where the OS has it, plain sends elsewhere
+
+class LanCacheServer:
+    """Serves a ContentStore to peers and announces it. The store may be shared with a DownloadQueue."""
+    def __init__(self, store, port=LAN_CACHE_PORT, bind="0.0.0.0", announce=True):
+        self.store = store
+        self.port = port
+        self.bind = bind
+        self.announce = announce
+        self.instance = uuid.uuid4().hex # Lets a LanPeers in the same process skip our own beacons
+        self.httpd = None
+        self.running = False
+        self.index_mtime = None
+
+    def start(self):
+        self.httpd = http.server.ThreadingHTTPServer((self.bind, self.port), CacheHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.cache = self
+        self.port = self.httpd.server_address[1] # Port 0 picks a free one
+        self.running = True
+        threading.Thread(target=self.httpd.serve_forever, name="lan-cache", daemon=True).start()
+        if self.announce:
+            threading.Thread(target=self.beacon_loop, name="lan-cache-beacon", daemon=True).start()
+        print(f"LAN cache serving {self.store.root} on port {self.port}")
+
+    def stop(self):
+        self.running = False
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def refresh(self):
+        # Another process (GUI or daemon) may have added downloads to the index
+        try:
+            mtime = os.path.getmtime(self.store.index_path)
+        except OSError:
+            return
+        if mtime != self.index_mtime:
+            self.index_mtime = mtime
+            with self.store.lock:
+                self.store.load()
+
+    def find(self, key):
+        if not key: return None
+        self.refresh()
+        found = self.store.lookup(key)
+        if not found: return None
+        path, entry = found
+        digest = entry.get('digests', {}).get('sha256')
+        return (digest, entry) if digest else None
+
+    def object(self, digest):
+        # -> (path, size, [validators of every key stored under it]) or None
+        with self.store.lock:
+            entry = self.store.objects.get(digest)
+            keys = [k for k, d in self.store.keys.items() if d == digest]
+        if not entry or not os.path.exists(entry['path']) or os.path.getsize(entry['path']) != entry['size']:
+            return None
+        validators = []
+        for key in keys:
+            _, etag, last_modified, _ = (key.split("\n") + ["", "", "", ""])[:4]
+            validators += [v for v in (etag, last_modified) if v]
+        return entry['path'], entry['size'], validators
+
+    def beacon_loop(self):
+        # Announce every BEACON_INTERVAL, and right away when a starting instance asks
+        message = json.dumps({'app': BEACON_APP, 'id': self.instance, 'port': self.port}).encode('utf-8')
+        try:
+            sock = discovery_socket()
+        except OSError as e:
+            print(f"LAN cache can't announce itself, peers need it in lan_peers: {e}")
+            return
+        try:
+            next_beacon = 0
+            while self.running:
+                if time.time() >= next_beacon:
+                    try:
+                        sock.sendto(message, (DISCOVERY_GROUP, DISCOVERY_PORT))
+                    except OSError as e:
+                        print(f"Error announcing LAN cache: {e}")
+                        return # No multicast route
+                    next_beacon = time.time() + BEACON_INTERVAL
+                try:
+                    received = read_message(sock)
+                except OSError:
+                    if not self.running: break
+                    continue
+                if received and received[0].get('query'):
+                    next_beacon = 0
+        finally:
+            sock.close()
+
+class LanPeers:
+    """Peers to ask before the CDN: the static list plus whoever announces on the LAN."""
+    def __init__(self, static=(), discover=True, own=None):
+        self.static = list(static)
+        self.own = own # Our LanCacheServer, never ask ourselves
+        self.seen = {} # "host:port" -> last beacon time
+        self.failed_at = {} # "host:port" -> when a transfer from it failed
+        self.lock = threading.Lock()
+        self.running = False
+        self.sock = None
+        self.started = 0
+        if discover:
+            self.listen()
+
+    def listen(self):
+        try:
+            self.sock = discovery_socket()
+            self.sock.sendto(json.dumps({'app': BEACON_APP, 'query': True}).encode('utf-8'), (DISCOVERY_GROUP, DISCOVERY_PORT))
+        except OSError as e:
+            print(f"LAN cache discovery unavailable, using lan_peers only: {e}")
+            if self.sock: self.sock.close()
+            self.sock = None
+            return
+        self.started = time.time()
+        self.running = True
+        threading.Thread(target=self.listen_loop, name="lan-cache-discovery", daemon=True).start()
+
+    def listen_loop(self):
+        while self.running:
+            try:
+                received = read_message(self.sock)
+            except OSError:
+                if not self.running: break
+                continue
+            if not received: continue
+            beacon, host = received
+            if self.own and beacon.get('id') == self.own.instance: continue
+            try:
+                port = int(beacon['port'])
+            except (KeyError, TypeError, ValueError):
+                continue # A query, or not ours
+            with self.lock:
+                self.seen[f"{host}:{port}"] = time.time()
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def peers(self):
+        now = time.time()
+        with self.lock:
+            found = [p for p, t in self.seen.items() if now - t < PEER_TIMEOUT]
+            skip = {p for p, t in self.failed_at.items() if now - t < PEER_BACKOFF}
+        return [p for p in dict.fromkeys(self.static + found) if p not in skip]
+
+    def failed(self, url):
+        # A transfer from this peer broke or didn't check out, leave it alone for a while
+        with self.lock:
+            self.failed_at[urlparse(url).netloc] = time.time()
+
+    def ask(self, peer, key):
+        response = requests.get(f"http://{peer}/lookup?key={quote(key, safe='')}", timeout=LOOKUP_TIMEOUT)
+        if response.status_code != 200: return None
+        info = response.json()
+        # Whatever the peer answers ends up in a URL: only a store object path on that same peer
+        if not isinstance(info, dict) or not isinstance(info.get('object'), str) or not OBJECT_PATH.fullmatch(info['object']):
+            return None
+        if not isinstance(info.get('size'), int) or not isinstance(info.get('digests') or {}, dict):
+            return None
+        return f"http://{peer}{info['object']}", info
+
+    def find(self, key):
+        """-> (object URL, {'size', 'digests'}) from the first peer that has key, or None."""
+        if not key: return None
+        wait = self.started + DISCOVERY_WAIT - time.time()
+        if self.running and wait > 0:
+            time.sleep(wait) # Just started: answers to our query are on their way
+        peers = self.peers()
+        if not peers: return None
+        with ThreadPoolExecutor(max_workers=min(8, len(peers))) as pool:
+            futures = [pool.submit(self.ask, peer, key) for peer in peers]
+            for future in futures:
+                try:
+                    found = future.result()
+                except Exception:
+                    continue # Peer is off or not a cache, the next one may have it
+                if found: return found
+        return None
+
+def main(argv=None):
+    from .DownloadCore import get_config_dir, store_key, format_size
+    parser = argparse.ArgumentParser(description="Share the Hackintoshify download store on the LAN")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="serve the download store in the foreground")
+    serve.add_argument("--store", default=os.path.join(get_config_dir(), "store"))
+    serve.add_argument("--port", type=int, default=LAN_CACHE_PORT)
+    serve.add_argument("--bind", default="0.0.0.0")
+    serve.add_argument("--no-announce", action="store_true")
+    sub.add_parser("peers", help="list caches announcing on the LAN")
+    lookup = sub.add_parser("lookup", help="ask peers for a file")
+    lookup.add_argument("url")
+    lookup.add_argument("--etag")
+    lookup.add_argument("--last-modified")
+    lookup.add_argument("--size", type=int, default=0)
+    lookup.add_argument("--peer", action="append", default=[])
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        server = LanCacheServer(ContentStore(args.store), args.port, args.bind, not args.no_announce)
+        server.start()
+        try:
+            while True: time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+        return 0
+
+    if args.command == "peers":
+        peers = LanPeers()
+        time.sleep(DISCOVERY_WAIT)
+        found = peers.peers()
+        print("\n".join(found) if found else "No LAN caches heard.")
+        return 0
+
+    peers = LanPeers(parse_peers(",".join(args.peer)), discover=not args.peer)
+    found = peers.find(store_key(args.url, args.etag, args.last_modified, args.size))
+    if not found:
+        print("No peer has it.")
+        return 1
+    url, info = found
+    print(f"{url}  {format_size(info['size'])}  sha256 {info['digests'].get('sha256')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# GUI_Screens/Functionality/Preallocate.py
+
+import os
+import sys
+import errno
+import struct
+
+# ---------------------------------------------------------
+# Reserve a download's full size on disk before the first byte arrives.
+# A real allocation fails right away with ENOSPC instead of 10 GB in, and
+# the file system can hand out one contiguous run instead of growing the
+# file block by block, which keeps the later USB write sequential.
+# Falls back to a sparse file (just the length) where that isn't possible.
+# ---------------------------------------------------------
+F_PREALLOCATE = 42 # macOS fcntl
+F_ALLOCATECONTIG = 0x2
+F_ALLOCATEALL = 0x4
+F_PEOFPOSMODE = 3 # Allocate from the physical end of the file
+
+_libc = None
+
+def _linux_fallocate(fd, offset, length):
+    # fallocate(2) directly: glibc's posix_fallocate emulates unsupported file systems
+    # by writing every block, which is slower than just downloading into the file
+    global _libc
+    import ctypes
+    if _libc is None:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    if _libc.fallocate(fd, 0, offset, length) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+def _mac_preallocate(fd, length):
+    import fcntl
+    for flags in (F_ALLOCATECONTIG | F_ALLOCATEALL, F_ALLOCATEALL): # Contiguous if the disk has a run that long
+        try:
+            fcntl.fcntl(fd, F_PREALLOCATE, struct.pack("Iiqqq", flags, F_PEOFPOSMODE, 0, length, 0))
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC and flags == F_ALLOCATEALL: raise
+    raise OSError(errno.EOPNOTSUPP, "F_PREALLOCATE failed")
+
+def allocated_size(path):
+    # Bytes the file really occupies; a sparse or preallocated file's length says little
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    if hasattr(st, 'st_blocks'):
+        return min(st.st_blocks * 512, st.st_size)
+    return st.st_size
+
+def preallocate(f, size):
+    """Grows open file f to size bytes with its blocks reserved. Returns True if they were,
+    False if only the length was set (sparse). Raises OSError(ENOSPC) when the disk is too small."""
+    fd = f.fileno()
+    current = os.fstat(fd).st_size
+    try:
+        if sys.platform.startswith("linux"):
+            _linux_fallocate(fd, 0, size) # Also fills holes left by an earlier sparse fallback
+            return True
+        if sys.platform == "darwin":
+            if size > current:
+                _mac_preallocate(fd, size - current)
+                os.ftruncate(fd, size)
+            return True
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(fd, 0, size)
+            return True
+    except (OSError, AttributeError) as e:
+        if getattr(e, 'errno', None) == errno.ENOSPC:
+            raise
+    if size > current:
+        f.truncate(size) # Windows, or a file system without preallocation (FAT, some network shares)
+    return False
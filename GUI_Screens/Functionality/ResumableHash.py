@@ -0,0 +1,210 @@
+# GUI_Screens/Functionality/ResumableHash.py
+
+import sys
+import struct
+import base64
+import ctypes
+import ctypes.util
+import hashlib
+
+# ---------------------------------------------------------
+# Streaming hashes whose state can be saved in the resume journal.
+# hashlib objects can't be pickled, but OpenSSL's plain SHA256_CTX/SHA_CTX/MD5_CTX
+# structs are a handful of integers, so with libcrypto we copy them in and out.
+# Without libcrypto the hashes still stream, a resume just rehashes the prefix.
+# "merkle" is a SHA-256 per LEAF_SIZE block folded into one root: unlike a
+# plain SHA-256 it can be checked again later one block per core.
+# ---------------------------------------------------------
+MERKLE = 'merkle'
+LEAF_SIZE = 16 * 1024 * 1024
+
+# name -> (libcrypto prefix, sizeof(ctx), digest size)
+CTX_LAYOUT = {
+    'sha256': ('SHA256', 112, 32),
+    'sha1': ('SHA1', 96, 20),
+    'md5': ('MD5', 92, 16),
+}
+
+def _load_libcrypto():
+    candidates = []
+    try:
+        import _hashlib
+        candidates.append(_hashlib.__file__) # Python's own OpenSSL, already loaded (and allowed on macOS)
+    except ImportError:
+        pass
+    if sys.platform == "win32":
+        candidates += ["libcrypto-3-x64", "libcrypto-3", "libcrypto-1_1-x64", "libcrypto-1_1"]
+    elif sys.platform != "darwin": # macOS aborts on unversioned system libcrypto
+        candidates.append(ctypes.util.find_library("crypto"))
+
+    for name in candidates:
+        if not name: continue
+        try:
+            lib = ctypes.CDLL(name)
+            lib.SHA256_Init
+            return lib
+        except (OSError, AttributeError):
+            continue
+    return None
+
+class _CtxHash:
+    # One libcrypto hash context held in a raw buffer
+    def __init__(self, lib, name, raw=None):
+        self.name = name
+        self.lib = lib
+        self.prefix, size, self.digest_size = CTX_LAYOUT[name]
+        self.ctx = ctypes.create_string_buffer(size)
+        if raw is None:
+            getattr(lib, self.prefix + "_Init")(self.ctx)
+        else:
+            ctypes.memmove(self.ctx, raw, size)
+
+    def update(self, data):
+        n = len(data)
+        if not n: return
+        if isinstance(data, memoryview) and not data.readonly:
+            ptr = (ctypes.c_char * n).from_buffer(data) # No copy for the receive buffer
+        else:
+            ptr = bytes(data)
+        getattr(self.lib, self.prefix + "_Update")(self.ctx, ptr, ctypes.c_size_t(n))
+
+    def raw(self):
+        return self.ctx.raw
+
+    def copy(self):
+        return _CtxHash(self.lib, self.name, self.ctx.raw)
+
+    def hexdigest(self):
+        ctx = ctypes.create_string_buffer(self.ctx.raw, len(self.ctx)) # Final() wipes the context, keep ours
+        out = ctypes.create_string_buffer(self.digest_size)
+        getattr(self.lib, self.prefix + "_Final")(out, ctx)
+        return out.raw.hex()
+
+def merkle_root(leaves):
+    # Pairwise SHA-256 up to a single node; an odd node out is carried up as is
+    if not leaves:
+        return hashlib.sha256().hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        paired = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+class _MerkleHash:
+    # Leaf digests so far plus the leaf being filled; raw() is those three packed, so it journals like a ctx
+    def __init__(self, lib, raw=None):
+        self.lib = lib
+        self.leaves = []
+        self.filled = 0 # Bytes in the current leaf
+        leaf_raw = None
+        if raw is not None:
+            count, self.filled = struct.unpack_from("<QQ", raw)
+            self.leaves = [raw[16 + 32 * i:48 + 32 * i] for i in range(count)]
+            leaf_raw = raw[16 + 32 * count:]
+        self.leaf = self.new_leaf(leaf_raw)
+
+    def new_leaf(self, raw=None):
+        return _CtxHash(self.lib, 'sha256', raw) if self.lib is not None else hashlib.sha256()
+
+    def update(self, data):
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            take = min(LEAF_SIZE - self.filled, len(view) - pos)
+            self.leaf.update(view[pos:pos + take])
+            self.filled += take
+            pos += take
+            if self.filled == LEAF_SIZE:
+                self.leaves.append(bytes.fromhex(self.leaf.hexdigest()))
+                self.leaf = self.new_leaf()
+                self.filled = 0
+
+    def raw(self):
+        return struct.pack("<QQ", len(self.leaves), self.filled) + b"".join(self.leaves) + self.leaf.raw()
+
+    def copy(self):
+        other = _MerkleHash.__new__(_MerkleHash)
+        other.lib = self.lib
+        other.leaves = list(self.leaves)
+        other.filled = self.filled
+        other.leaf = self.leaf.copy()
+        return other
+
+    def hexdigest(self):
+        leaves = self.leaves + [bytes.fromhex(self.leaf.hexdigest())] if self.filled else self.leaves
+        return merkle_root(leaves)
+
+def _self_test(lib):
+    # Guard against a libcrypto whose struct layout we got wrong
+    try:
+        for name in CTX_LAYOUT:
+            h = _CtxHash(lib, name)
+            h.update(b"hack")
+            h = _CtxHash(lib, name, h.raw()) # Round trip through the saved state
+            h.update(b"intoshify")
+            if h.hexdigest() != hashlib.new(name, b"hackintoshify").hexdigest():
+                return False
+        return True
+    except Exception:
+        return False
+
+LIBCRYPTO = _load_libcrypto()
+if LIBCRYPTO is not None and not _self_test(LIBCRYPTO):
+    LIBCRYPTO = None
+
+def new_hash(name, raw=None):
+    if name == MERKLE:
+        return _MerkleHash(LIBCRYPTO, raw)
+    if LIBCRYPTO is not None:
+        return _CtxHash(LIBCRYPTO, name, raw)
+    return hashlib.new(name)
+
+class StreamHasher:
+    """Hashes a file as it is written, in order. state()/restore() carry the progress across resumes."""
+    def __init__(self, algorithms=('sha256',)):
+        self.algorithms = tuple(a for a in algorithms if a in CTX_LAYOUT or a == MERKLE)
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.hashes = {a: new_hash(a) for a in self.algorithms}
+
+    def update(self, data):
+        for h in self.hashes.values():
+            h.update(data)
+        self.offset += len(data)
+
+    def state(self):
+        # None when the contexts can't be saved, the prefix is rehashed on resume instead
+        if LIBCRYPTO is None and self.algorithms:
+            return None
+        return {
+            'offset': self.offset,
+            'ctx': {a: base64.b64encode(h.raw()).decode('ascii') for a, h in self.hashes.items()},
+        }
+
+    def restore(self, state):
+        if not state or (LIBCRYPTO is None and self.algorithms): return False
+        try:
+            ctx = state['ctx']
+            if set(ctx) != set(self.algorithms): return False
+            self.hashes = {a: new_hash(a, base64.b64decode(ctx[a])) for a in self.algorithms}
+            self.offset = int(state['offset'])
+            return True
+        except Exception as e:
+            print(f"Error restoring hash state: {e}")
+            self.reset()
+            return False
+
+    def copy(self):
+        # Snapshot to roll back to, e.g. the last verified chunk boundary
+        other = StreamHasher(())
+        other.algorithms = self.algorithms
+        other.offset = self.offset
+        other.hashes = {a: h.copy() for a, h in self.hashes.items()}
+        return other
+
+    def hexdigests(self):
+        return {a: h.hexdigest() for a, h in self.hashes.items()}
@@ -1,6 +1,42 @@
 import os
 import random
 
+# Board IDs of the SMBIOS models we commonly build for
+BOARD_IDS = {
+    "iMac12,2": "Mac-942B59F58194171B",
+    "iMac13,2": "Mac-FC02E91DDD3FA6A4",
+    "iMac14,4": "Mac-81E3E92DD6088272",
+    "iMac15,1": "Mac-42FD25EABCABB274",
+    "iMac16,2": "Mac-FFE5EF870D7BA81A",
+    "iMac17,1": "Mac-B809C3757DA9BB8D",
+    "iMac18,3": "Mac-BE088AF8C5EB4FA2",
+    "iMac19,1": "Mac-AA95B1DDAB278B95",
+    "iMac20,1": "Mac-CFF7D910A743CAAF",
+    "iMac20,2": "Mac-AF89B6D9451A490B",
+    "iMacPro1,1": "Mac-7BA5B2D9E42DDD94",
+    "MacPro7,1": "Mac-27AD2F918AE68F61",
+    "Macmini8,1": "Mac-7BA5B2DFE22DDD8C",
+    "MacBookPro14,1": "Mac-B4831CEBD52A0C4C",
+    "MacBookPro15,2": "Mac-827FAC58A8FDFA22",
+    "MacBookPro16,1": "Mac-E1008331FDC96864",
+}
+
+# HardwareSniffer cpu_family -> usual desktop SMBIOS
+CPU_FAMILY_MODELS = {
+    "Intel Desktop (Sandy Bridge)": "iMac12,2",
+    "Intel Desktop (Ivy Bridge)": "iMac13,2",
+    "Intel Desktop (Haswell)": "iMac15,1",
+    "Intel Desktop (Broadwell)": "iMac16,2",
+    "Intel Desktop (Skylake)": "iMac17,1",
+    "Intel Desktop (Kaby Lake)": "iMac18,3",
+    "Intel Desktop (Coffee Lake)": "iMac19,1",
+    "Intel Desktop (Comet Lake)": "iMac20,1",
+    "Intel Desktop (Rocket Lake)": "MacPro7,1",
+    "Intel Desktop (Alder Lake)": "MacPro7,1",
+    "Intel Desktop (Raptor Lake)": "MacPro7,1",
+    "AMD Ryzen (Zen/Zen2/Zen3)": "MacPro7,1",
+}
+
 class SMBIOS:
     def __init__(self):
         pass
@@ -8,3 +44,9 @@ class SMBIOS:
     def generate_random_mac(self):
         # Generates a random MAC address
         return "".join([random.choice("0123456789ABCDEF") for x in range(12)])
+
+    def get_board_id(self, model):
+        return BOARD_IDS.get(model)
+
+    def suggest_model(self, cpu_family):
+        return CPU_FAMILY_MODELS.get(cpu_family)
@@ -0,0 +1,598 @@
+# GUI_Screens/Functionality/XarArchive.py
+
+import os
+import io
+import sys
+import bz2
+import lzma
+import zlib
+import queue
+import struct
+import hashlib
+import fnmatch
+import argparse
+import itertools
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+# ---------------------------------------------------------
+# Pulls single files out of Apple installer packages without pkgutil/xar,
+# so it works on Linux and Windows too.
+#   .pkg      = xar: 28 byte header, zlib'd XML table of contents, then the heap
+#   Payload   = pbzx: xz chunks (or raw ones, big DMGs are stored uncompressed)
+#   inside it = cpio (odc "070707" or newc "070701") with the app bundle
+# Everything reads front to back with no seeking, in BLOCK sized pieces, so it
+# runs on a plain file as well as on the bytes of a download still in progress
+# (see ExtractStage). InstallAssistant.pkg carries SharedSupport.dmg in its
+# Payload; older InstallESDDmg.pkg has InstallESD.dmg straight in the heap.
+# The TOC carries a checksum of itself and of every heap file's stored bytes:
+# extract() checks the ones it reads, verify_archive() checks all of them (or
+# the ones inside the complete ranges of a download) in parallel, and
+# ArchiveCheck does the same on bytes streaming past, so a download is checked
+# without reading it back.
+# Usage: python -m GUI_Screens.Functionality.XarArchive <pkg> <dest dir> [pattern...]
+#        python -m GUI_Screens.Functionality.XarArchive --verify <pkg>
+# ---------------------------------------------------------
+XAR_MAGIC = b"xar!"
+XAR_HEADER = struct.Struct(">4sHHQQI") # magic, header size, version, toc compressed, toc uncompressed, checksum alg
+PBZX_MAGIC = b"pbzx"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+CPIO_ODC = b"070707"
+CPIO_NEWC = (b"070701", b"070702")
+CPIO_TRAILER = "TRAILER!!!"
+BLOCK = 1024 * 1024 # Read/write unit, also about the most any stage holds at once
+PIPE_DEPTH = 8 # Blocks buffered between a download and its ExtractStage
+DEFAULT_PATTERNS = ("SharedSupport.dmg", "BaseSystem.dmg", "BaseSystem.chunklist", "InstallESD.dmg")
+CHECKSUM_STYLES = ('sha1', 'md5', 'sha256', 'sha512')
+TOC_ENTRY = "(table of contents)" # verify_archive()'s name for the TOC's own checksum
+VERIFY_WORKERS = 4
+
+class XarError(ValueError):
+    pass
+
+class StreamReader:
+    """Sequential reads on top of anything with read(n); counts the position, never seeks."""
+    def __init__(self, source):
+        self.source = source
+        self.pos = 0
+
+    def read(self, n):
+        data = self.source.read(n)
+        self.pos += len(data)
+        return data
+
+    def read_exact(self, n):
+        parts = []
+        while n > 0:
+            data = self.read(min(n, BLOCK))
+            if not data:
+                raise XarError(f"Archive ends early at byte {self.pos}")
+            parts.append(data)
+            n -= len(data)
+        return b"".join(parts)
+
+    def skip(self, n):
+        while n > 0:
+            data = self.read(min(n, BLOCK))
+            if not data:
+                raise XarError(f"Archive ends early at byte {self.pos}")
+            n -= len(data)
+
+    def pieces(self, n):
+        # The next n bytes, BLOCK at a time
+        while n > 0:
+            data = self.read(min(n, BLOCK))
+            if not data:
+                raise XarError(f"Archive ends early at byte {self.pos}")
+            n -= len(data)
+            yield data
+
+class ChunkStream:
+    """File-like read(n) over an iterator of byte strings (a decoder's output)."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def read(self, n):
+        while len(self.buffer) < n:
+            data = next(self.chunks, None)
+            if data is None: break
+            self.buffer += data
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+def read_checksum(node):
+    # (style, hex digest) of a <archived-checksum>/<extracted-checksum>, None if missing or unknown
+    if node is None or not (node.text or "").strip(): return None
+    style = node.get('style', '').lower()
+    if style not in CHECKSUM_STYLES: return None
+    return style, node.text.strip().lower()
+
+def parse_toc(xml_data):
+    """Returns ([{'name', 'path', 'type', 'offset', 'length', 'size', 'encoding', 'archived_checksum',
+    'extracted_checksum'}], toc checksum (style, offset, size) or None). Offsets are relative to the heap."""
+    root = ET.fromstring(xml_data)
+    toc = root.find('toc')
+    if toc is None:
+        raise XarError("xar table of contents has no <toc>")
+    toc_checksum = None
+    node = toc.find('checksum')
+    if node is not None and node.get('style', '').lower() in CHECKSUM_STYLES:
+        toc_checksum = (node.get('style').lower(), int(node.findtext('offset') or 0), int(node.findtext('size') or 0))
+    entries = []
+    def walk(node, parent):
+        for f in node.findall('file'):
+            name = f.findtext('name') or ""
+            path = f"{parent}/{name}" if parent else name
+            entry = {'name': name, 'path': path, 'type': f.findtext('type') or "file",
+                     'offset': 0, 'length': 0, 'size': 0, 'encoding': "application/octet-stream",
+                     'archived_checksum': None, 'extracted_checksum': None}
+            data = f.find('data')
+            if data is not None:
+                entry['offset'] = int(data.findtext('offset') or 0)
+                entry['length'] = int(data.findtext('length') or 0)
+                entry['size'] = int(data.findtext('size') or 0)
+                encoding = data.find('encoding')
+                if encoding is not None:
+                    entry['encoding'] = encoding.get('style', entry['encoding'])
+                entry['archived_checksum'] = read_checksum(data.find('archived-checksum'))
+                entry['extracted_checksum'] = read_checksum(data.find('extracted-checksum'))
+            entries.append(entry)
+            walk(f, path)
+    walk(toc, "")
+    return entries, toc_checksum
+
+class XarReader:
+    """Reads a xar archive front to back. files() yields heap entries in heap order."""
+    def __init__(self, source):
+        self.stream = StreamReader(source)
+        magic, header_size, version, toc_length, toc_size, self.checksum_alg = XAR_HEADER.unpack(self.stream.read_exact(XAR_HEADER.size))
+        if magic != XAR_MAGIC:
+            raise XarError("Not a xar archive (.pkg)")
+        self.stream.skip(header_size - XAR_HEADER.size) # Newer headers carry a checksum name
+        self.toc_raw = self.stream.read_exact(toc_length) # The TOC checksum covers these compressed bytes
+        try:
+            self.toc_xml = zlib.decompress(self.toc_raw)
+        except zlib.error as e:
+            raise XarError(f"xar table of contents is damaged: {e}")
+        if len(self.toc_xml) != toc_size:
+            raise XarError("xar table of contents has the wrong size")
+        self.heap_start = self.stream.pos
+        self.entries, self.toc_checksum = parse_toc(self.toc_xml)
+
+    def files(self):
+        # Sorted by offset so the heap is only ever read forward; unwanted bytes are skipped by the caller not reading them
+        for entry in sorted((e for e in self.entries if e['length']), key=lambda e: e['offset']):
+            position = self.heap_start + entry['offset']
+            if position < self.stream.pos:
+                continue # Overlaps what we already read (hardlinked data), can't go back
+            self.stream.skip(position - self.stream.pos)
+            yield entry
+
+    def raw(self, entry):
+        # The entry's stored (still encoded) bytes, checked against the TOC once all are read;
+        # must be consumed before the next files() step
+        return checked(self.stream.pieces(entry['length']), entry)
+
+    def decoded(self, entry):
+        return decode(self.raw(entry), entry['encoding'])
+
+def checked(pieces, entry):
+    if not entry['archived_checksum']:
+        yield from pieces
+        return
+    style, expected = entry['archived_checksum']
+    h = hashlib.new(style)
+    for data in pieces:
+        h.update(data)
+        yield data
+    if h.hexdigest() != expected:
+        raise XarError(f"{entry['path']} fails its xar checksum")
+
+def toc_end(head):
+    # Where the heap starts: header plus compressed TOC, from at least the first XAR_HEADER.size bytes
+    magic, header_size, _, toc_length, _, _ = XAR_HEADER.unpack_from(head)
+    if magic != XAR_MAGIC:
+        raise XarError("Not a xar archive (.pkg)")
+    return header_size + toc_length
+
+def covered(ranges, start, end):
+    return any(a <= start and end <= b for a, b in ranges)
+
+def hash_range(path, offset, length, style):
+    h = hashlib.new(style)
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(offset)
+        while length > 0:
+            data = f.read(min(length, BLOCK))
+            if not data:
+                raise XarError(f"{os.path.basename(path)} ends early at byte {offset}")
+            h.update(data)
+            offset += len(data)
+            length -= len(data)
+    return h.hexdigest()
+
+def check_jobs(archive):
+    # [(info, style, expected)] of every checksum in a parsed archive, the TOC's own first;
+    # style is None for a file without one. The heap holds the digest of the compressed TOC.
+    jobs = []
+    if archive.toc_checksum:
+        style, offset, size = archive.toc_checksum
+        jobs.append(({'path': TOC_ENTRY, 'offset': archive.heap_start + offset, 'length': size}, style,
+                     hashlib.new(style, archive.toc_raw).hexdigest()))
+    for entry in archive.entries:
+        if not entry['length']: continue
+        info = {'path': entry['path'], 'offset': archive.heap_start + entry['offset'], 'length': entry['length']}
+        if entry['archived_checksum']:
+            jobs.append((info, *entry['archived_checksum']))
+        else:
+            jobs.append((info, None, None))
+    return jobs
+
+def verify_archive(path, ranges=None, workers=VERIFY_WORKERS):
+    """Checks a pkg's TOC checksum and every heap file's archived checksum, files in parallel.
+    ranges: [(start, end)] byte ranges known to be complete (a partial download), anything
+    outside them is reported Pending. Returns [{'path', 'offset', 'length', 'status'}] with
+    status OK, Bad, Pending or Unchecked (no checksum in the TOC); the TOC itself comes first."""
+    with open(path, 'rb') as f:
+        _, header_size, _, toc_length, _, _ = XAR_HEADER.unpack(StreamReader(f).read_exact(XAR_HEADER.size))
+        if ranges is not None and not covered(ranges, 0, header_size + toc_length):
+            raise XarError("The table of contents hasn't been downloaded yet")
+        f.seek(0)
+        archive = XarReader(f)
+
+    jobs = check_jobs(archive)
+
+    def check(job):
+        info, style, expected = job
+        if style is None:
+            return dict(info, status='Unchecked')
+        if ranges is not None and not covered(ranges, info['offset'], info['offset'] + info['length']):
+            return dict(info, status='Pending')
+        if info['path'] == TOC_ENTRY:
+            # The heap holds the digest of the compressed TOC
+            with open(path, 'rb') as f:
+                f.seek(info['offset'])
+                stored = f.read(info['length']).hex()
+            return dict(info, status='OK' if stored == expected else 'Bad')
+        return dict(info, status='OK' if hash_range(path, info['offset'], info['length'], style) == expected else 'Bad')
+
+    # Biggest files first so one 12 GB entry doesn't start last
+    order = sorted(range(len(jobs)), key=lambda i: -jobs[i][0]['length'])
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, result in zip(order, pool.map(check, [jobs[i] for i in order])):
+            results[i] = result
+    return results
+
+class ArchiveCheck:
+    """verify_archive() on a pkg's bytes as they go past in order (a download's feed), so nothing is
+    read back afterwards. update() every byte from the first; results() once the last is in."""
+    def __init__(self):
+        self.head = bytearray() # Header and TOC, until they can be parsed
+        self.offset = 0
+        self.jobs = None # [info, style, expected, hasher or bytearray for the TOC's digest] by offset
+        self.pending = [] # Jobs whose bytes haven't all gone past yet
+        self.error = None
+
+    def update(self, data):
+        if self.error: return
+        try:
+            if self.jobs is None:
+                self.head += data
+                self.offset += len(data)
+                self.parse()
+                return
+            self.hash_in(data, self.offset)
+            self.offset += len(data)
+        except XarError as e:
+            self.error = e
+
+    def parse(self):
+        if len(self.head) < XAR_HEADER.size: return
+        _, header_size, _, toc_length, _, _ = XAR_HEADER.unpack_from(self.head)
+        if len(self.head) < header_size + toc_length: return
+        archive = XarReader(io.BytesIO(bytes(self.head)))
+        self.jobs = []
+        for info, style, expected in check_jobs(archive):
+            if style is None:
+                self.jobs.append([info, None, None, None])
+            elif info['path'] == TOC_ENTRY:
+                self.jobs.append([info, style, expected, bytearray()])
+            else:
+                self.jobs.append([info, style, expected, hashlib.new(style)])
+        self.pending = sorted((j for j in self.jobs if j[1]), key=lambda j: j[0]['offset'])
+        head, self.head = self.head, None
+        self.hash_in(memoryview(head), 0)
+
+    def hash_in(self, data, start):
+        end = start + len(data)
+        still = []
+        for job in self.pending:
+            info, _, _, sink = job
+            lo, hi = info['offset'], info['offset'] + info['length']
+            if lo >= end:
+                still.append(job)
+                continue
+            if hi > start:
+                piece = data[max(lo, start) - start:min(hi, end) - start]
+                if isinstance(sink, bytearray): sink += piece
+                else: sink.update(piece)
+            if hi > end:
+                still.append(job)
+        self.pending = still
+
+    def results(self):
+        """Same as verify_archive(): [{'path', 'offset', 'length', 'status'}], status OK, Bad, Pending or Unchecked."""
+        if self.error: raise self.error
+        if self.jobs is None:
+            raise XarError("The table of contents hasn't come in yet")
+        waiting = {id(j) for j in self.pending}
+        results = []
+        for job in self.jobs:
+            info, style, expected, sink = job
+            if style is None:
+                results.append(dict(info, status='Unchecked'))
+            elif id(job) in waiting:
+                results.append(dict(info, status='Pending'))
+            else:
+                actual = sink.hex() if isinstance(sink, bytearray) else sink.hexdigest()
+                results.append(dict(info, status='OK' if actual == expected else 'Bad'))
+        return results
+
+def decode(pieces, encoding):
+    if encoding.endswith("x-gzip"):
+        decompressor = zlib.decompressobj() # xar's "gzip" is a zlib stream
+    elif encoding.endswith("x-bzip2"):
+        decompressor = bz2.BZ2Decompressor()
+    elif encoding.endswith(("x-lzma", "x-xz")):
+        decompressor = lzma.LZMADecompressor()
+    elif encoding.endswith("octet-stream"):
+        yield from pieces
+        return
+    else:
+        raise XarError(f"Unsupported xar encoding {encoding}")
+    for data in pieces:
+        out = decompressor.decompress(data)
+        if out: yield out
+
+def pbzx_chunks(stream):
+    """Decodes a pbzx stream (read(n) source), yielding at most about BLOCK bytes at a time."""
+    stream = StreamReader(stream)
+    header = stream.read_exact(12)
+    if header[:4] != PBZX_MAGIC:
+        raise XarError("Payload is not pbzx")
+    while True:
+        head = stream.read(16)
+        if not head: return
+        if len(head) < 16:
+            raise XarError("pbzx chunk header is truncated")
+        flags, length = struct.unpack(">QQ", head)
+        first = stream.read_exact(min(length, len(XZ_MAGIC)))
+        rest = stream.pieces(length - len(first))
+        if first == XZ_MAGIC:
+            decompressor = lzma.LZMADecompressor(lzma.FORMAT_XZ)
+            for data in itertools.chain([first], rest):
+                out = decompressor.decompress(data, BLOCK)
+                while True:
+                    if out: yield out
+                    if decompressor.needs_input or decompressor.eof: break
+                    out = decompressor.decompress(b"", BLOCK) # Output is capped, drain what's left of this input
+        else:
+            yield first # Stored chunk
+            yield from rest
+        if not flags & 0x01000000: return # No more chunks
+
+def cpio_members(source):
+    """Yields (path, size, mode, pieces) per cpio member; pieces must be consumed (or ignored) before the next."""
+    stream = StreamReader(source)
+    while True:
+        magic = stream.read_exact(6)
+        if magic == CPIO_ODC:
+            header = stream.read_exact(70)
+            mode = int(header[12:18], 8)
+            namesize = int(header[53:59], 8)
+            size = int(header[59:70], 8)
+            name = stream.read_exact(namesize)
+            pad_name = pad_data = 0
+        elif magic in CPIO_NEWC:
+            header = stream.read_exact(104)
+            fields = [int(header[i:i + 8], 16) for i in range(0, 104, 8)]
+            mode, size, namesize = fields[1], fields[6], fields[11]
+            name = stream.read_exact(namesize)
+            pad_name = -(110 + namesize) % 4
+            pad_data = -size % 4
+        else:
+            raise XarError(f"Bad cpio header at byte {stream.pos - 6}")
+        stream.skip(pad_name)
+        path = name.rstrip(b"\0").decode('utf-8', 'replace')
+        if path == CPIO_TRAILER: return
+        if path.startswith("./"): path = path[2:]
+        body = stream.pieces(size)
+        yield path, size, mode, body
+        for _ in body: pass # Skip whatever the caller didn't read
+        stream.skip(pad_data)
+
+def matches(path, patterns):
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(path, p) for p in patterns)
+
+def out_path(dest_dir, name):
+    # Names come from the archive, untrusted: only ever a plain file name inside dest_dir
+    base = os.path.basename(name.replace("\\", "/"))
+    if base in ("", ".", ".."):
+        raise XarError(f"Refusing to extract {name!r}")
+    return os.path.join(dest_dir, base)
+
+def write_out(pieces, dest, stop=None):
+    tmp = dest + ".part"
+    try:
+        with open(tmp, 'wb') as f:
+            for data in pieces:
+                if stop and stop(): raise InterruptedError("Extraction cancelled")
+                f.write(data)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def extract(source, dest_dir, patterns=DEFAULT_PATTERNS, stop=None):
+    """Extracts files whose name (or path) matches patterns from a pkg, from heap entries as well as
+    from inside Payload. source is a path or anything with read(n). Returns the paths written."""
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, 'rb') as f:
+            return extract(f, dest_dir, patterns, stop)
+
+    os.makedirs(dest_dir, exist_ok=True)
+    written = []
+    archive = XarReader(source)
+    for entry in archive.files():
+        if stop and stop(): raise InterruptedError("Extraction cancelled")
+        if entry['type'] != 'file': continue
+        if matches(entry['path'], patterns):
+            dest = out_path(dest_dir, entry['name'])
+            print(f"Extracting {entry['path']} -> {dest}")
+            write_out(archive.decoded(entry), dest, stop)
+            written.append(dest)
+        elif entry['name'] == "Payload":
+            raw = archive.raw(entry)
+            payload = ChunkStream(decode(raw, entry['encoding']))
+            from_payload = []
+            try:
+                for path, size, mode, body in cpio_members(ChunkStream(pbzx_chunks(payload))):
+                    if stop and stop(): raise InterruptedError("Extraction cancelled")
+                    if (mode & 0o170000) != 0o100000 or not matches(path, patterns): continue
+                    dest = out_path(dest_dir, path)
+                    print(f"Extracting {path} -> {dest}")
+                    write_out(body, dest, stop)
+                    from_payload.append(dest)
+                for _ in raw: pass # Read to the end so the Payload's checksum gets checked
+            except BaseException:
+                for dest in from_payload: # Can't trust what came out of a Payload that failed
+                    if os.path.exists(dest): os.remove(dest)
+                raise
+            written += from_payload
+    return written
+
+class StreamPipe:
+    """Bounded byte pipe: a download thread write()s, the extractor thread read()s. close() = EOF."""
+    def __init__(self, depth=PIPE_DEPTH):
+        self.queue = queue.Queue(depth)
+        self.buffer = b""
+        self.eof = False
+        self.aborted = False
+
+    def write(self, data):
+        for i in range(0, len(data), BLOCK):
+            while not self.aborted:
+                try:
+                    self.queue.put(bytes(data[i:i + BLOCK]), timeout=0.5) # Copy: the caller reuses its buffer
+                    break
+                except queue.Full:
+                    pass
+
+    def close(self):
+        while not self.aborted:
+            try:
+                self.queue.put(None, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def abort(self):
+        self.aborted = True
+
+    def read(self, n):
+        while len(self.buffer) < n and not self.eof:
+            if self.aborted: raise InterruptedError("Download restarted")
+            try:
+                data = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if data is None:
+                self.eof = True
+            else:
+                self.buffer += data
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+class ExtractStage:
+    """Runs extract() on a thread, fed with a download's bytes in order through update().
+    finish() after the last byte returns the extracted paths or raises what the extractor raised."""
+    def __init__(self, dest_dir, patterns=DEFAULT_PATTERNS):
+        self.pipe = StreamPipe()
+        self.result = None
+        self.error = None
+        self.done = False # Extractor got all it wanted, the rest of the stream is ignored
+        self.thread = threading.Thread(target=self.run, args=(dest_dir, patterns), name="pkg-extract", daemon=True)
+        self.thread.start()
+
+    def run(self, dest_dir, patterns):
+        try:
+            self.result = extract(self.pipe, dest_dir, patterns, lambda: self.pipe.aborted)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.pipe.abort() # Nothing reads anymore, don't let the download block on a full pipe
+
+    def update(self, data):
+        if not self.done:
+            self.pipe.write(data)
+
+    def finish(self):
+        self.pipe.close()
+        self.thread.join()
+        if self.error: raise self.error
+        return self.result
+
+    def abort(self):
+        self.pipe.abort()
+        self.thread.join()
+
+def print_verify(pkg):
+    path, ranges = pkg, None
+    if not os.path.exists(pkg) and os.path.exists(pkg + ".part"):
+        from .DownloadCore import DownloadJob # Its journal knows which ranges are on disk
+        path, ranges = pkg + ".part", DownloadJob("", pkg).completed_ranges()
+    results = verify_archive(path, ranges)
+    for r in results:
+        print(f"[{r['status']:<9}] {r['path']}  ({r['length']} bytes at {r['offset']})")
+    counts = {s: sum(r['status'] == s for r in results) for s in ('OK', 'Bad', 'Pending', 'Unchecked')}
+    print(", ".join(f"{n} {s}" for s, n in counts.items() if n))
+    return 1 if counts['Bad'] else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract files from a macOS installer package (no pkgutil needed)")
+    parser.add_argument("pkg")
+    parser.add_argument("dest", nargs="?", help="folder for the extracted files")
+    parser.add_argument("patterns", nargs="*", help=f"file names or globs (default: {', '.join(DEFAULT_PATTERNS)})")
+    parser.add_argument("-l", "--list", action="store_true", help="list the archive's heap files and exit")
+    parser.add_argument("--verify", action="store_true", help="check the TOC checksums; a download still in progress "
+                                                              "(<pkg>.part) is checked as far as it got")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.verify:
+            return print_verify(args.pkg)
+        if args.list:
+            with open(args.pkg, 'rb') as f:
+                for entry in XarReader(f).entries:
+                    print(f"{entry['size']:>14}  {entry['encoding'].split('/')[-1]:<14}  {entry['path']}")
+            return 0
+        if args.dest is None:
+            parser.error("dest is required unless --list or --verify")
+        written = extract(args.pkg, args.dest, tuple(args.patterns) or DEFAULT_PATTERNS)
+    except (OSError, XarError, lzma.LZMAError, zlib.error) as e:
+        print(f"Error: {e}")
+        return 1
+    if not written:
+        print("Nothing matched.")
+        return 1
+    for path in written:
+        print(path)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
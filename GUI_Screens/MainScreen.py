@@ -148,16 +148,17 @@ class MainScreen(QWidget):
         # Persistent subsystems
         self.download_window = None
         self.efi_window = None
+        self.target_suggested = False
         
         # State
         self.selected_image = None
         self.selected_efi = None
 
     def closeEvent(self, event):
-        # Ensure we save download state if exists
+        # Ensure we save download state and resume journals if exists
         try:
             if self.download_window and hasattr(self.download_window, 'manager'):
-                self.download_window.manager.save_state()
+                self.download_window.manager.shutdown()
         except:
             pass
         super().closeEvent(event)
@@ -312,6 +313,10 @@ class MainScreen(QWidget):
                 
                 # Connect Signal
                 self.download_window.image_selected.connect(self.on_image_selected)
+
+            # Once hardware has been scanned, preselect the matching Mac (only once, the user may change it)
+            if not self.target_suggested:
+                self.suggest_download_target()
             
             # Show non-modally so user can use other parts of app if desired
             self.download_window.show()
@@ -320,6 +325,19 @@ class MainScreen(QWidget):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to open downloader: {e}")
             
+    def suggest_download_target(self):
+        try:
+            hw_info = getattr(self.efi_window, 'hw_info', None)
+            if not hw_info:
+                return
+            from .Functionality.Scripts.smbios import SMBIOS
+            model = SMBIOS().suggest_model(hw_info.get('cpu_family'))
+            if model:
+                self.download_window.set_target_model(model)
+            self.target_suggested = True
+        except Exception as e:
+            print(f"Error suggesting target Mac: {e}")
+
     def start_usb_creation(self):
         if not self.selected_image:
              QMessageBox.warning(self, "Missing Input", "Please select a macOS Image first (Download or Select Local).")
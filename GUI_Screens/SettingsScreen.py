@@ -9,6 +9,16 @@ import os
 import sys
 import json
 
+# Bandwidth limit choices -> KB/s stored in config.ini [Downloads] rate_limit (0 = unlimited)
+RATE_LIMITS = {
+    "Unlimited": 0,
+    "1 MB/s": 1024,
+    "5 MB/s": 5 * 1024,
+    "10 MB/s": 10 * 1024,
+    "25 MB/s": 25 * 1024,
+    "50 MB/s": 50 * 1024,
+}
+
 def get_config_path():
     if sys.platform == "win32":
         return os.path.join(os.getenv("ProgramData"), "Hackintoshify", "config.ini")
@@ -274,7 +284,33 @@ class SettingsScreen(QDialog):
 
         self.content_layout.addWidget(self.paths_frame)
 
-        # --- 3. System ---
+        # --- 3. Downloads ---
+        self._add_section_title("Downloads")
+        
+        self.dl_frame = ModernFrame()
+        self.dl_frame.setObjectName("card")
+        dl_layout = QVBoxLayout(self.dl_frame)
+        dl_layout.setContentsMargins(25, 25, 25, 25)
+        dl_layout.setSpacing(20)
+        
+        dl_settings = self.config['Downloads'] if 'Downloads' in self.config else {}
+        self.max_active_combo = self._add_combo_row(dl_layout, "Simultaneous Downloads",
+                                                    "Extra downloads wait in the queue instead of splitting the bandwidth",
+                                                    ["1", "2", "3", "4", "6", "8"], dl_settings.get('max_active', '2'))
+        
+        line3 = QFrame()
+        line3.setObjectName("divider")
+        line3.setFixedHeight(1)
+        dl_layout.addWidget(line3)
+        
+        current_limit = next((k for k, v in RATE_LIMITS.items() if str(v) == dl_settings.get('rate_limit', '0')), "Unlimited")
+        self.rate_limit_combo = self._add_combo_row(dl_layout, "Bandwidth Limit",
+                                                    "Cap for all downloads together, so the rest of the network stays usable",
+                                                    list(RATE_LIMITS), current_limit)
+        
+        self.content_layout.addWidget(self.dl_frame)
+
+        # --- 4. System ---
         self._add_section_title("System")
         
         self.sys_frame = ModernFrame()
@@ -363,6 +399,33 @@ class SettingsScreen(QDialog):
         layout.addLayout(vbox)
         return inp
 
+    def _add_combo_row(self, layout, title, subtitle, items, current):
+        row = QHBoxLayout()
+        text_box = QVBoxLayout()
+        text_box.setSpacing(2)
+        
+        t_lbl = QLabel(title)
+        t_lbl.setFont(QFont("Segoe UI", 11, QFont.Bold))
+        
+        s_lbl = QLabel(subtitle)
+        s_lbl.setObjectName("sub_label")
+        s_lbl.setWordWrap(True)
+        
+        text_box.addWidget(t_lbl)
+        text_box.addWidget(s_lbl)
+        
+        combo = QComboBox()
+        combo.addItems(items)
+        combo.setFixedWidth(140)
+        combo.setCursor(Qt.PointingHandCursor)
+        if current in items:
+            combo.setCurrentText(current)
+        
+        row.addLayout(text_box, stretch=1)
+        row.addWidget(combo)
+        layout.addLayout(row)
+        return combo
+
     def _add_toggle_row(self, layout, title, subtitle):
         row = QHBoxLayout()
         text_box = QVBoxLayout()
@@ -403,6 +466,10 @@ class SettingsScreen(QDialog):
         self.config.set('Settings', 'verbose_logging', str(verbose))
         self.config.set('Settings', 'check_updates', str(updates))
         
+        if not self.config.has_section('Downloads'): self.config.add_section('Downloads')
+        self.config.set('Downloads', 'max_active', self.max_active_combo.currentText())
+        self.config.set('Downloads', 'rate_limit', str(RATE_LIMITS[self.rate_limit_combo.currentText()]))
+        
         try:
             os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
             with open(self.config_path, 'w') as configfile:
@@ -410,6 +477,11 @@ class SettingsScreen(QDialog):
             parent = self.parent()
             if parent and hasattr(parent, 'apply_theme'):
                 parent.apply_theme(theme)
+            # Live-apply to a running download manager
+            dl_window = getattr(parent, 'download_window', None)
+            if dl_window and hasattr(dl_window, 'manager'):
+                dl_window.manager.load_settings()
+                dl_window.manager.schedule()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Could not save config.ini:\n{e}")
             return
@@ -0,0 +1,72 @@
+# tests/test_chunklist.py
+
+import hashlib
+import struct
+
+import pytest
+
+from GUI_Screens.Functionality.Chunklist import (
+    CHUNKLIST_HEADER, CHUNK_ENTRY, ChunkVerifier, chunklist_total, parse_chunklist
+)
+
+def make_chunklist(data, sizes, method=1, magic=b"CNKL"):
+    entries = b""
+    offset = 0
+    for size in sizes:
+        entries += CHUNK_ENTRY.pack(size, hashlib.sha256(data[offset:offset + size]).digest())
+        offset += size
+    header = CHUNKLIST_HEADER.pack(magic, CHUNKLIST_HEADER.size, 1, method, 1, len(sizes),
+                                   CHUNKLIST_HEADER.size, CHUNKLIST_HEADER.size + len(entries))
+    return header + entries
+
+def feed(verifier, data):
+    # The way DownloadJob feeds it: never across a chunk boundary
+    results = []
+    pos = 0
+    while pos < len(data) and not verifier.done:
+        n = min(verifier.room(), 7000, len(data) - pos)
+        result = verifier.update(data[pos:pos + n])
+        if result: results.append(result)
+        pos += n
+    return results
+
+DATA = bytes(range(256)) * 400 # 102400 bytes
+SIZES = [40000, 40000, 22400]
+
+def test_parse_chunklist():
+    chunks = parse_chunklist(make_chunklist(DATA, SIZES))
+    assert [(offset, size) for offset, size, _ in chunks] == [(0, 40000), (40000, 40000), (80000, 22400)]
+    assert chunks[1][2] == hashlib.sha256(DATA[40000:80000]).digest()
+    assert chunklist_total(chunks) == len(DATA)
+    assert chunklist_total([]) == 0
+
+@pytest.mark.parametrize("blob", [
+    b"CNKL",
+    make_chunklist(DATA, SIZES, magic=b"XXXX"),
+    make_chunklist(DATA, SIZES, method=2),
+    make_chunklist(DATA, SIZES)[:-10],
+])
+def test_parse_rejects_malformed(blob):
+    with pytest.raises(ValueError):
+        parse_chunklist(blob)
+
+def test_verifier_accepts_matching_data():
+    verifier = ChunkVerifier(parse_chunklist(make_chunklist(DATA, SIZES)))
+    results = feed(verifier, DATA)
+    assert [ok for _, ok in results] == [True, True, True]
+    assert verifier.done and verifier.offset == len(DATA)
+
+def test_verifier_flags_only_the_bad_chunk():
+    verifier = ChunkVerifier(parse_chunklist(make_chunklist(DATA, SIZES)))
+    damaged = bytearray(DATA)
+    damaged[50000] ^= 1
+    results = feed(verifier, bytes(damaged))
+    assert [(chunk[0], ok) for chunk, ok in results] == [(0, True), (40000, False), (80000, True)]
+
+def test_verifier_resumes_at_chunk_boundaries_only():
+    verifier = ChunkVerifier(parse_chunklist(make_chunklist(DATA, SIZES)))
+    assert verifier.seek(40000)
+    assert verifier.offset == 40000
+    assert [ok for _, ok in feed(verifier, DATA[40000:])] == [True, True]
+    assert not verifier.seek(12345) # Mid-chunk: starts over
+    assert verifier.offset == 0
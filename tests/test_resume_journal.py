@@ -0,0 +1,94 @@
+# tests/test_resume_journal.py
+
+import hashlib
+import json
+import os
+
+from GUI_Screens.Functionality import ResumableHash
+from GUI_Screens.Functionality.DownloadCore import DownloadJob, journal_progress, merge_extents
+
+DATA = os.urandom(300000)
+
+def make_job(tmp_path, hashes=('sha256',)):
+    return DownloadJob("http://example.invalid/image.dmg", str(tmp_path / "image.dmg"), len(DATA), hashes=hashes)
+
+def write_part(job, data):
+    with open(job.part_path, 'wb') as f:
+        f.write(data)
+
+def test_merge_extents():
+    assert merge_extents([[50, 60], [0, 10], [10, 20], [15, 30], [40, 40]]) == [[0, 30], [50, 60]]
+    assert merge_extents([]) == []
+
+def test_single_stream_round_trip(tmp_path):
+    job = make_job(tmp_path)
+    write_part(job, DATA[:120000])
+    job.hasher.update(DATA[:120000])
+    job.downloaded_size = 120000
+    job.etag = '"v1"'
+    job.checkpoint(force=True)
+    assert journal_progress(job.part_path) == 120000
+
+    resumed = make_job(tmp_path)
+    resumed.load_journal(resumed.journal_path)
+    assert resumed.downloaded_size == 120000
+    assert resumed.etag == '"v1"'
+    if ResumableHash.LIBCRYPTO is not None: # Without it the prefix is hashed again instead
+        assert resumed.hasher.offset == 120000
+        resumed.hasher.update(DATA[120000:])
+        assert resumed.hasher.hexdigests()['sha256'] == hashlib.sha256(DATA).hexdigest()
+
+def test_torn_tail_is_not_trusted(tmp_path):
+    job = make_job(tmp_path)
+    write_part(job, DATA[:120000])
+    job.downloaded_size = 120000
+    job.checkpoint(force=True)
+    write_part(job, DATA[:70000]) # Crash: the file lost data the journal counted
+
+    resumed = make_job(tmp_path)
+    resumed.load_journal(resumed.journal_path)
+    assert resumed.downloaded_size == 70000
+
+def test_segmented_round_trip(tmp_path):
+    job = make_job(tmp_path)
+    write_part(job, bytes(len(DATA))) # Preallocated, full length
+    job.segments_total = len(DATA)
+    job.segments = [{'pos': 100000, 'end': 150000, 'busy': True}, {'pos': 150000, 'end': 200000, 'busy': False},
+                    {'pos': 250000, 'end': 300000, 'busy': False}]
+    job.downloaded_size = 150000
+    job.checkpoint(force=True)
+    with open(job.journal_path) as f:
+        assert json.load(f)['remaining'] == [[100000, 200000], [250000, 300000]]
+    assert journal_progress(job.part_path) == 150000
+
+    resumed = make_job(tmp_path)
+    resumed.load_journal(resumed.journal_path)
+    assert [(s['pos'], s['end']) for s in resumed.segments] == [(100000, 200000), (250000, 300000)]
+    assert resumed.downloaded_size == 150000
+
+def test_merkle_state_survives_a_resume(tmp_path):
+    job = make_job(tmp_path, hashes=('sha256', 'merkle'))
+    write_part(job, DATA[:120000])
+    job.hasher.update(DATA[:120000])
+    job.downloaded_size = 120000
+    job.checkpoint(force=True)
+
+    resumed = make_job(tmp_path, hashes=('sha256', 'merkle'))
+    resumed.load_journal(resumed.journal_path)
+    if resumed.hasher.offset == 0: # No libcrypto, the prefix is rehashed
+        resumed.hasher.update(DATA[:120000])
+    resumed.hasher.update(DATA[120000:])
+    fresh = ResumableHash.StreamHasher(('merkle',))
+    fresh.update(DATA)
+    assert resumed.hasher.hexdigests()['merkle'] == fresh.hexdigests()['merkle']
+
+def test_unreadable_journal(tmp_path):
+    job = make_job(tmp_path)
+    write_part(job, DATA[:1000])
+    with open(job.journal_path, 'w') as f:
+        f.write("{not json")
+    assert journal_progress(job.part_path) is None
+
+    job.load_journal(job.journal_path)
+    assert job.downloaded_size == 0
+    assert job.journal_lost
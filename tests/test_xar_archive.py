@@ -0,0 +1,117 @@
+# tests/test_xar_archive.py
+
+import hashlib
+import os
+import zlib
+
+import pytest
+
+from GUI_Screens.Functionality.XarArchive import (
+    TOC_ENTRY, XAR_HEADER, XAR_MAGIC, ArchiveCheck, XarError, XarReader, extract, out_path, toc_end, verify_archive
+)
+
+FILES = [("InstallESD.dmg", os.urandom(70000)), ("Resources/BaseSystem.dmg", os.urandom(30000)),
+         ("Resources/notes.txt", b"no checksum for this one")]
+
+def file_xml(name, offset, data, checksum=True):
+    sums = ""
+    if checksum:
+        digest = hashlib.sha1(data).hexdigest()
+        sums = f'<archived-checksum style="sha1">{digest}</archived-checksum><extracted-checksum style="sha1">{digest}</extracted-checksum>'
+    return (f'<file><name>{name}</name><type>file</type><data><offset>{offset}</offset><length>{len(data)}</length>'
+            f'<size>{len(data)}</size><encoding style="application/octet-stream"/>{sums}</data></file>')
+
+def make_pkg(path):
+    # Heap: the TOC's SHA-1, then every file as is. Returns {path: heap offset of its data}
+    offset = 20
+    top, nested, offsets = "", "", {}
+    for name, data in FILES:
+        xml = file_xml(os.path.basename(name), offset, data, checksum=not name.endswith(".txt"))
+        if "/" in name: nested += xml
+        else: top += xml
+        offsets[name] = offset
+        offset += len(data)
+    toc = (f'<?xml version="1.0" encoding="UTF-8"?><xar><toc><checksum style="sha1"><offset>0</offset><size>20</size></checksum>'
+           f'{top}<file><name>Resources</name><type>directory</type>{nested}</file></toc></xar>').encode()
+    toc_z = zlib.compress(toc)
+    header = XAR_HEADER.pack(XAR_MAGIC, XAR_HEADER.size, 1, len(toc_z), len(toc), 1)
+    with open(path, 'wb') as f:
+        f.write(header + toc_z + hashlib.sha1(toc_z).digest() + b"".join(data for _, data in FILES))
+    return offsets, len(header) + len(toc_z)
+
+def statuses(results):
+    return {r['path']: r['status'] for r in results}
+
+def streamed(path, piece=4099):
+    check = ArchiveCheck()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(piece)
+            if not data: break
+            check.update(data)
+    return check.results()
+
+def test_reader_parses_toc(tmp_path):
+    pkg = str(tmp_path / "a.pkg")
+    offsets, heap_start = make_pkg(pkg)
+    with open(pkg, 'rb') as f:
+        archive = XarReader(f)
+    with open(pkg, 'rb') as f:
+        head = f.read(XAR_HEADER.size)
+    assert archive.heap_start == heap_start == toc_end(head)
+    paths = {e['path']: e for e in archive.entries}
+    assert paths["Resources/BaseSystem.dmg"]['offset'] == offsets["Resources/BaseSystem.dmg"]
+    assert paths["Resources"]['type'] == "directory"
+    assert paths["Resources/notes.txt"]['archived_checksum'] is None
+
+def test_not_a_xar(tmp_path):
+    bad = tmp_path / "b.pkg"
+    bad.write_bytes(b"PK\x03\x04" + bytes(100))
+    with pytest.raises(XarError):
+        with open(bad, 'rb') as f:
+            XarReader(f)
+    with pytest.raises(XarError):
+        toc_end(bad.read_bytes())
+
+def test_verify_good_and_damaged(tmp_path):
+    pkg = str(tmp_path / "a.pkg")
+    offsets, heap_start = make_pkg(pkg)
+    expected = {TOC_ENTRY: 'OK', "InstallESD.dmg": 'OK', "Resources/BaseSystem.dmg": 'OK', "Resources/notes.txt": 'Unchecked'}
+    assert verify_archive(pkg)[0]['path'] == TOC_ENTRY
+    assert statuses(verify_archive(pkg)) == expected
+    assert statuses(streamed(pkg)) == expected
+
+    with open(pkg, 'r+b') as f:
+        f.seek(heap_start + offsets["Resources/BaseSystem.dmg"] + 100)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 1]))
+    expected["Resources/BaseSystem.dmg"] = 'Bad'
+    assert statuses(verify_archive(pkg)) == expected
+    assert statuses(streamed(pkg, 1000)) == expected
+
+def test_verify_partial_download(tmp_path):
+    pkg = str(tmp_path / "a.pkg")
+    offsets, heap_start = make_pkg(pkg)
+    done = heap_start + offsets["Resources/BaseSystem.dmg"] # The TOC and InstallESD.dmg are in
+    result = statuses(verify_archive(pkg, ranges=[(0, done)]))
+    assert result["InstallESD.dmg"] == 'OK'
+    assert result["Resources/BaseSystem.dmg"] == 'Pending'
+    with pytest.raises(XarError):
+        verify_archive(pkg, ranges=[(0, 10)])
+
+def test_extract(tmp_path):
+    pkg = str(tmp_path / "a.pkg")
+    make_pkg(pkg)
+    written = extract(pkg, str(tmp_path / "out"), patterns=("BaseSystem.dmg",))
+    assert written == [str(tmp_path / "out" / "BaseSystem.dmg")]
+    with open(written[0], 'rb') as f:
+        assert f.read() == FILES[1][1]
+
+def test_out_path_stays_inside(tmp_path):
+    dest = str(tmp_path)
+    assert out_path(dest, "../../etc/passwd") == os.path.join(dest, "passwd")
+    assert out_path(dest, "..\\evil.dmg") == os.path.join(dest, "evil.dmg")
+    for name in ("", ".", "..", "dir/.."):
+        with pytest.raises(XarError):
+            out_path(dest, name)